@@ -0,0 +1,64 @@
+import json
+import os
+import re
+import tempfile
+import time
+from typing import List
+
+import pandas as pd
+import typer
+from loguru import logger
+
+from server_log_analysis.etl import access_log
+from server_log_analysis.etl.sources import sample_path
+
+app = typer.Typer()
+
+
+def readlines_parse(path: str, pattern: str) -> pd.DataFrame:
+    """LogTransform.read_log_file before: readlines, two re.match per line, a dict per row."""
+    with open(path, "r") as file:
+        log_lines = file.readlines()
+        parsed_logs = [
+            re.match(pattern, line).groupdict() for line in log_lines if re.match(pattern, line)
+        ]
+    return pd.DataFrame(parsed_logs)
+
+
+def write_sample_log(path: str, megabytes: int):
+    """The Kong sample messages, including the non-access lines, repeated up to ``megabytes``."""
+    hits = json.loads(sample_path("kong").read_text())["hits"]["hits"]
+    block = "".join(hit["_source"]["message"] + "\n" for hit in hits)
+    with open(path, "w") as f:
+        for _ in range(megabytes * 2**20 // len(block) + 1):
+            f.write(block)
+
+
+@app.command()
+def main(megabytes: int = 256, workers: List[int] = [1, 2, 4, 8], legacy: bool = True):
+    """MB/s of the access-log parser against the readlines/re.match loop it replaces."""
+    path = os.path.join(tempfile.mkdtemp(), "kong-logs.txt")
+    write_sample_log(path, megabytes)
+    size = os.path.getsize(path) / 2**20
+    logger.info(f"{size:.0f} MB access log, {os.cpu_count()} cores")
+
+    expected = None
+    if legacy:
+        started = time.perf_counter()
+        expected = readlines_parse(path, access_log.KONG_PATTERN)
+        elapsed = time.perf_counter() - started
+        for name in access_log.NUMERIC_GROUPS:
+            expected[name] = pd.to_numeric(expected[name], errors="coerce")
+        logger.info(f"  readlines + re.match  {size / elapsed:>7.1f} MB/s ({len(expected):,} rows)")
+
+    for count in workers:
+        started = time.perf_counter()
+        df = access_log.parse_file(path, access_log.KONG_PATTERN, access_log.NUMERIC_GROUPS, workers=count)
+        elapsed = time.perf_counter() - started
+        same = "" if expected is None else f", identical: {df.equals(expected)}"
+        logger.info(f"  parse_file, {count} worker{'s' if count > 1 else ' '} {size / elapsed:>7.1f} MB/s{same}")
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+import sys
+import time
+from typing import List
+
+import typer
+from loguru import logger
+
+from server_log_analysis.config import RAW_DATA_DIR
+from server_log_analysis.etl.fake_search import FakeSearchServer
+
+ETL_DIR = RAW_DATA_DIR / "ETL"
+sys.path.insert(0, str(ETL_DIR))
+from ETL_konglog import ExtractKongLogs  # noqa: E402
+
+app = typer.Typer()
+
+
+@app.command()
+def main(
+    sample_path: Path = ETL_DIR / "logs" / "kong-access-.json",
+    hits: int = 20,
+    seconds: int = 10,
+    step: int = 100,
+    latency: float = 0.02,
+    concurrency: List[int] = [1, 4, 16, 64],
+):
+    """Compare sequential and concurrent window fetching against a local fake endpoint."""
+    sample = json.loads(sample_path.read_text())
+    sample["hits"]["hits"] = sample["hits"]["hits"][:hits]
+    sample["hits"]["total"] = {"value": hits, "relation": "eq"}
+    body = json.dumps(sample).encode()
+
+    start_time = "2024-12-22T00:00:00.000Z"
+    end_time = f"2024-12-22T00:00:{seconds:02d}.000Z"
+    baseline = None
+    with FakeSearchServer(body, latency=latency) as server:
+        logger.info(f"Fake search endpoint at {server.url}, {latency * 1000:.0f} ms per request")
+        for n in concurrency:
+            extractor = ExtractKongLogs(
+                url=server.url, start_time=start_time, end_time=end_time, step=step, limit=hits
+            )
+            started = time.perf_counter()
+            logs = extractor.get_log_async(concurrency=n)
+            elapsed = time.perf_counter() - started
+            windows = len(logs) // hits
+            baseline = baseline or elapsed
+            logger.info(
+                f"concurrency={n:<3} windows={windows} {elapsed:.2f}s "
+                f"{windows / elapsed:.1f} req/s speed-up x{baseline / elapsed:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    app()
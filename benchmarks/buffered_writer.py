@@ -0,0 +1,55 @@
+import csv
+import os
+import tempfile
+import time
+from typing import List
+
+import typer
+from loguru import logger
+
+from benchmarks.transform_scaling import synthetic_hits
+from server_log_analysis.etl.decode import dumps_line
+from server_log_analysis.etl.sources import load_script
+from server_log_analysis.etl.writer import flatten_row, write_stream
+
+app = typer.Typer()
+
+
+def in_place(batches, txt_path: str, csv_path: str, fieldnames: List[str]):
+    """write_stream before: default buffers, a write per line, straight into the final paths."""
+    with open(txt_path, "w", encoding="utf-8") as txt, open(csv_path, "w", encoding="utf-8", newline="") as csvfile:
+        csv_writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        csv_writer.writeheader()
+        for batch in batches:
+            txt.writelines(map(dumps_line, batch))
+            csv_writer.writerows(map(flatten_row, batch))
+
+
+@app.command()
+def main(source: str = "traces-apm", records: int = 500_000, batch_size: int = 1_000, repeat: int = 3):
+    """Load wall time of the in-place writer against the buffered, atomic one."""
+    transform = load_script(source).Transform
+    logs = transform(logs=synthetic_hits(source, records)).exact_log()
+    batches = [logs[i:i + batch_size] for i in range(0, len(logs), batch_size)]
+    with tempfile.TemporaryDirectory() as save_dir:
+        timings, outputs = {}, {}
+        for label, write in (("in place", in_place), ("buffered + atomic", write_stream)):
+            paths = [os.path.join(save_dir, f"{write.__name__}.{ext}") for ext in ("txt", "csv")]
+            best = float("inf")
+            for _ in range(repeat):
+                started = time.perf_counter()
+                write(batches, *paths, transform.COLUMNS)
+                best = min(best, time.perf_counter() - started)
+            timings[label] = best
+            outputs[label] = [open(path, "rb").read() for path in paths]
+        old, new = timings.values()
+        logger.info(
+            f"{source}: {records:,} records in batches of {batch_size:,}, "
+            f"{records / old:,.0f} -> {records / new:,.0f} records/s (x{old / new:.2f}), "
+            f"identical output: {outputs['in place'] == outputs['buffered + atomic']}, "
+            f"left-over temp files: {[name for name in os.listdir(save_dir) if name.endswith('.tmp')]}"
+        )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,67 @@
+import os
+import random
+import tempfile
+import time
+
+import typer
+from loguru import logger
+
+from benchmarks.kong_rollups import traffic
+from server_log_analysis.etl.access_log import KONG_PATTERN, NUMERIC_GROUPS, parse_file
+from server_log_analysis.etl.column_cache import cache_dir, open_cache, read_parsed, read_parsed_csv, write_cache
+from server_log_analysis.etl.timestamps import clf_to_datetime
+
+app = typer.Typer()
+
+
+def parsed_frame(path: str):
+    """The parsed log as LogTransform.transform leaves it."""
+    frame = parse_file(path, KONG_PATTERN, numeric=NUMERIC_GROUPS)
+    frame["datetime"] = clf_to_datetime(frame["datetime"])
+    frame["method"] = frame["method"].replace({"GET": 0, "POST": 1})
+    for part in ("day", "hour", "month"):
+        frame[part] = getattr(frame["datetime"].dt, part)
+    return frame
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+@app.command()
+def main(records: int = 2_000_000, clients: int = 2000):
+    """Reloading a parsed access log: read_csv + to_datetime against the memory-mapped columnar cache."""
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, "server_log.txt")
+        with open(log_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(traffic(records, clients, random.Random(0))) + "\n")
+        frame = parsed_frame(log_path)
+        path = os.path.join(directory, "parsed_logs.csv")
+        frame.to_csv(path)
+        _, writing = timed(write_cache, frame, path)
+        size = sum(os.path.getsize(os.path.join(cache_dir(path), name)) for name in os.listdir(cache_dir(path)))
+        logger.info(
+            f"{records:,} rows: CSV {os.path.getsize(path) / 2**20:.0f} MB, "
+            f"cache {size / 2**20:.0f} MB written in {writing:.1f} s"
+        )
+
+        expected, loading = timed(read_parsed_csv, path)
+        logger.info(f"  read_csv + to_datetime: {loading:.2f} s")
+        cached, opening = timed(open_cache, path)
+        same = all(cached[column].astype(str).tolist() == expected[column].astype(str).tolist() for column in ("remote_address", "path", "user_agent", "status", "method", "datetime"))
+        logger.info(f"  open the cache: {opening * 1000:.0f} ms (x{loading / opening:.0f}), same values: {same}")
+        columns = ["datetime", "status", "method", "path", "user_agent", "remote_address"]
+        _, opening = timed(open_cache, path, columns)
+        logger.info(f"  open {', '.join(columns)}: {opening * 1000:.0f} ms (x{loading / opening:.0f})")
+        _, counting = timed(lambda: cached.groupby("status", observed=True).size())
+        logger.info(f"  status counts on the mapped frame: {counting * 1000:.0f} ms")
+
+        os.utime(path, ns=(time.time_ns(), time.time_ns()))
+        _, rebuilding = timed(read_parsed, path)
+        logger.info(f"  source touched: cache rebuilt and opened in {rebuilding:.1f} s")
+
+
+if __name__ == "__main__":
+    app()
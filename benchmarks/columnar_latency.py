@@ -0,0 +1,44 @@
+import json
+import time
+
+import typer
+from loguru import logger
+
+from server_log_analysis.etl.sources import load_script, sample_path
+
+app = typer.Typer()
+
+SOURCE = "metrics-apm-usage-error"
+
+
+def timed(transform, pages, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            transform(page)
+    return (time.perf_counter() - started) / repeat
+
+
+@app.command()
+def main(records: int = 100_000, page_size: int = 5000, repeat: int = 3):
+    """Per-record strptime latency against the NumPy page columns of the usage-error Transform."""
+    hits = json.loads(sample_path(SOURCE).read_text())["hits"]["hits"]
+    hits = (hits * (records // len(hits) + 1))[:records]
+    pages = [hits[i : i + page_size] for i in range(0, records, page_size)]
+    transform = load_script(SOURCE).Transform()
+
+    per_record = lambda page: [transform.extract_system_resource_logs(log) for log in page]
+    same = all(per_record(page) == transform.extract_batch(page) for page in pages)
+
+    record_time = timed(per_record, pages, repeat)
+    batch_time = timed(transform.extract_batch, pages, repeat)
+    logger.info(
+        f"{records:,} records in pages of {page_size}: per record {record_time:.3f} s "
+        f"({records / record_time:,.0f} records/s), columns {batch_time:.3f} s "
+        f"({records / batch_time:,.0f} records/s, x{record_time / batch_time:.1f}), "
+        f"identical rows: {same}"
+    )
+
+
+if __name__ == "__main__":
+    app()
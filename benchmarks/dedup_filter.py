@@ -0,0 +1,51 @@
+import os
+import tempfile
+import time
+
+import typer
+from loguru import logger
+
+from server_log_analysis.etl.dedup import Deduplicator
+
+app = typer.Typer()
+
+
+@app.command()
+def main(hits: int = 1_000_000, batch: int = 5_000, overlap: float = 0.1, capacity: int = 1_000_000, error_rate: float = 0.001):
+    """_id dedup throughput, the filter file size, and its false-positive rate once a generation is full."""
+    with tempfile.TemporaryDirectory() as directory:
+        first = [{"_id": f"first-{i}"} for i in range(hits)]
+        dedup = Deduplicator("bench", directory, capacity, error_rate)
+        started = time.perf_counter()
+        dedup.start("2025-01-02T00:00:00.000Z", "2025-01-02T01:00:00.000Z")
+        for offset in range(0, hits, batch):
+            dedup.filter_hits(first[offset:offset + batch])
+        dedup.commit("2025-01-02T00:00:00.000Z", "2025-01-02T01:00:00.000Z")
+        elapsed = time.perf_counter() - started
+        size = os.path.getsize(dedup.id_filter.path)
+        journal = os.path.getsize(dedup.id_filter.journal) if os.path.exists(dedup.id_filter.journal) else 0
+        logger.info(
+            f"first run: {hits / elapsed:,.0f} hits/s with commit, "
+            f"filter file {size / 2**20:.1f} MB, journal {journal / 2**20:.1f} MB"
+        )
+
+        # A later run over an overlapping range: `overlap` of its hits were loaded before
+        repeated = int(hits * overlap)
+        second = first[:repeated] + [{"_id": f"second-{i}"} for i in range(hits - repeated)]
+        dedup = Deduplicator("bench", directory)
+        started = time.perf_counter()
+        dedup.start("2025-01-02T00:30:00.000Z", "2025-01-02T01:30:00.000Z")
+        kept = sum(len(dedup.filter_hits(second[offset:offset + batch])) for offset in range(0, hits, batch))
+        elapsed = time.perf_counter() - started
+        dedup.commit("2025-01-02T00:30:00.000Z", "2025-01-02T01:30:00.000Z")
+        false_positives = hits - repeated - kept
+        logger.info(
+            f"second run: {hits / elapsed:,.0f} hits/s, dropped {hits - kept:,} "
+            f"({repeated:,} loaded before), false positives {false_positives / (hits - repeated):.4%} "
+            f"at error_rate {error_rate:.2%}"
+        )
+        logger.info(dedup.report())
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,66 @@
+from contextlib import redirect_stdout
+import io
+import time
+from typing import List
+
+import typer
+from loguru import logger
+
+from server_log_analysis.etl.fake_search import SampleSearchServer
+from server_log_analysis.etl.sources import DEFAULTS, SAMPLES, extract_class, load_script
+
+app = typer.Typer()
+
+
+@app.command()
+def main(
+    source: List[str] = typer.Option(list(SAMPLES), help="Sources to benchmark, repeatable"),
+    seconds: int = 10,
+    step: int = 1000,
+    limit: int = 500,
+    period: int = typer.Option(2000, help="Replay each 500-hit dump every `period` ms"),
+    concurrency: int = 8,
+    paginate: bool = False,
+    adaptive: bool = False,
+    filter_source: bool = typer.Option(True, help="Request only each Transform's FIELDS"),
+    latency: float = 0.005,
+    jitter: float = 0.005,
+    error_rate: float = 0.0,
+    seed: int = 0,
+):
+    """Run each Extract* class against the local sample stand-in and report its throughput."""
+    start_time = "2025-01-02T00:00:00.000Z"
+    end_time = f"2025-01-02T00:{seconds // 60:02d}:{seconds % 60:02d}.000Z"
+    for name in source:
+        module = load_script(name)
+        server = SampleSearchServer.from_samples(
+            [name], period=period, latency=latency, jitter=jitter, error_rate=error_rate, seed=seed
+        )
+        with server:
+            extractor = extract_class(module)(
+                url=server.url(DEFAULTS[name]["index"]),
+                start_time=start_time,
+                end_time=end_time,
+                step=step,
+                limit=limit,
+                source_fields=module.Transform.FIELDS if filter_source else None,
+            )
+            started = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                documents = sum(
+                    len(logs)
+                    for logs in extractor.iter_log(
+                        concurrency=concurrency, paginate=paginate, adaptive=adaptive
+                    )
+                )
+            elapsed = time.perf_counter() - started
+
+        logger.info(
+            f"{name:<24} {server.requests / elapsed:>7.1f} req/s {documents / elapsed:>9.0f} docs/s "
+            f"{server.bytes_sent / elapsed / 2**20:>6.1f} MB/s ({documents} docs, "
+            f"{server.errors} errors, {len(extractor.failed_windows)} failed windows)"
+        )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import tempfile
+import time
+import warnings
+
+import requests
+import typer
+from loguru import logger
+
+from server_log_analysis.etl.client import make_session
+from server_log_analysis.etl.fake_search import SampleSearchServer
+from server_log_analysis.etl.source_filter import FILTER_PATH
+from server_log_analysis.etl.sources import DEFAULTS
+
+app = typer.Typer()
+
+
+def self_signed_cert(directory: str) -> str:
+    path = os.path.join(directory, "localhost.pem")
+    command = "openssl req -x509 -newkey rsa:2048 -nodes -days 1 -subj /CN=localhost"
+    subprocess.run([*command.split(), "-keyout", path, "-out", path], check=True, capture_output=True)
+    return path
+
+
+def window_body(second: int, step: int, size: int) -> dict:
+    start = f"2025-01-02T00:{second // 60:02d}:{second % 60:02d}"
+    return {
+        "size": size,
+        "query": {"range": {"@timestamp": {"gte": f"{start}.000Z", "lte": f"{start}.{step:03d}Z"}}},
+        "sort": [{"@timestamp": {"order": "asc"}}],
+    }
+
+
+@app.command()
+def main(
+    source: str = "kong",
+    windows: int = 200,
+    step: int = 100,
+    size: int = 50,
+    latency: float = 0.0,
+    error_rate: float = 0.1,
+    tls: bool = typer.Option(True, help="Serve HTTPS like the cluster, needs the openssl CLI"),
+):
+    """Small-window pulls with a new connection per request versus the shared pooled session."""
+    warnings.filterwarnings("ignore")
+    certfile = self_signed_cert(tempfile.mkdtemp()) if tls else None
+    with SampleSearchServer.from_samples(
+        [source], period=1000, latency=latency, certfile=certfile
+    ) as server:
+        url = server.url(DEFAULTS[source]["index"])
+        bodies = [window_body(i, step, size) for i in range(windows)]
+        params = {"filter_path": FILTER_PATH}
+
+        started = time.perf_counter()
+        for body in bodies:
+            requests.get(url, params=params, json=body, verify=False, timeout=15).raise_for_status()
+        fresh = time.perf_counter() - started
+
+        session = make_session()
+        started = time.perf_counter()
+        for body in bodies:
+            session.get(url, params=params, json=body, timeout=15).raise_for_status()
+        pooled = time.perf_counter() - started
+
+    logger.info(
+        f"{windows} windows over {'HTTPS' if tls else 'HTTP'}: "
+        f"new connection {fresh / windows * 1000:.2f} ms/request, "
+        f"pooled {pooled / windows * 1000:.2f} ms/request (x{fresh / pooled:.1f})"
+    )
+
+    with SampleSearchServer.from_samples(
+        [source], period=1000, latency=latency, error_rate=error_rate, seed=0
+    ) as server:
+        url = server.url(DEFAULTS[source]["index"])
+        bare, session = requests.Session(), make_session(backoff=0.01)
+        lost = sum(not bare.get(url, params=params, json=body).ok for body in bodies)
+        recovered = sum(session.get(url, params=params, json=body).ok for body in bodies)
+    logger.info(
+        f"{error_rate:.0%} rejected searches: {lost}/{windows} windows lost without retries, "
+        f"{recovered}/{windows} fetched with retries ({server.errors} errors absorbed in total)"
+    )
+
+
+if __name__ == "__main__":
+    app()
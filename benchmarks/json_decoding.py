@@ -0,0 +1,55 @@
+import json
+import time
+import tracemalloc
+from typing import List
+
+import typer
+from loguru import logger
+
+from server_log_analysis.etl import decode
+from server_log_analysis.etl.source_filter import source_includes
+from server_log_analysis.etl.sources import load_script, sample_path
+
+app = typer.Typer()
+
+
+def measure(parse, raw: bytes, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parse(raw)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    tracemalloc.start()
+    result = parse(raw)
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, peak, kept
+
+
+@app.command()
+def main(source: List[str] = ["metrics-apm", "traces-apm"], repeat: int = 10):
+    """Parse time, peak and retained memory of one sample response, whole versus projected."""
+    for name in source:
+        raw = sample_path(name).read_bytes()
+        includes = source_includes(load_script(name).Transform.FIELDS)
+        parsers = {"json.loads": json.loads}
+        parsers["stream"] = lambda raw: decode.loads_search(raw, includes, "stream")
+        if decode.orjson is not None:
+            parsers["orjson.loads"] = decode.orjson.loads
+            parsers["orjson + project"] = lambda raw: decode.loads_search(raw, includes, "orjson")
+
+        logger.info(f"{name}: {len(raw) / 2**20:.1f} MB, keeping {', '.join(includes)}")
+        baseline = None
+        for label, parse in parsers.items():
+            elapsed, peak, kept = measure(parse, raw, repeat)
+            baseline = baseline or (elapsed, peak, kept)
+            logger.info(
+                f"  {label:<17} {elapsed * 1000:>6.1f} ms (x{baseline[0] / elapsed:.1f}) "
+                f"peak {peak / 2**20:>5.1f} MB (x{baseline[1] / peak:.1f}) "
+                f"kept {kept / 2**20:>5.2f} MB (x{baseline[2] / kept:.1f})"
+            )
+
+
+if __name__ == "__main__":
+    app()
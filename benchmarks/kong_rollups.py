@@ -0,0 +1,91 @@
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+import pandas as pd
+import typer
+from loguru import logger
+
+from benchmarks.sql_query import DAY_START, MONTHS, PATHS
+from server_log_analysis.etl.rollups import parse_access_lines, read_rollups, rollup_stores, window_rollup
+from server_log_analysis.etl.timestamps import format_iso_ms
+
+app = typer.Typer()
+
+
+def traffic(records: int, clients: int, rng: random.Random) -> List[str]:
+    """A day of access-log lines from ``clients`` addresses, a few of them busy (Zipf weights)."""
+    addresses = [f"10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(clients)]
+    weights = [1 / (rank + 1) for rank in range(clients)]
+    lines = []
+    for i, address in enumerate(rng.choices(addresses, weights, k=records)):
+        local = pd.Timestamp(DAY_START + i * 86_400_000 // records + 7 * 3_600_000, unit="ms")
+        lines.append(
+            f'{address} - - [{local.day:02d}/{MONTHS[local.month - 1]}/{local.year}:{local:%H:%M:%S} +0700] '
+            f'"GET {rng.choice(PATHS)}?id={rng.getrandbits(32)} HTTP/1.1" {rng.choice([200] * 8 + [401, 500])} {rng.randrange(10, 5000)} '
+            f'"-" "okhttp/4.12.0" kong_request_id: "{rng.getrandbits(64):016x}"'
+        )
+    return lines
+
+
+def raw_hourly(frame: pd.DataFrame) -> pd.DataFrame:
+    """Hourly requests, errors and bytes_sent as Visualize computes them, over every raw row."""
+    frame = frame.assign(
+        hour=pd.to_datetime(frame["ms"], unit="ms", utc=True).dt.floor("h"),
+        status=pd.to_numeric(frame["status"]),
+        bytes_sent=pd.to_numeric(frame["bytes_sent"]),
+    )
+    frame["errors"] = (frame["status"] >= 400).astype(int)
+    return frame.groupby("hour").agg(requests=("status", "size"), errors=("errors", "sum"), bytes_sent=("bytes_sent", "sum"))
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+@app.command()
+def main(records: int = 1_000_000, clients: int = 2000, window: int = 600, batch: int = 5000):
+    """Hourly Kong traffic for a day: groupby over the raw rows against per-minute rollups, and the cost of maintaining them."""
+    rng = random.Random(0)
+    lines = traffic(records, clients, rng)
+    with tempfile.TemporaryDirectory() as root:
+        # Visualize today: the parsed log as one CSV, read whole, grouped per call
+        path = os.path.join(root, "parsed_logs.csv")
+        parse_access_lines(lines).to_csv(path, index=False)
+        expected, loading = timed(lambda: raw_hourly(pd.read_csv(path)))
+        logger.info(f"{records:,} lines: read the parsed CSV and group per hour in {loading:.1f} s")
+
+        per_window = records * window // 86_400
+        started = time.perf_counter()
+        for first in range(0, records, per_window):
+            start = DAY_START + first * 86_400_000 // records
+            rollup = window_rollup(root, "kong", {"start_time": format_iso_ms(start), "end_time": format_iso_ms(start + window * 1000)})
+            for offset in range(first, min(first + per_window, records), batch):
+                rollup.append(lines[offset:min(offset + batch, first + per_window, records)])
+            rollup.close()
+        maintaining = time.perf_counter() - started
+        logger.info(f"rollups of {records // per_window + 1} windows maintained in {maintaining:.1f} s ({records / maintaining:,.0f} lines/s)")
+
+        for store in rollup_stores(root, "kong"):
+            logger.info(f"  {store.source}: {sum(segment['records'] for segment in store.manifest()):,} per-minute rollup rows")
+        for label, start, end in (("day", None, None), ("hour", DAY_START + 9 * 3_600_000, DAY_START + 10 * 3_600_000)):
+            range_ = [format_iso_ms(ms) if ms is not None else None for ms in (start, end)]
+            rollups, reading = timed(read_rollups, root, "kong", *range_, "h")
+            logger.info(f"  a {label} per h by every dimension: read {reading * 1000:.0f} ms into {len(rollups):,} rows")
+        for label, start, end in (("day", None, None), ("hour", DAY_START + 9 * 3_600_000, DAY_START + 10 * 3_600_000)):
+            for freq in ("h", "D"):
+                range_ = [format_iso_ms(ms) if ms is not None else None for ms in (start, end)]
+                rollups, reading = timed(read_rollups, root, "kong", *range_, freq, ("status_class", "method"))
+                totals = rollups.groupby("time")[["requests", "errors", "bytes_sent"]].sum()
+                same = label != "day" or freq != "h" or totals.to_numpy().tolist() == expected.to_numpy().tolist()
+                logger.info(
+                    f"  a {label} per {freq}: read {reading * 1000:.0f} ms (x{loading / reading:.0f}) into {len(rollups):,} rows, same totals: {same}"
+                )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,72 @@
+import csv
+import json
+import os
+import tempfile
+import time
+from typing import List
+
+import typer
+from loguru import logger
+
+from benchmarks.transform_scaling import synthetic_hits
+from server_log_analysis.etl.sources import load_script
+from server_log_analysis.etl.writer import write_stream
+
+app = typer.Typer()
+
+
+def json_round_trip(module, hits: List[dict], txt_path: str, csv_path: str):
+    """Transform and Load.run before: indent=2 JSON strings, parsed twice by Load."""
+    transform = module.Transform()
+    logs = [json.dumps(transform.extract_system_resource_logs(log), indent=2) + "\n" for log in hits]
+    with open(txt_path, "w", encoding="utf-8") as f:
+        for log in logs:
+            f.write(log)
+    with open(csv_path, "w", encoding="utf-8", newline="") as csvfile:
+        fieldnames = set()
+        for log in logs:
+            fieldnames.update(json.loads(log).keys())
+        csv_writer = csv.DictWriter(csvfile, fieldnames=sorted(fieldnames))
+        csv_writer.writeheader()
+        for log in logs:
+            csv_writer.writerow({
+                key: (json.dumps(value) if isinstance(value, (dict, list)) else value)
+                for key, value in json.loads(log).items()
+            })
+
+
+def structured(module, hits: List[dict], txt_path: str, csv_path: str):
+    """Transform and Load.run now: records to NDJSON and CSV in one pass."""
+    transform = module.Transform()
+    logs = [transform.extract_system_resource_logs(log) for log in hits]
+    write_stream([logs], txt_path, csv_path, module.Transform.COLUMNS)
+
+
+@app.command()
+def main(source: List[str] = ["traces-apm", "metrics-apm"], records: int = 200_000):
+    """Transform + Load wall time with the JSON string round-trip and with records."""
+    for name in source:
+        module = load_script(name)
+        hits = synthetic_hits(name, records)
+        with tempfile.TemporaryDirectory() as save_dir:
+            paths = {}
+            timings = {}
+            for label, run in (("JSON round-trip", json_round_trip), ("records", structured)):
+                txt_path, csv_path = (os.path.join(save_dir, f"{run.__name__}.{ext}") for ext in ("txt", "csv"))
+                started = time.perf_counter()
+                run(module, hits, txt_path, csv_path)
+                timings[label] = time.perf_counter() - started
+                paths[label] = (txt_path, csv_path)
+            old, new = timings.values()
+            (old_txt, old_csv), (new_txt, new_csv) = paths.values()
+            with open(old_csv, "rb") as a, open(new_csv, "rb") as b:
+                same_csv = a.read() == b.read()
+            logger.info(
+                f"{name}: {records / old:,.0f} -> {records / new:,.0f} records/s (x{old / new:.1f}), "
+                f"txt {os.path.getsize(old_txt) / 2**20:.1f} -> {os.path.getsize(new_txt) / 2**20:.1f} MB, "
+                f"identical CSV: {same_csv}"
+            )
+
+
+if __name__ == "__main__":
+    app()
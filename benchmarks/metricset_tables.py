@@ -0,0 +1,49 @@
+import os
+import tempfile
+import time
+
+import pandas as pd
+import typer
+from loguru import logger
+
+from benchmarks.transform_scaling import synthetic_hits
+from server_log_analysis.etl.sources import load_script
+from server_log_analysis.etl.writer import write_stream
+
+app = typer.Typer()
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+@app.command()
+def main(records: int = 500_000):
+    """Reading one metricset from the sparse union CSV against its own typed table."""
+    module = load_script("metricbeat")
+    logs = module.Transform(logs=synthetic_hits("metricbeat", records)).exact_log()
+    info = {"start_time": "2025-01-02T00:00:00.000Z", "end_time": "2025-01-02T01:00:00.000Z"}
+    with tempfile.TemporaryDirectory() as save_dir:
+        sparse = os.path.join(save_dir, "metrics-beat-logs.csv")
+        write_stream([logs], os.path.join(save_dir, "union.txt"), sparse, sorted(set().union(*logs)))
+        load = module.Load(logs, info, save_dir)
+        logger.info(f"{records:,} records, union CSV {os.path.getsize(sparse) / 2**20:.1f} MB")
+
+        for name, schema in module.Transform.SCHEMAS.items():
+            dense = os.path.join(load.log_name, f"metrics-beat-{name}.csv")
+            key = next(column for column in schema.columns if column not in module.Transform.COMMON)
+            columns = list(schema.columns)
+            union, union_time = timed(pd.read_csv, sparse, usecols=columns, keep_default_na=False, na_values=[""])
+            union = union.loc[union[key].notna(), columns].reset_index(drop=True)
+            table, table_time = timed(pd.read_csv, dense, keep_default_na=False, na_values=[""])
+            logger.info(
+                f"  {name:<8} {len(table):>8,} rows, {os.path.getsize(dense) / 2**20:6.1f} MB: "
+                f"union {union_time * 1000:7.0f} ms -> table {table_time * 1000:5.0f} ms "
+                f"(x{union_time / table_time:.1f}), same values: {union.astype(table.dtypes.to_dict()).equals(table)}"
+            )
+
+
+if __name__ == "__main__":
+    app()
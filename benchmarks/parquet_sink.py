@@ -0,0 +1,71 @@
+import os
+import tempfile
+import time
+
+import pandas as pd
+import typer
+from loguru import logger
+
+from benchmarks.transform_scaling import synthetic_hits
+from server_log_analysis.etl.parquet_sink import ParquetSink, read_parquet
+from server_log_analysis.etl.sources import load_script
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+from server_log_analysis.etl.writer import write_stream
+
+app = typer.Typer()
+
+DAY_START = parse_iso_ms("2025-01-02T00:00:00.000Z")
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def size_mb(path: str) -> float:
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 2**20
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 2**20
+
+
+@app.command()
+def main(source: str = "traces-apm", records: int = 500_000, hour: int = 7, columns: int = 2):
+    """One hour and a few columns of a day, read from the CSV against the Parquet dataset."""
+    module = load_script(source)
+    transform = module.Transform
+    time_column = transform.TIME_COLUMN
+    if time_column is None:
+        raise typer.BadParameter(f"{source} has no time column to spread over the day")
+    logs = transform(logs=synthetic_hits(source, records)).exact_log()
+    for i, record in enumerate(logs):
+        record[time_column] = format_iso_ms(DAY_START + i * 86_400_000 // records)
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        csv_path = os.path.join(save_dir, f"{source}.csv")
+        root = os.path.join(save_dir, "parquet")
+        _, csv_time = timed(write_stream, [logs], os.path.join(save_dir, f"{source}.txt"), csv_path, transform.COLUMNS)
+        sink = ParquetSink(root, source, transform.SCHEMA, "part.parquet", time_column, DAY_START)
+        _, parquet_time = timed(lambda: (sink.append(logs), sink.close()))
+        logger.info(
+            f"{source}: {records:,} records over a day, CSV {size_mb(csv_path):.1f} MB in {csv_time:.1f} s, "
+            f"Parquet {size_mb(root):.1f} MB in {parquet_time:.1f} s"
+        )
+
+        start, end = format_iso_ms(DAY_START + hour * 3_600_000), format_iso_ms(DAY_START + (hour + 1) * 3_600_000)
+        wanted = [time_column] + [column for column in transform.COLUMNS if column != time_column][:columns - 1]
+
+        def csv_hour():
+            df = pd.read_csv(csv_path, usecols=wanted)
+            return df[(df[time_column] >= start) & (df[time_column] < end)]
+
+        expected, csv_read = timed(csv_hour)
+        table, parquet_read = timed(read_parquet, root, source, start, end, wanted, time_column)
+        logger.info(
+            f"  hour {hour:02d}, columns {wanted}: CSV {csv_read * 1000:.0f} ms -> Parquet {parquet_read * 1000:.0f} ms "
+            f"(x{csv_read / parquet_read:.1f}), {len(table):,} rows, same rows: {len(table) == len(expected)}"
+        )
+
+
+if __name__ == "__main__":
+    app()
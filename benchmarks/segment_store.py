@@ -0,0 +1,97 @@
+import json
+import os
+import re
+import tempfile
+import time
+from typing import List
+
+import typer
+from loguru import logger
+
+from benchmarks.transform_scaling import synthetic_hits
+from server_log_analysis.etl.segments import SegmentStore, window_segment
+from server_log_analysis.etl.sources import load_script
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+from server_log_analysis.etl.writer import write_stream
+
+app = typer.Typer()
+
+DAY_START = parse_iso_ms("2025-01-02T00:00:00.000Z")
+# Window folder names as Load.log_name builds them, e.g. ...-2025-01-02_00_00_00_000Z-2025-01-02_00_10_00_000Z
+WINDOW_NAME = re.compile(r"(\d{4}-\d{2}-\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{3})Z-(\d{4}-\d{2}-\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{3})Z$")
+
+
+def window_dirs(save_dir: str, start: int, end: int) -> List[str]:
+    """The window folders overlapping ``[start, end)``, found by parsing their names back."""
+    found = []
+    for name in sorted(os.listdir(save_dir)):
+        match = WINDOW_NAME.search(name)
+        if match:
+            parts = match.groups()
+            first = parse_iso_ms("{}T{}:{}:{}.{}Z".format(*parts[:5]))
+            last = parse_iso_ms("{}T{}:{}:{}.{}Z".format(*parts[5:]))
+            if first < end and start < last:
+                found.append(os.path.join(save_dir, name))
+    return found
+
+
+def from_directories(save_dir: str, source: str, time_column: str, start: int, end: int) -> List[str]:
+    """A range read before: list the folders, read their whole txt files, parse every line's time."""
+    lines = []
+    for directory in window_dirs(save_dir, start, end):
+        with open(os.path.join(directory, f"{source}-logs.txt"), encoding="utf-8") as f:
+            for line in f:
+                ms = parse_iso_ms(json.loads(line)[time_column])
+                if start <= ms < end:
+                    lines.append(line)
+    return lines
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+@app.command()
+def main(source: str = "traces-apm", records: int = 500_000, window: int = 600, minutes: List[int] = [5, 60]):
+    """Range reads over a day of window folders against the segment store, before and after compaction."""
+    transform = load_script(source).Transform
+    time_column = transform.TIME_COLUMN
+    logs = transform(logs=synthetic_hits(source, records)).exact_log()
+    for i, record in enumerate(logs):
+        record[time_column] = format_iso_ms(DAY_START + i * 86_400_000 // records)
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        root = os.path.join(save_dir, "segments")
+        per_window = records * window // 86_400
+        for first in range(0, records, per_window):
+            batch = logs[first:first + per_window]
+            info = {"start_time": format_iso_ms(DAY_START + first * 86_400_000 // records)}
+            info["end_time"] = format_iso_ms(parse_iso_ms(info["start_time"]) + window * 1000)
+            name = "{}-logs-{}-{}".format(source, *(info[key].replace(":", "_").replace("T", "_").replace(".", "_") for key in ("start_time", "end_time")))
+            os.makedirs(os.path.join(save_dir, name))
+            write_stream([batch], os.path.join(save_dir, name, f"{source}-logs.txt"), os.path.join(save_dir, name, f"{source}-logs.csv"), transform.COLUMNS)
+            segment = window_segment(root, source, info, time_column)
+            segment.append(batch)
+            segment.close()
+        store = SegmentStore(root, source)
+        logger.info(f"{source}: {records:,} records in {len(store.manifest())} windows of {window} s")
+
+        for label in ("window segments", "compacted"):
+            if label == "compacted":
+                merged, compact_time = timed(store.compact)
+                logger.info(f"  compacted {merged} segments into {len(store.manifest())} in {compact_time:.1f} s")
+            for length in minutes:
+                start = DAY_START + 7 * 3_600_000 + 123_456
+                end = start + length * 60_000
+                expected, folders = timed(from_directories, save_dir, source, time_column, start, end)
+                lines, segments = timed(lambda: list(store.read(format_iso_ms(start), format_iso_ms(end))))
+                logger.info(
+                    f"  {label}, {length:>3} minutes: folders {folders * 1000:6.0f} ms -> segments {segments * 1000:5.1f} ms "
+                    f"(x{folders / segments:.0f}), {len(lines):,} lines, same lines: {lines == expected}"
+                )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,44 @@
+import json
+import time
+
+import typer
+from loguru import logger
+
+from server_log_analysis.etl.source_filter import (
+    apply_filter_path,
+    filter_source,
+    source_includes,
+)
+from server_log_analysis.etl.sources import SAMPLES, load_script, sample_path
+
+app = typer.Typer()
+
+
+def parse_time(body: str, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        json.loads(body)
+    return (time.perf_counter() - started) / repeat
+
+
+@app.command()
+def main(repeat: int = 5):
+    """Response size and parse time of the sample pages with and without _source filtering."""
+    for source in SAMPLES:
+        response = json.loads(sample_path(source).read_text())
+        includes = source_includes(load_script(source).Transform.FIELDS)
+        filtered = apply_filter_path(response)
+        for hit in filtered["hits"]["hits"]:
+            hit["_source"] = filter_source(hit["_source"], includes)
+
+        full_body, filtered_body = json.dumps(response), json.dumps(filtered)
+        full_time, filtered_time = parse_time(full_body, repeat), parse_time(filtered_body, repeat)
+        logger.info(
+            f"{source:<24} {len(full_body) / 1024:>7.0f} KB -> {len(filtered_body) / 1024:>5.0f} KB "
+            f"(x{len(full_body) / len(filtered_body):.1f}), parse {full_time * 1000:.1f} ms -> "
+            f"{filtered_time * 1000:.1f} ms (x{full_time / filtered_time:.1f})"
+        )
+
+
+if __name__ == "__main__":
+    app()
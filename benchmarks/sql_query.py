@@ -0,0 +1,90 @@
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+import typer
+from loguru import logger
+
+from server_log_analysis.etl.access_log import KONG_PATTERN
+from server_log_analysis.etl.query import parse_predicate, run_query
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+
+app = typer.Typer()
+
+DAY_START = parse_iso_ms("2025-01-02T00:00:00.000Z")
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+PATHS = ["/api/login", "/api/users/self", "/api/vhome/refresh", "/api/devices/vhome/share/list"]
+SQL = (
+    "SELECT substr(datetime, 1, 16) AS minute, remote_address, count(*) AS requests FROM kong "
+    "WHERE status BETWEEN 400 AND 499 AND path = '/api/login' GROUP BY 1, 2 ORDER BY 1, 2"
+)
+
+
+def access_line(ms: int, rng: random.Random) -> str:
+    """One Kong access-log line at ``ms``, in +0700 as the cluster logs it."""
+    local = pd.Timestamp(ms + 7 * 3_600_000, unit="ms")
+    return (
+        f'10.0.{rng.randrange(4)}.{rng.randrange(50)} - - [{local.day:02d}/{MONTHS[local.month - 1]}/{local.year}:{local:%H:%M:%S} +0700] '
+        f'"POST {rng.choice(PATHS)} HTTP/1.1" {rng.choice([200, 200, 200, 401, 403, 500])} {rng.randrange(10, 5000)} '
+        f'"-" "okhttp/4.12.0" kong_request_id: "{rng.getrandbits(64):016x}"'
+    )
+
+
+def folder_name(start: int, end: int) -> str:
+    start_time, end_time = (format_iso_ms(ms).replace(":", "_").replace("T", "_").replace(".", "_") for ms in (start, end))
+    return f"kong-logs-acesss.{start_time}-{end_time}"
+
+
+def full_load(logs_dir: str, start: int, end: int) -> pd.DataFrame:
+    """The query as analyses run it today: read every CSV, parse, then filter."""
+    frame = pd.concat(
+        [pd.read_csv(os.path.join(logs_dir, name, "kong-logs.csv")) for name in sorted(os.listdir(logs_dir))],
+        ignore_index=True,
+    )
+    frame = frame["message"].str.extract(KONG_PATTERN)
+    frame["time"] = pd.to_datetime(frame["datetime"], format="%d/%b/%Y:%H:%M:%S %z").dt.tz_convert("UTC")
+    frame = frame[(frame["time"] >= pd.Timestamp(start, unit="ms", tz="UTC")) & (frame["time"] < pd.Timestamp(end, unit="ms", tz="UTC"))]
+    frame = frame[frame["status"].astype(int).between(400, 499) & (frame["path"] == "/api/login")]
+    frame["minute"] = frame["time"].dt.strftime("%Y-%m-%dT%H:%M")
+    grouped = frame.groupby(["minute", "remote_address"]).size().reset_index(name="requests")
+    return grouped.sort_values(["minute", "remote_address"]).reset_index(drop=True)
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+@app.command()
+def main(records: int = 1_000_000, window: int = 600, hours: int = 1):
+    """"4xx on /api/login per IP per minute" over a day of Kong windows: full pandas load against the query command."""
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as logs_dir:
+        per_window = records * window // 86_400
+        for first in range(0, records, per_window):
+            start = DAY_START + first * 86_400_000 // records
+            folder = os.path.join(logs_dir, folder_name(start, start + window * 1000))
+            os.makedirs(folder)
+            lines = [access_line(DAY_START + i * 86_400_000 // records, rng) for i in range(first, min(first + per_window, records))]
+            pd.DataFrame({"message": lines}).to_csv(os.path.join(folder, "kong-logs.csv"), index=False)
+        logger.info(f"{records:,} access-log lines in {len(os.listdir(logs_dir))} windows of {window} s")
+
+        start = DAY_START + 9 * 3_600_000
+        end = start + hours * 3_600_000
+        expected, loading = timed(full_load, logs_dir, start, end)
+        cursor, querying = timed(
+            lambda: run_query(SQL, format_iso_ms(start), format_iso_ms(end), [parse_predicate("path=/api/login")], logs_dir)
+        )
+        rows = cursor.fetchall()
+        same = [tuple(row) for row in expected.itertuples(index=False)] == rows
+        logger.info(
+            f"{hours} h: full load {loading:.1f} s -> query {querying:.2f} s (x{loading / querying:.0f}), "
+            f"{len(rows):,} rows, same rows: {same}"
+        )
+
+
+if __name__ == "__main__":
+    app()
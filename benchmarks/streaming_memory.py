@@ -0,0 +1,54 @@
+import json
+from pathlib import Path
+from typing import List
+
+import typer
+from loguru import logger
+
+from server_log_analysis.etl.fake_search import FakeSearchServer
+from server_log_analysis.etl.memory import peak_rss
+from server_log_analysis.etl.sources import ETL_DIR
+
+app = typer.Typer()
+
+
+@app.command()
+def main(
+    source: str = "traces-apm",
+    sample_path: Path = ETL_DIR / "logs" / "traces-apm.json",
+    hits: int = 50,
+    step: int = 100,
+    seconds: List[int] = [2, 8, 32],
+    tolerance_mb: float = 16.0,
+):
+    """
+    Peak RSS of the batch and streaming pipelines as the window grows.
+
+    Every window returns the same ``hits`` documents, so the amount of data grows
+    linearly with ``seconds``. Exits non-zero if the streaming peak grows by more
+    than ``tolerance_mb`` between the smallest and the largest window.
+    """
+    sample = json.loads(sample_path.read_text())
+    sample["hits"]["hits"] = sample["hits"]["hits"][:hits]
+    sample["hits"]["total"] = {"value": hits, "relation": "eq"}
+
+    stream_peaks = []
+    with FakeSearchServer(json.dumps(sample).encode(), latency=0) as server:
+        for n in seconds:
+            docs = n * 1000 // step * hits
+            batch = peak_rss(source, server.url, n, step, False)
+            stream = peak_rss(source, server.url, n, step, True)
+            stream_peaks.append(stream)
+            logger.info(
+                f"{n:>3}s window, {docs} docs: batch peak {batch:.0f} MB, stream peak {stream:.0f} MB"
+            )
+
+    growth = max(stream_peaks) - min(stream_peaks)
+    if growth > tolerance_mb:
+        logger.error(f"Streaming peak RSS grew by {growth:.1f} MB")
+        raise typer.Exit(1)
+    logger.success(f"Streaming peak RSS stayed within {growth:.1f} MB")
+
+
+if __name__ == "__main__":
+    app()
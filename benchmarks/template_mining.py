@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+import re
+import time
+
+import typer
+from loguru import logger
+
+from server_log_analysis.etl.access_log import KONG_PATTERN
+from server_log_analysis.etl.sources import sample_path
+from server_log_analysis.etl.templates import TemplateMiner
+
+app = typer.Typer()
+
+
+def sample_messages(source: str, records: int) -> list:
+    """``records`` messages cycling through the sample dump's ``message`` fields."""
+    hits = json.loads(sample_path(source).read_text())["hits"]["hits"]
+    messages = [hit["_source"].get("message") or "" for hit in hits]
+    return [messages[i % len(messages)] for i in range(records)]
+
+
+def mine(label: str, messages: list, max_templates: int):
+    miner = TemplateMiner(max_templates=max_templates)
+    events = io.StringIO()
+    csv_writer = csv.writer(events)
+    started = time.perf_counter()
+    for message in messages:
+        template_id, params = miner.add(message)
+        csv_writer.writerow((template_id, " ".join(params)))
+    elapsed = time.perf_counter() - started
+
+    verbatim = io.StringIO()
+    csv.writer(verbatim).writerows((message,) for message in messages)
+    logger.info(
+        f"{label}: {len(messages) / elapsed:,.0f} messages/s, {len(miner.templates)} templates "
+        f"({miner.evicted} evicted)"
+    )
+    logger.info(
+        f"  message column {len(verbatim.getvalue()) / 2**20:.2f} MB -> "
+        f"template_id + params {len(events.getvalue()) / 2**20:.2f} MB"
+    )
+    for template in sorted(miner.templates, key=lambda template: -template.count)[:5]:
+        logger.info(f"  {template.id:>4} x{template.count:<8} {template.text[:100]}")
+
+
+@app.command()
+def main(source: str = "kong", records: int = 200_000, max_templates: int = 10_000):
+    """Messages/s of the template miner, and verbatim bytes against template id + params."""
+    messages = sample_messages(source, records)
+    mine(source, messages, max_templates)
+    if source == "kong":
+        access = re.compile(KONG_PATTERN)
+        mine("kong, non-access lines", [message for message in messages if not access.match(message)], max_templates)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+import random
+import time
+
+import pandas as pd
+import typer
+from loguru import logger
+
+from server_log_analysis.etl import timestamps
+from server_log_analysis.etl.fetch import iter_windows
+
+app = typer.Typer()
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def strptime_ms(value: str) -> int:
+    return (datetime.strptime(value, timestamps.ISO_FORMAT) - EPOCH) // timedelta(milliseconds=1)
+
+
+def isoformat_ms(ms: int) -> str:
+    return (EPOCH + timedelta(milliseconds=ms)).isoformat(timespec="milliseconds") + "Z"
+
+
+def strptime_windows(start_time: str, end_time: str, step: int):
+    """The window walk of get_log before: parse the previous end again on every step."""
+    delta = datetime.strptime(end_time, timestamps.ISO_FORMAT) - datetime.strptime(start_time, timestamps.ISO_FORMAT)
+    windows = []
+    for _ in range(0, int(delta.total_seconds() * 1000), step):
+        current = datetime.strptime(start_time, timestamps.ISO_FORMAT) + timedelta(milliseconds=step)
+        query_time = current.isoformat(timespec="milliseconds") + "Z"
+        windows.append((start_time, query_time))
+        start_time = query_time
+    return windows
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - started, result
+
+
+def report(label: str, count: int, before, after):
+    (old_time, old), (new_time, new) = before, after
+    same = old.equals(new) if isinstance(old, pd.Series) else list(old) == list(new)
+    logger.info(
+        f"{label:<28} {count / old_time:>12,.0f}/s -> {count / new_time:>12,.0f}/s "
+        f"(x{old_time / new_time:.1f}), identical: {same}"
+    )
+
+
+@app.command()
+def main(count: int = 200_000, seed: int = 0):
+    """strptime/isoformat against the timestamps fast paths on generated times."""
+    rng = random.Random(seed)
+    ms = [1_735_689_600_000 + rng.randrange(0, 86_400_000 * 30) for _ in range(count)]
+    iso = [isoformat_ms(value) for value in ms]
+    tz = timezone(timedelta(hours=7))
+    clf = pd.Series([datetime.fromtimestamp(value / 1000, tz).strftime(timestamps.CLF_FORMAT) for value in ms])
+
+    report("ISO -> epoch ms, scalar", count,
+           timed(lambda: [strptime_ms(value) for value in iso]),
+           timed(lambda: [timestamps.parse_iso_ms(value) for value in iso]))
+    report("ISO -> epoch ms, array", count,
+           timed(lambda: [strptime_ms(value) for value in iso]),
+           timed(timestamps.parse_iso_array, iso))
+    report("epoch ms -> ISO", count,
+           timed(lambda: [isoformat_ms(value) for value in ms]),
+           timed(lambda: [timestamps.format_iso_ms(value) for value in ms]))
+    report("access log -> datetime column", count,
+           timed(clf.apply, lambda value: datetime.strptime(value, timestamps.CLF_FORMAT)),
+           timed(timestamps.clf_to_datetime, clf))
+    start, end = "2025-01-01T00:00:00.000Z", "2025-01-01T00:03:20.000Z"
+    report("get_log windows of 1 ms", 200_000,
+           timed(strptime_windows, start, end, 1),
+           timed(lambda: list(iter_windows(start, end, 1))))
+
+
+if __name__ == "__main__":
+    app()
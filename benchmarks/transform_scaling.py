@@ -0,0 +1,76 @@
+import json
+from json import dumps
+import os
+import pickle
+import time
+from typing import List
+
+import typer
+from loguru import logger
+
+from server_log_analysis.etl.decode import loads, project_hit
+from server_log_analysis.etl.source_filter import source_includes
+from server_log_analysis.etl.sources import load_script, sample_path
+from server_log_analysis.etl.transform_pool import TransformPool, pack
+
+app = typer.Typer()
+
+
+def synthetic_hits(source: str, records: int) -> List[dict]:
+    """
+    ``records`` hits cycling through the sample dump, projected to the Transform's
+    fields as the extractor receives them; each is a distinct copy, so pickle
+    cannot share repeated objects.
+    """
+    includes = source_includes(load_script(source).Transform.FIELDS)
+    hits = [project_hit(hit, includes) for hit in json.loads(sample_path(source).read_text())["hits"]["hits"]]
+    return [
+        dict(loads(dumps(hits[i % len(hits)])), _id=f"{hits[i % len(hits)]['_id']}-{i}")
+        for i in range(records)
+    ]
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+@app.command()
+def main(
+    source: List[str] = ["metricbeat", "metrics-apm-usage-error"],
+    records: int = 200_000,
+    chunk_size: int = 5000,
+    workers: List[int] = [1, 2, 4, 8],
+):
+    """Transform throughput in process and on 1, 2, 4 and 8 workers, with identical output."""
+    logger.info(f"{os.cpu_count()} cores")
+    for name in source:
+        hits = synthetic_hits(name, records)
+        chunk = hits[:chunk_size]
+        pickled, pickle_time = timed(pickle.dumps, chunk)
+        packed, pack_time = timed(pack, chunk)
+        logger.info(
+            f"{name}: a {chunk_size}-hit chunk pickles to {len(pickled) / 2**20:.2f} MB in "
+            f"{pickle_time * 1000:.1f} ms, packs to {len(packed) / 2**20:.2f} MB in {pack_time * 1000:.1f} ms"
+        )
+
+        started = time.perf_counter()
+        expected = load_script(name).Transform(logs=hits).exact_log()
+        baseline = time.perf_counter() - started
+        logger.info(f"  in process  {records / baseline:>10,.0f} records/s")
+
+        for count in workers:
+            with TransformPool(name, count, chunk_size) as pool:
+                pool.exact_log(hits[:chunk_size])  # start the workers
+                started = time.perf_counter()
+                lines = pool.exact_log(hits)
+                elapsed = time.perf_counter() - started
+            logger.info(
+                f"  {count} worker{'s' if count > 1 else ' '}   {records / elapsed:>10,.0f} records/s "
+                f"(x{baseline / elapsed:.1f}), identical: {lines == expected}"
+            )
+
+
+if __name__ == "__main__":
+    app()
@@ -1,11 +1,24 @@
-import requests
-from datetime import datetime, timedelta
 from tqdm import tqdm
 import warnings
 from typing import Dict, List, Any
 import os
-import json
-import csv
+import sys
+from collections import Counter
+from server_log_analysis.etl.client import get_session
+from server_log_analysis.etl.decode import loads_search
+from server_log_analysis.etl.fetch import count_windows, iter_windows, stream_windows
+from server_log_analysis.etl.paginate import iter_pages
+from server_log_analysis.etl.parquet_sink import ParquetSink, window_sink
+from server_log_analysis.etl import pipeline
+from server_log_analysis.etl.planner import AdaptiveWindowPlanner
+from server_log_analysis.etl.schema import Field, Schema
+from server_log_analysis.etl.segments import SegmentWriter, window_segment
+from server_log_analysis.etl.source_filter import FILTER_PATH, source_includes
+from server_log_analysis.etl.templates import TemplateMiner, event_columns, mined_rows
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+from server_log_analysis.etl.writer import flatten_row, write_stream
+
+SOURCE = "logs-apm"
 
 class ExtractMetricApmLogs:
     def __init__(
@@ -15,7 +28,8 @@ class ExtractMetricApmLogs:
         start_time:str="2024-12-14T00:00:00.000Z",
         end_time:str="2024-12-15T00:00:00.000Z",
         step:int=500,
-        limit:int=5000
+        limit:int=5000,
+        source_fields:List[str]=None
     ):
         warnings.filterwarnings("ignore")
 
@@ -25,6 +39,8 @@ class ExtractMetricApmLogs:
         self.end_time = end_time
         self.step = step
         self.limit = limit
+        self.failed_windows = []
+        self.source_fields = source_fields
 
     @property
     def __headers(self):
@@ -33,8 +49,8 @@ class ExtractMetricApmLogs:
             "Content-Type": "application/json"
         }
 
-    def __data(self, query_time):
-        return {
+    def __data(self, query_time, start_time=None):
+        data = {
             "from": 0,
             "size": self.limit,
             "query": {
@@ -49,7 +65,7 @@ class ExtractMetricApmLogs:
                         {
                             "range": {
                                 "@timestamp": {
-                                    "gte": self.start_time,
+                                    "gte": start_time or self.start_time,
                                     "lte": query_time,
                                     "format": "strict_date_optional_time"
                                 }
@@ -66,6 +82,9 @@ class ExtractMetricApmLogs:
                 }
             ]
         }
+        if self.source_fields:
+            data["_source"] = {"includes": source_includes(self.source_fields)}
+        return data
     
     def process_response(self, response):
         # if response.status_code != 200:
@@ -74,63 +93,137 @@ class ExtractMetricApmLogs:
         data = response
         length = data['hits']['total']['value']
         miss_count = self.limit - length
-        logs = data['hits']['hits']
+        logs = data['hits'].get('hits', [])
         return logs, length, miss_count
     
     def get_log(self)->List[Dict[str, Any]]:
-        LOGS = []
+        LOGS = {} # window start -> its logs, in window order
 
-        start_dt = datetime.strptime(self.start_time, "%Y-%m-%dT%H:%M:%S.%fZ")
-        end_dt = datetime.strptime(self.end_time, "%Y-%m-%dT%H:%M:%S.%fZ")
-        delta = end_dt - start_dt
-        miliseconds = int(delta.total_seconds() * 1000)
+        start_ms = parse_iso_ms(self.start_time)
+        end_ms = parse_iso_ms(self.end_time)
 
-        for _ in tqdm(range(0, miliseconds, self.step), desc="Extracting"):
-            current_time = datetime.strptime(self.start_time, "%Y-%m-%dT%H:%M:%S.%fZ") + timedelta(milliseconds=self.step)
-            query_time = current_time.isoformat(timespec="milliseconds").replace("+00:00", "")+"Z"
+        for offset in tqdm(range(0, end_ms - start_ms, self.step), desc="Extracting"):
+            query_time = format_iso_ms(start_ms + offset + self.step)
             try:
-                    # response = requests.get(self.url, headers=self.__headers, json=self.__data(query_time), verify=False, timeout=15)
-                    with open('D:\Job\Viettel\Intern\ETL\example\logs\logs-apm.json', 'r') as f:
-                        response = json.load(f)                
-                    if self.process_response(response):
-                        logs, length, miss_count = self.process_response(response)
-                    if miss_count < 0:
-                        print(f"Missed {abs(miss_count)} lines from metric-apm-logging")
-                    LOGS+=logs
+                logs, length, miss_count = self.search_window(self.start_time, query_time)
+                if miss_count < 0:
+                    print(f"Missed {abs(miss_count)} lines from metric-apm-logging")
+                LOGS[self.start_time] = logs
             except Exception as e:
                 print(f"An error occured: {type(e).__name__} - {e}")
+                self.failed_windows.append((self.start_time, query_time))
+                LOGS[self.start_time] = []
+
+            self.start_time = query_time 
+
+        # A retried window goes back in its slot, so LOGS stays in timestamp order
+        LOGS.update(self.retry_failed_windows())
+        return [log for logs in LOGS.values() for log in logs]
+
+    def search_window(self, start_time, query_time):
+        response = get_session().get(self.url, headers=self.__headers, params={"filter_path": FILTER_PATH}, json=self.__data(query_time, start_time), timeout=15)
+        response.raise_for_status()
+        includes = source_includes(self.source_fields) if self.source_fields else None
+        return self.process_response(loads_search(response.content, includes))
+
+    def fetch_window(self, start_time, query_time)->List[Dict[str, Any]]:
+        try:
+            logs, length, miss_count = self.search_window(start_time, query_time)
+            if miss_count<0:
+                print(f"Missed {abs(miss_count)} lines from metric-apm-logging")
+            return logs
+        except Exception as e:
+            print(f"An error occured: {type(e).__name__} - {e}")
+            self.failed_windows.append((start_time, query_time))
+            return []
+
+    def iter_log_async(self, concurrency:int=8):
+        """Fetch the same windows as get_log, keeping `concurrency` requests in flight. Retried windows come last."""
+        windows = iter_windows(self.start_time, self.end_time, self.step)
+        total = count_windows(self.start_time, self.end_time, self.step)
+        yield from stream_windows(self.fetch_window, windows, concurrency, total=total)
+        yield from (logs for _, logs in self.retry_failed_windows())
+
+    def retry_failed_windows(self):
+        """Fetch the failed windows once more, after all the others, as (start_time, logs). Windows failing again stay in failed_windows."""
+        failed, self.failed_windows = self.failed_windows, []
+        for start_time, query_time in failed:
+            yield start_time, self.fetch_window(start_time, query_time)
+
+    def iter_log_paginated(self, page_size:int=None, pit_keep_alive:str=None):
+        """Drain [start_time, end_time] with search_after pages instead of `step` windows."""
+        try:
+            pages = iter_pages(self.url, self.__headers, self.__data(self.end_time), page_size or self.limit, pit_keep_alive)
+            yield from tqdm(pages, desc="Extracting")
+        except Exception as e:
+            print(f"An error occured: {type(e).__name__} - {e}")
+            self.failed_windows.append((self.start_time, self.end_time))
+
+    def iter_log_adaptive(self, min_step:int=1, max_step:int=None):
+        """Walk [start_time, end_time] with windows sized from the hits.total of the previous one."""
+        planner = AdaptiveWindowPlanner(self.step, self.limit, min_step, max_step)
+        yield from tqdm(planner.run(self.search_window, self.start_time, self.end_time), desc="Extracting")
+        print(planner.summary())
+        self.failed_windows += planner.failed_windows
+
+    def iter_log(self, concurrency:int=None, paginate:bool=False, pit_keep_alive:str=None, adaptive:bool=False, min_step:int=1, max_step:int=None):
+        """Yield the logs one page batch at a time, in timestamp order (retried windows last), without keeping them."""
+        if paginate:
+            return self.iter_log_paginated(pit_keep_alive=pit_keep_alive)
+        if adaptive:
+            return self.iter_log_adaptive(min_step, max_step)
+        return self.iter_log_async(concurrency or 1)
 
-            self.start_time = current_time.isoformat(timespec="milliseconds").replace("+00:00", "")+"Z" 
+    def get_log_async(self, concurrency:int=8)->List[Dict[str, Any]]:
+        windows = list(iter_windows(self.start_time, self.end_time, self.step))
+        LOGS = dict(zip((start for start, _ in windows), stream_windows(self.fetch_window, windows, concurrency, total=len(windows))))
+        # Retried windows go back in their slot, as in get_log
+        LOGS.update(self.retry_failed_windows())
+        return [log for logs in LOGS.values() for log in logs]
 
-        return LOGS 
+    def get_log_paginated(self, page_size:int=None, pit_keep_alive:str=None)->List[Dict[str, Any]]:
+        return [log for logs in self.iter_log_paginated(page_size, pit_keep_alive) for log in logs]
+
+    def get_log_adaptive(self, min_step:int=1, max_step:int=None)->List[Dict[str, Any]]:
+        return [log for logs in self.iter_log_adaptive(min_step, max_step) for log in logs]
 
 class Transform():
+    # Output columns as _source paths with defaults, compiled once
+    SCHEMA = Schema({
+        "info": Field("message", ""),
+        "errors": Field("error.exception", [], "list(value)"),
+    })
+    # _source paths read by SCHEMA, requested with _source.includes by the extractor
+    FIELDS = SCHEMA.fields
+    # CSV header, the output columns sorted as the union of keys used to be
+    COLUMNS = sorted(SCHEMA.columns)
+    # Column whose time picks the Parquet partition, None uses the window start
+    TIME_COLUMN = None
+
     def __init__(self, logs:List=None):
         self.logs = logs
 
     def extract_system_resource_logs(self, entry):
-        log_source = entry.get("_source", {})
-        info = log_source.get('message', "")
-        errors = []
-        exceptions = log_source.get('error', {}).get('exception', [])
-        for exception in exceptions:
-            errors.append(exception)
-        log_line = {
-            "info": info,
-            "errors": errors
-        }
-        return log_line
+        return self.SCHEMA.extract(entry.get("_source", {}))
     
     def exact_log(self):
-        LOGS_EXTRACTED = [json.dumps(self.extract_system_resource_logs(log), indent=2) + '\n' for log in tqdm(self.logs, desc="Transforming")]
-        return LOGS_EXTRACTED    
+        LOGS_EXTRACTED = [self.extract_system_resource_logs(log) for log in tqdm(self.logs, desc="Transforming")]
+        return LOGS_EXTRACTED
+
+    def iter_log(self, batches):
+        """Lazily transform page batches from Extract.iter_log, one batch at a time."""
+        for logs in batches:
+            yield [self.extract_system_resource_logs(log) for log in logs]    
     
 class Load():
-    def __init__(self, logs: List, log_info: Dict, save_dir: str):
+    def __init__(self, logs: List, log_info: Dict, save_dir: str, stream: bool = False, miner: TemplateMiner = None, sink: ParquetSink = None, segment: SegmentWriter = None):
         self.logs = logs
         self.log_info = log_info
         self.save_dir = save_dir
-        self.run()
+        self.miner = miner
+        self.sink = sink
+        self.segment = segment
+        self.run_stream() if stream else self.run()
 
     @property
     def log_name(self):
@@ -139,27 +232,41 @@ class Load():
         return os.path.join(self.save_dir, f"logs-apm-logs-{start_time}-{end_time}")
     
     def run(self):
-        # print('log_file_path', os.path.dirname(self.log_name))
+        """
+        Write the records to the txt output as NDJSON and to the CSV in a single
+        pass. With a miner the CSV holds the template id and params of each info
+        message instead of the message, and the window's template counts go to
+        logs-apm-templates.csv.
+        """
+        self.write([self.logs])
+
+    def run_stream(self):
+        """Write batches from Transform.iter_log as they arrive, see run."""
+        self.write(self.logs)
 
-        # Write to txt file
+    def write(self, batches):
         os.makedirs(self.log_name, exist_ok=True)
-        with open(os.path.join(self.log_name, "logs-apm.txt"), 'w', encoding='utf-8') as f:
-            for log in tqdm(self.logs, desc="Loading"):
-                f.write(log)
-
-        # Write logs to a CSV file
-        with open(os.path.join(self.log_name, "logs-apm.csv"), 'w', encoding='utf-8', newline='') as csvfile:
-            fieldnames = set()
-            for log in self.logs:
-                fieldnames.update(json.loads(log).keys())
-            fieldnames = sorted(fieldnames)
-
-            csv_writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            csv_writer.writeheader()  
-
-            for log in tqdm(self.logs, desc="Writing to CSV file"):
-                flattened_log = {key: (json.dumps(value) if isinstance(value, (dict, list)) else value) for key, value in json.loads(log).items()}
-                csv_writer.writerow(flattened_log)
+        batches = self.sink.tap(batches) if self.sink else batches
+        batches = self.segment.tap(batches) if self.segment else batches
+        fieldnames, to_row = Transform.COLUMNS, flatten_row
+        counts = Counter()
+        if self.miner:
+            fieldnames, to_row = event_columns(fieldnames, 'info'), mined_rows(to_row, self.miner, 'info', counts)
+        write_stream(batches, os.path.join(self.log_name, "logs-apm.txt"), os.path.join(self.log_name, "logs-apm.csv"), fieldnames, to_row=to_row)
+        if self.miner:
+            self.miner.write_templates(os.path.join(self.log_name, "logs-apm-templates.csv"), counts)
+
+def window_outputs(info:Dict, parquet_dir:str=None, segment_dir:str=None) -> Dict:
+    """Load keywords for the chunk's Parquet sink and segment writer, see pipeline.run_window."""
+    return {
+        "sink": window_sink(parquet_dir, SOURCE, Transform.SCHEMA, info, Transform.TIME_COLUMN) if parquet_dir else None,
+        "segment": window_segment(segment_dir, SOURCE, info, Transform.TIME_COLUMN) if segment_dir else None,
+    }
+
+def run_window(info:Dict, save_dir:str="./logs/", **options):
+    """Extract, transform and load one cut_off chunk, see pipeline.run_window. Returns the windows that failed."""
+    return pipeline.run_window(sys.modules[__name__], info, save_dir, **options)
+
 def run_etl(
     url:str="https://116.101.122.180:5200/metric-apm-*/_search",
     api_key:str=None,
@@ -167,34 +274,10 @@ def run_etl(
     end_time:str="2024-12-15T00:00:00.000Z",
     step:int=2,
     limit:int=5000,
-    cut_off:int=2000 # unit is seconds
+    cut_off:int=2000, # unit is seconds
+    **options # concurrency, stream, dedup, checkpoint, save_dir, ..., see pipeline.run_etl
 ):
-    start_dt = datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S.%fZ")
-    end_dt = datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%S.%fZ")
-    current_start = start_dt
-    while current_start < end_dt:
-        current_end = min(current_start + timedelta(seconds=cut_off), end_dt)
-
-        new_start_time = current_start.isoformat(timespec="milliseconds").replace("+00:00", "")+"Z"
-        new_end_time = current_end.isoformat(timespec="milliseconds").replace("+00:00", "")+"Z"
-
-        print("Getting logs from {} to {}".format(new_start_time, new_end_time))
-
-        info = {
-            "url":url,
-            "api_key":api_key,
-            "start_time":new_start_time,
-            "end_time":new_end_time,
-            "step":step,
-            "limit":limit
-        }
-        logs = ExtractMetricApmLogs(
-            **info
-        ).get_log()
-        logs = Transform(logs=logs).exact_log()
-        Load(logs, info, save_dir=f"./logs/")
-
-        current_start = datetime.strptime(new_start_time, "%Y-%m-%dT%H:%M:%S.%fZ") + timedelta(seconds=cut_off)
+    pipeline.run_etl(sys.modules[__name__], url=url, api_key=api_key, start_time=start_time, end_time=end_time, step=step, limit=limit, cut_off=cut_off, **options)
 
 if __name__ == "__main__":
 
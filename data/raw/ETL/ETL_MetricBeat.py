@@ -1,10 +1,23 @@
-import requests
-from datetime import datetime, timedelta
 from tqdm import tqdm
 import warnings
 from typing import Dict, List, Any
 import os
-import json, csv
+import sys
+import csv
+from server_log_analysis.etl.client import get_session
+from server_log_analysis.etl.decode import loads_search
+from server_log_analysis.etl.fetch import count_windows, iter_windows, stream_windows
+from server_log_analysis.etl.paginate import iter_pages
+from server_log_analysis.etl.parquet_sink import ParquetSink, window_sink
+from server_log_analysis.etl import pipeline
+from server_log_analysis.etl.planner import AdaptiveWindowPlanner
+from server_log_analysis.etl.schema import Field, Schema
+from server_log_analysis.etl.segments import SegmentWriter, window_segment
+from server_log_analysis.etl.source_filter import FILTER_PATH, source_includes
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+from server_log_analysis.etl.writer import atomic_open, write_tables
+
+SOURCE = "metricbeat"
 
 class ExtractMetricBeatLogs:
     def __init__(
@@ -14,7 +27,8 @@ class ExtractMetricBeatLogs:
         start_time:str="2024-12-14T00:00:00.000Z", 
         end_time:str="2024-12-15T00:00:00.000Z", 
         step:int=500,
-        limit:int=5000
+        limit:int=5000,
+        source_fields:List[str]=None
     ):
         warnings.filterwarnings("ignore")
 
@@ -24,6 +38,8 @@ class ExtractMetricBeatLogs:
         self.end_time = end_time
         self.step = step
         self.limit = limit
+        self.failed_windows = []
+        self.source_fields = source_fields
     
     @property    
     def __headers(self):
@@ -32,8 +48,8 @@ class ExtractMetricBeatLogs:
             "Content-Type": "application/json"
         }
         
-    def __data(self, query_time):
-        return {
+    def __data(self, query_time, start_time=None):
+        data = {
             "from": 0,
             "size": self.limit,
             "query": {
@@ -48,7 +64,7 @@ class ExtractMetricBeatLogs:
                         {
                             "range": {
                                 "@timestamp": {
-                                    "gte": self.start_time,
+                                    "gte": start_time or self.start_time,
                                     "lte": query_time,
                                     "format": "strict_date_optional_time"
                                 }
@@ -65,6 +81,9 @@ class ExtractMetricBeatLogs:
                 }
             ]
         }
+        if self.source_fields:
+            data["_source"] = {"includes": source_includes(self.source_fields)}
+        return data
     
     def process_response(self, response):
         # if response.status_code!=200:
@@ -74,149 +93,170 @@ class ExtractMetricBeatLogs:
         data = response
         length = data['hits']["total"]["value"]
         miss_count = self.limit-length
-        logs = data['hits']["hits"]
+        logs = data['hits'].get('hits', [])
         return logs, length, miss_count
         
     def get_log(self)->List[Dict[str, Any]]:
-        LOGS = []
+        LOGS = {} # window start -> its logs, in window order
         
-        start_dt = datetime.strptime(self.start_time, "%Y-%m-%dT%H:%M:%S.%fZ")
-        end_dt = datetime.strptime(self.end_time, "%Y-%m-%dT%H:%M:%S.%fZ") 
-        delta = end_dt - start_dt
-        milliseconds = int(delta.total_seconds() * 1000)
+        start_ms = parse_iso_ms(self.start_time)
+        end_ms = parse_iso_ms(self.end_time)
         
-        for _ in tqdm(range(0, milliseconds, self.step), desc="Extracting"):
-            current_time = datetime.strptime(self.start_time, "%Y-%m-%dT%H:%M:%S.%fZ") + timedelta(milliseconds=self.step)
-            query_time = current_time.isoformat(timespec="milliseconds").replace("+00:00", "")+"Z"
+        for offset in tqdm(range(0, end_ms - start_ms, self.step), desc="Extracting"):
+            query_time = format_iso_ms(start_ms + offset + self.step)
             try:
-                # response = requests.get(self.url, headers=self.__headers, json=self.__data(query_time), verify=False, timeout=15)
-                with open('D:\Job\Viettel\Intern\ETL\ETL\logs\metricbeat-.json', 'r') as f:
-                    response = json.load(f)
-                
-                if self.process_response(response):
-                    log, length, miss_count = self.process_response(response)
-                    if miss_count<0:
-                        print(f"Missed {abs(miss_count)} lines from metricbeat-Logging")
-                    LOGS+=log
+                log, length, miss_count = self.search_window(self.start_time, query_time)
+                if miss_count<0:
+                    print(f"Missed {abs(miss_count)} lines from metricbeat-Logging")
+                LOGS[self.start_time] = log
             except Exception as e:
                 print(f"An error occurred: {type(e).__name__} - {e}")
+                self.failed_windows.append((self.start_time, query_time))
+                LOGS[self.start_time] = []
             
-            self.start_time = current_time.isoformat(timespec="milliseconds").replace("+00:00", "")+"Z"
-        return LOGS
-   
+            self.start_time = query_time
+        # A retried window goes back in its slot, so LOGS stays in timestamp order
+        LOGS.update(self.retry_failed_windows())
+        return [log for logs in LOGS.values() for log in logs]
+
+    def search_window(self, start_time, query_time):
+        response = get_session().get(self.url, headers=self.__headers, params={"filter_path": FILTER_PATH}, json=self.__data(query_time, start_time), timeout=15)
+        response.raise_for_status()
+        includes = source_includes(self.source_fields) if self.source_fields else None
+        return self.process_response(loads_search(response.content, includes))
+
+    def fetch_window(self, start_time, query_time)->List[Dict[str, Any]]:
+        try:
+            logs, length, miss_count = self.search_window(start_time, query_time)
+            if miss_count<0:
+                print(f"Missed {abs(miss_count)} lines from metricbeat-Logging")
+            return logs
+        except Exception as e:
+            print(f"An error occurred: {type(e).__name__} - {e}")
+            self.failed_windows.append((start_time, query_time))
+            return []
+
+    def iter_log_async(self, concurrency:int=8):
+        """Fetch the same windows as get_log, keeping `concurrency` requests in flight. Retried windows come last."""
+        windows = iter_windows(self.start_time, self.end_time, self.step)
+        total = count_windows(self.start_time, self.end_time, self.step)
+        yield from stream_windows(self.fetch_window, windows, concurrency, total=total)
+        yield from (logs for _, logs in self.retry_failed_windows())
+
+    def retry_failed_windows(self):
+        """Fetch the failed windows once more, after all the others, as (start_time, logs). Windows failing again stay in failed_windows."""
+        failed, self.failed_windows = self.failed_windows, []
+        for start_time, query_time in failed:
+            yield start_time, self.fetch_window(start_time, query_time)
+
+    def iter_log_paginated(self, page_size:int=None, pit_keep_alive:str=None):
+        """Drain [start_time, end_time] with search_after pages instead of `step` windows."""
+        try:
+            pages = iter_pages(self.url, self.__headers, self.__data(self.end_time), page_size or self.limit, pit_keep_alive)
+            yield from tqdm(pages, desc="Extracting")
+        except Exception as e:
+            print(f"An error occurred: {type(e).__name__} - {e}")
+            self.failed_windows.append((self.start_time, self.end_time))
+
+    def iter_log_adaptive(self, min_step:int=1, max_step:int=None):
+        """Walk [start_time, end_time] with windows sized from the hits.total of the previous one."""
+        planner = AdaptiveWindowPlanner(self.step, self.limit, min_step, max_step)
+        yield from tqdm(planner.run(self.search_window, self.start_time, self.end_time), desc="Extracting")
+        print(planner.summary())
+        self.failed_windows += planner.failed_windows
+
+    def iter_log(self, concurrency:int=None, paginate:bool=False, pit_keep_alive:str=None, adaptive:bool=False, min_step:int=1, max_step:int=None):
+        """Yield the logs one page batch at a time, in timestamp order (retried windows last), without keeping them."""
+        if paginate:
+            return self.iter_log_paginated(pit_keep_alive=pit_keep_alive)
+        if adaptive:
+            return self.iter_log_adaptive(min_step, max_step)
+        return self.iter_log_async(concurrency or 1)
+
+    def get_log_async(self, concurrency:int=8)->List[Dict[str, Any]]:
+        windows = list(iter_windows(self.start_time, self.end_time, self.step))
+        LOGS = dict(zip((start for start, _ in windows), stream_windows(self.fetch_window, windows, concurrency, total=len(windows))))
+        # Retried windows go back in their slot, as in get_log
+        LOGS.update(self.retry_failed_windows())
+        return [log for logs in LOGS.values() for log in logs]
+
+    def get_log_paginated(self, page_size:int=None, pit_keep_alive:str=None)->List[Dict[str, Any]]:
+        return [log for logs in self.iter_log_paginated(page_size, pit_keep_alive) for log in logs]
+
+    def get_log_adaptive(self, min_step:int=1, max_step:int=None)->List[Dict[str, Any]]:
+        return [log for logs in self.iter_log_adaptive(min_step, max_step) for log in logs]
+
 class Transform():
+    # Columns shared by every metricset
+    COMMON = {
+        "timestamp": Field("@timestamp", "N/A", dtype="str"),
+        "env": Field("env", "N/A", dtype="str"),
+        "host_name": Field("host.name", "N/A", dtype="str"),
+    }
+    # Output columns of each metricset as _source paths with defaults and units, compiled once
+    SCHEMAS = {
+        "cpu": Schema({
+            **COMMON,
+            "cpu_total": Field("system.cpu.total.pct", "N/A", dtype="float"),
+            "cpu_user": Field("system.cpu.user.pct", "N/A", dtype="float"),
+            "cpu_system": Field("system.cpu.system.pct", "N/A", dtype="float"),
+            "cpu_iowait": Field("system.cpu.iowait.pct", "N/A", dtype="float"),
+        }),
+        "memory": Schema({
+            **COMMON,
+            "total_memory": Field("system.memory.total", 0, "value / (1024**3)", "float"), #GB
+            "used_memory": Field("system.memory.used.pct", 0, "value * 100", "float"),
+            "free_memory": Field("system.memory.free", 0, "value / (1024**3)", "float"),
+            "cached_memory": Field("system.memory.cached", 0, "value / (1024**3)", "float"),
+        }),
+        "load": Schema({
+            **COMMON,
+            "cores": Field("system.load.cores", "N/A", dtype="int"),
+            "load_1": Field("system.load.1", "N/A", dtype="float"),
+            "load_5": Field("system.load.5", "N/A", dtype="float"),
+            "load_15": Field("system.load.15", "N/A", dtype="float"),
+        }),
+        "network": Schema({
+            **COMMON,
+            "interface_name": Field("system.network.name", "N/A", dtype="str"),
+            "in_bytes": Field("system.network.in.bytes", 0, "value / (1024**2)", "float"), #MB
+            "out_bytes": Field("system.network.out.bytes", 0, "value / (1024**2)", "float"),
+        }),
+    }
+    # _source paths read by SCHEMAS, requested with _source.includes by the extractor
+    FIELDS = sorted({"metricset.name"}.union(*(schema.fields for schema in SCHEMAS.values())))
+    # Column whose time picks the Parquet partition
+    TIME_COLUMN = "timestamp"
+
     def __init__(self, logs:List=None):
         self.logs = logs
         
     def extract_system_resource_logs(self, entry):
-        
         log_source = entry.get("_source", {})
-        timestamp = log_source.get("@timestamp", "N/A")
-        host_name = log_source.get("host", {}).get("name", "N/A")
         metricset = log_source.get("metricset", {}).get("name", "N/A")
-        env = log_source.get("env", "N/A")
-        
-        # Extract CPU
-        if metricset == "cpu":
-            cpu_info = log_source.get("system", {}).get("cpu", {})
-            cpu_total = cpu_info.get("total", {}).get("pct", "N/A")
-            cpu_user = cpu_info.get("user", {}).get("pct", "N/A")
-            cpu_system = cpu_info.get("system", {}).get("pct", "N/A")
-            cpu_iowait = cpu_info.get("iowait", {}).get("pct", "N/A")
-            logline = {
-                "timestamp": timestamp,
-                "env": env,
-                "host_name": host_name,
-                "cpu_total": cpu_total,
-                "cpu_user": cpu_user,
-                "cpu_system": cpu_system,
-                "cpu_iowait": cpu_iowait
-            }
-            # logline = (
-            #     f"[{timestamp}] ENV: {env} | HOST: {host_name} | CPU: "
-            #     f"Total: {cpu_total:.4f}%, User: {cpu_user:.4f}%, System: {cpu_system:.4f}%, IOwait: {cpu_iowait:.4f}%"
-            # )
-            return logline
-        
-        # Extract RAM
-        elif metricset == "memory":
-            memory_info = log_source.get("system", {}).get("memory", {})
-            total_memory = memory_info.get("total", 0) / (1024**3)  #GB
-            used_memory = memory_info.get("used", {}).get("pct", 0) * 100
-            free_memory = memory_info.get("free", 0) / (1024**3)
-            cached_memory = memory_info.get("cached", 0) / (1024**3)
-            logline = {
-                "timestamp": timestamp,
-                "env": env,
-                "host_name": host_name,
-                "total_memory": total_memory,
-                "used_memory": used_memory,
-                "free_memory": free_memory,
-                "cached_memory": cached_memory
-            }
-            # logline = (
-            #     f"[{timestamp}] ENV: {env} | HOST: {host_name} | MEMORY: "
-            #     f"Total: {total_memory:.2f} GB, Used: {used_memory:.2f}%, Free: {free_memory:.2f} GB, Cached: {cached_memory:.2f} GB"
-            # )
-            return logline
-        
-        # Extract system load
-        elif metricset == "load":
-            load_info = log_source.get("system", {}).get("load", {})
-            cores = load_info.get("cores", "N/A")
-            load_1 = load_info.get("1", "N/A")
-            load_5 = load_info.get("5", "N/A")
-            load_15 = load_info.get("15", "N/A")
-            logline = {
-                "timestamp": timestamp,
-                "env": env,
-                "host_name": host_name,
-                "cores": cores,
-                "load_1": load_1,
-                "load_5": load_5,
-                "load_15": load_15
-            }
-            # logline = (
-            #     f"[{timestamp}] ENV: {env} | HOST: {host_name} | LOAD: "
-            #     f"1min: {load_1:.2f}, 5min: {load_5:.2f}, 15min: {load_15:.2f}, Cores: {cores}"
-            # )
-            return logline
-        
-        # Extract Networks
-        elif metricset == "network":
-            network_info = log_source.get("system", {}).get("network", {})
-            interface_name = network_info.get("name", "N/A")
-            in_bytes = network_info.get("in", {}).get("bytes", 0) / (1024**2) #BYTES
-            out_bytes = network_info.get("out", {}).get("bytes", 0) / (1024**2)
-            logline = {
-                "timestamp": timestamp,
-                "env": env,
-                "host_name": host_name,
-                "interface_name": interface_name,
-                "in_bytes": in_bytes,
-                "out_bytes": out_bytes
-            }
-            # logline = (
-            #     f"[{timestamp}] ENV: {env} | HOST: {host_name} | NETWORK ({interface_name}): "
-            #     f"IN: {in_bytes:.2f} MB, OUT: {out_bytes:.2f} MB"
-            # )
-            return logline
-        else:
-            return {}
+        schema = self.SCHEMAS.get(metricset)
+        # Load counts unknown metricsets by name instead of writing them
+        return schema.extract(log_source) if schema else {"metricset": metricset}
 
-    
     def exact_log(self):
-        LOGS_EXTRACTED = [json.dumps(self.extract_system_resource_logs(log), indent=2) + '\n' for log in tqdm(self.logs, desc="Transforming")]
+        LOGS_EXTRACTED = [self.extract_system_resource_logs(log) for log in tqdm(self.logs, desc="Transforming")]
 
         # LOGS_EXTRACTED = [self.extract_system_resource_logs(log)+"\n" for log in tqdm(self.logs, desc="Transforming")]
-        return LOGS_EXTRACTED         
+        return LOGS_EXTRACTED
+
+    def iter_log(self, batches):
+        """Lazily transform page batches from Extract.iter_log, one batch at a time."""
+        for logs in batches:
+            yield [self.extract_system_resource_logs(log) for log in logs]         
 
 class Load:
-    def __init__(self, logs:List, log_info:Dict, save_dir:str):
+    def __init__(self, logs:List, log_info:Dict, save_dir:str, stream:bool=False, sinks:Dict[str, ParquetSink]=None, segment:SegmentWriter=None):
         self.logs = logs
         self.log_info = log_info
         self.save_dir = save_dir
-        self.run()
+        self.sinks = sinks
+        self.segment = segment
+        self.run_stream() if stream else self.run()
     
     @property
     def log_name(self):
@@ -224,65 +264,61 @@ class Load:
         end_time = self.log_info["end_time"].replace(":", "_").replace("T", "_").replace(".", "_")
         return os.path.join(self.save_dir, f"metrics-beat-{start_time}-{end_time}")
 
-    def run(self):     
-         # Write to txt file
+    def run(self):
+        self.write([self.logs])
+
+    def run_stream(self):
+        """Write batches from Transform.iter_log as they arrive, see run."""
+        self.write(self.logs)
+
+    def write(self, batches):
+        """
+        Each metricset to its own typed table, metrics-beat-<metricset>.csv,
+        instead of one CSV over the union of their columns. Unknown metricsets
+        are counted in metrics-beat-unknown.csv, header only when there are none. With sinks, each table is also
+        written to Parquet as source=metricbeat-<metricset>.
+        """
         os.makedirs(self.log_name, exist_ok=True)
-        with open(os.path.join(self.log_name, "metrics-beat-logs.txt"), 'w', encoding='utf-8') as f:
-            for log in tqdm(self.logs, desc="Loading"):
-                f.write(log)
+        batches = self.segment.tap(batches) if self.segment else batches
+        unknown = write_tables(
+            batches,
+            os.path.join(self.log_name, "metrics-beat-logs.txt"),
+            Transform.SCHEMAS,
+            lambda metricset: os.path.join(self.log_name, f"metrics-beat-{metricset}.csv"),
+            lambda record: record.get("metricset", "N/A"),
+            self.sinks,
+        )
+        if unknown:
+            print(f"Skipped {sum(unknown.values())} logs of unknown metricsets: {dict(unknown)}")
+        # Written even when empty, so a rerun replaces the counts of an earlier one
+        with atomic_open(os.path.join(self.log_name, "metrics-beat-unknown.csv"), newline='') as csvfile:
+            csv_writer = csv.writer(csvfile)
+            csv_writer.writerow(["metricset", "count"])
+            csv_writer.writerows(unknown.most_common())
 
-        # Write logs to a CSV file
-        with open(os.path.join(self.log_name, "metrics-beat-logs.csv"), 'w', encoding='utf-8', newline='') as csvfile:
-            fieldnames = set()
-            for log in self.logs:
-                fieldnames.update(json.loads(log).keys())
-            fieldnames = sorted(fieldnames)
+def window_outputs(info:Dict, parquet_dir:str=None, segment_dir:str=None) -> Dict:
+    """Load keywords for the chunk's Parquet sinks, one per table, and segment writer, see pipeline.run_window."""
+    return {
+        "sinks": {name: window_sink(parquet_dir, f"{SOURCE}-{name}", schema, info, Transform.TIME_COLUMN) for name, schema in Transform.SCHEMAS.items()} if parquet_dir else None,
+        "segment": window_segment(segment_dir, SOURCE, info, Transform.TIME_COLUMN) if segment_dir else None,
+    }
 
-            csv_writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            csv_writer.writeheader()  
+def run_window(info:Dict, save_dir:str="./logs/", **options):
+    """Extract, transform and load one cut_off chunk, see pipeline.run_window. Returns the windows that failed."""
+    return pipeline.run_window(sys.modules[__name__], info, save_dir, **options)
 
-            for log in tqdm(self.logs, desc="Writing to CSV file"):
-                flattened_log = {key: (json.dumps(value) if isinstance(value, (dict, list)) else value) for key, value in json.loads(log).items()}
-                csv_writer.writerow(flattened_log)
-        
 def run_etl(
     url:str="https://116.101.122.180:5200/metricbeat-*/_search",
     api_key:str=None,
-    start_time:str="2024-12-14T00:00:00.000Z", 
-    end_time:str="2024-12-15T00:00:00.000Z", 
+    start_time:str="2024-12-14T00:00:00.000Z",
+    end_time:str="2024-12-15T00:00:00.000Z",
     step:int=1000,
     limit:int=5000,
-    cut_off:int=4000 # unit is seconds
+    cut_off:int=4000, # unit is seconds
+    **options # concurrency, stream, dedup, checkpoint, save_dir, ..., see pipeline.run_etl
 ):
-    
-    start_dt = datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S.%fZ")
-    end_dt = datetime.strptime(end_time, "%Y-%m-%dT%H:%M:%S.%fZ")
-    current_start = start_dt
-    while current_start < end_dt:
-        current_end = min(current_start + timedelta(seconds=cut_off), end_dt)
-        
-        new_start_time = current_start.isoformat(timespec="milliseconds").replace("+00:00", "")+"Z"
-        new_end_time = current_end.isoformat(timespec="milliseconds").replace("+00:00", "")+"Z"
-        
-        print("Getting logs from {} to {}".format(new_start_time, new_end_time))
-        
-        info = {
-            "url":url,
-            "api_key":api_key,
-            "start_time":new_start_time, 
-            "end_time":new_end_time, 
-            "step":step,
-            "limit":limit
-        }
-        logs = ExtractMetricBeatLogs(
-            **info
-        ).get_log()
-        logs = Transform(logs=logs).exact_log()
-        Load(logs, info, save_dir=f"./logs/")
-        
-        current_start = datetime.strptime(new_start_time, "%Y-%m-%dT%H:%M:%S.%fZ") + timedelta(seconds=cut_off)
-        
-    
+    pipeline.run_etl(sys.modules[__name__], url=url, api_key=api_key, start_time=start_time, end_time=end_time, step=step, limit=limit, cut_off=cut_off, **options)
+
 if __name__ == "__main__":
     
     time_collect = [
@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
-import re
-from datetime import datetime
+from server_log_analysis.etl.access_log import NUMERIC_GROUPS, parse_file
+from server_log_analysis.etl.column_cache import write_cache
+from server_log_analysis.etl.timestamps import clf_to_datetime
 
 class LogTransform:
     def __init__(self, source_path):
@@ -14,24 +15,20 @@ class LogTransform:
         self.source_path = source_path
         self.log_pattern = None
 
-    def read_log_file(self, regex_exp):
+    def read_log_file(self, regex_exp, workers=None):
         """
         Read and parse the log file based on the defined pattern.
 
         :param regex_exp: Regex expression of logs
-        :return: List of parsed log entries as dictionaries
+        :param workers: Processes for large files, defaults to the number of cores
+        :return: DataFrame of parsed log entries, one column per named group
         """
         # Define the log pattern for parsing
         self.log_pattern = regex_exp
 
-        with open(self.source_path, 'r') as file:
-            log_lines = file.readlines()
-            parsed_logs = [
-                re.match(self.log_pattern, line).groupdict()
-                for line in log_lines if re.match(self.log_pattern, line)
-            ]
+        parsed_logs = parse_file(self.source_path, self.log_pattern, numeric=NUMERIC_GROUPS, workers=workers)
         print(f"Parsed {len(parsed_logs)} log entries.")
-        return pd.DataFrame(parsed_logs)
+        return parsed_logs
 
     def transform(self, parsed_logs):
         """
@@ -41,7 +38,7 @@ class LogTransform:
         :return: Preprocessed DataFrame
         """
         df = parsed_logs
-        df['datetime'] = df['datetime'].apply(lambda x: datetime.strptime(x, "%d/%b/%Y:%H:%M:%S %z"))
+        df['datetime'] = clf_to_datetime(df['datetime'])
         df['method'] = df['method'].replace({'GET': 0, 'POST': 1})
         df['bytes_sent'] = pd.to_numeric(df['bytes_sent'], errors='coerce')
         df['status'] = pd.to_numeric(df['status'], errors='coerce')
@@ -50,6 +47,17 @@ class LogTransform:
         df['month'] = df['datetime'].dt.month
         return df
 
+    def save(self, df, destination_path):
+        """
+        Write the transformed DataFrame to CSV, with a memory-mapped columnar cache next to it.
+
+        :param df: DataFrame from transform
+        :param destination_path: CSV path; the cache is destination_path + ".cache",
+            read back by column_cache.read_parsed (and Visualize) in milliseconds
+        """
+        df.to_csv(destination_path)
+        write_cache(df, destination_path)
+
 
 # # Example usage
 # if __name__ == "__main__":
@@ -59,4 +67,4 @@ class LogTransform:
 #     transformer = Transform(source_path)
 #     df = transform.read_log_file(log_pattern)
 #     df = transform.transform(df)
-#     df.to_csv(destination_path)
+#     transform.save(df, destination_path)
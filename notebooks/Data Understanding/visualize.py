@@ -1,19 +1,58 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
+from server_log_analysis.etl.column_cache import read_parsed
+from server_log_analysis.etl.rollups import coarsen, read_rollups
+
+# Log level của từng status class trong rollup
+LOG_LEVELS = {"2xx": "INFO", "3xx": "WARNING", "4xx": "ERROR", "5xx": "FATAL"}
 
 class Visualize:
-    def __init__(self, log_path):
-        self.log_df = pd.read_csv(log_path)
-        self.log_df['datetime'] = pd.to_datetime(self.log_df['datetime'], errors='coerce') 
-        self.log_df['hour'] = self.log_df['datetime'].dt.hour
+    def __init__(self, log_path=None, rollup_dir=None, start_time=None, end_time=None, tz=None):
+        """
+        :param log_path: File CSV log đã parse, mở qua cache dạng cột (memory-mapped) cạnh file,
+            cache được tạo lại khi file thay đổi
+        :param rollup_dir: Thư mục rollup theo phút (run_etl(rollup_dir=...)); nếu có,
+            các biểu đồ lưu lượng đọc rollup theo giờ trong [start_time, end_time) thay vì log_df
+        :param tz: Múi giờ để tính giờ trong ngày từ rollup, ví dụ "Asia/Ho_Chi_Minh". Mặc định là
+            offset của log_path, để giờ khớp với các biểu đồ vẽ từ log_df; nếu chỉ có rollup_dir
+            thì mặc định là UTC, vì rollup lưu thời gian theo UTC
+        """
+        self.log_df = None
+        self.rollups = None
+        if log_path:
+            self.log_df = read_parsed(log_path)
+            self.log_df['datetime'] = pd.to_datetime(self.log_df['datetime'], errors='coerce') 
+            self.log_df['hour'] = self.log_df['datetime'].dt.hour
+        if rollup_dir:
+            self.rollups = read_rollups(rollup_dir, "kong", start_time, end_time, freq="h", dimensions=("status_class", "method"))
+            self.rollups['hour'] = self.rollups['time'].dt.tz_convert(tz or self.log_tz() or "UTC").dt.hour
+
+    def log_tz(self):
+        """
+        Múi giờ (offset) của cột datetime trong log_df, None nếu không có log_df hoặc log lẫn nhiều offset.
+        """
+        if self.log_df is None or not isinstance(self.log_df['datetime'].dtype, pd.DatetimeTZDtype):
+            return None
+        return self.log_df['datetime'].dt.tz
+
+    def rollup(self, freq="D"):
+        """
+        Rollup gộp theo freq ("h" hoặc "D"), một dòng mỗi khoảng thời gian.
+        """
+        return coarsen(self.rollups, freq, dimensions=()).set_index('time')
     
     def plot_errors_over_time(self):
         """
         Vẽ biểu đồ đường thể hiện số lượng lỗi và request hợp lệ qua thời gian.
         """
-        self.log_df['request_type'] = self.log_df['status'].apply(lambda x: 'Lỗi' if x >= 400 else 'Hợp lệ')
-        hourly_counts = self.log_df.groupby(['hour', 'request_type']).size().unstack(fill_value=0)
+        if self.rollups is not None:
+            hourly = self.rollups.groupby('hour')[['requests', 'errors']].sum()
+            hourly_counts = pd.DataFrame({'Hợp lệ': hourly['requests'] - hourly['errors'], 'Lỗi': hourly['errors']})
+            hourly_counts.columns.name = 'request_type'
+        else:
+            self.log_df['request_type'] = self.log_df['status'].apply(lambda x: 'Lỗi' if x >= 400 else 'Hợp lệ')
+            hourly_counts = self.log_df.groupby(['hour', 'request_type']).size().unstack(fill_value=0)
         
         # In ra dữ liệu
         print("Số lượng lỗi và request hợp lệ qua từng giờ:")
@@ -33,7 +72,10 @@ class Visualize:
         """
         Vẽ biểu đồ tròn thể hiện phân bố các loại request (GET, POST, PUT, DELETE,...).
         """
-        request_counts = self.log_df['method'].value_counts()
+        if self.rollups is not None:
+            request_counts = self.rollups.groupby('method')['requests'].sum().sort_values(ascending=False)
+        else:
+            request_counts = self.log_df['method'].value_counts()
         
         # In ra dữ liệu
         print("Phân bố các loại request:")
@@ -49,7 +91,10 @@ class Visualize:
         """
         Vẽ biểu đồ đường thể hiện tổng lượng dữ liệu gửi đi mỗi giờ.
         """
-        hourly_bytes_sent = self.log_df.groupby('hour')['bytes_sent'].sum()
+        if self.rollups is not None:
+            hourly_bytes_sent = self.rollups.groupby('hour')['bytes_sent'].sum()
+        else:
+            hourly_bytes_sent = self.log_df.groupby('hour')['bytes_sent'].sum()
         
         # In ra dữ liệu
         print("Tổng lượng dữ liệu gửi đi mỗi giờ:")
@@ -80,8 +125,12 @@ class Visualize:
             else:
                 return "DEBUG"
         
-        self.log_df['log_level'] = self.log_df['status'].apply(classify_log_level)
-        log_level_counts = self.log_df['log_level'].value_counts()
+        if self.rollups is not None:
+            levels = self.rollups['status_class'].map(LOG_LEVELS).fillna("DEBUG")
+            log_level_counts = self.rollups.groupby(levels.rename('log_level'))['requests'].sum().sort_values(ascending=False)
+        else:
+            self.log_df['log_level'] = self.log_df['status'].apply(classify_log_level)
+            log_level_counts = self.log_df['log_level'].value_counts()
 
         # In ra dữ liệu
         print("Số lượng log từng loại:")
@@ -99,6 +148,8 @@ class Visualize:
         """
         Vẽ biểu đồ thanh ngang thể hiện phân bố các loại user agent trong log.
         """
+        if self.log_df is None:
+            raise ValueError("plot_user_agent_distribution cần log_path: rollup không lưu user agent")
         user_agent_counts = self.log_df['user_agent'].value_counts().head(10)  # Lấy 10 user agent phổ biến nhất
         
         print("Số lượng log theo các loại user agent:")
@@ -0,0 +1,16 @@
+import typer
+
+from server_log_analysis import dataset, query
+
+app = typer.Typer()
+app.command("etl")(dataset.main)
+app.command("query")(query.main)
+
+
+@app.callback()
+def main():
+    """Server log analysis command line."""
+
+
+if __name__ == "__main__":
+    app()
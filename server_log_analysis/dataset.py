@@ -1,28 +1,127 @@
 from pathlib import Path
+from typing import List
 
 import typer
 from loguru import logger
-from tqdm import tqdm
 
-from server_log_analysis.config import PROCESSED_DATA_DIR, RAW_DATA_DIR
+from server_log_analysis.config import RAW_DATA_DIR
+from server_log_analysis.etl.dedup import CAPACITY, ERROR_RATE
+from server_log_analysis.etl.orchestrate import run_backfill
+from server_log_analysis.etl.rollups import ROLLUP_SOURCES, rollup_stores
+from server_log_analysis.etl.segments import SegmentStore
+from server_log_analysis.etl.sources import SCRIPTS
 
 app = typer.Typer()
 
 
 @app.command()
 def main(
-    # ---- REPLACE DEFAULT PATHS AS APPROPRIATE ----
-    input_path: Path = RAW_DATA_DIR / "dataset.csv",
-    output_path: Path = PROCESSED_DATA_DIR / "dataset.csv",
-    # ----------------------------------------------
+    start_time: str = typer.Argument(..., help="e.g. 2024-12-22T00:00:00.000Z"),
+    end_time: str = typer.Argument(..., help="e.g. 2024-12-25T00:00:00.000Z"),
+    source: List[str] = typer.Option(list(SCRIPTS), help="Sources to extract, repeatable"),
+    host: str = "https://116.101.122.180:5200",
+    api_key: str = typer.Option("", envvar="ELASTIC_API_KEY"),
+    output_dir: Path = RAW_DATA_DIR / "ETL" / "logs",
+    workers: int = typer.Option(None, help="Processes, defaults to the number of cores"),
+    max_per_source: int = 2,
+    cap: List[str] = typer.Option([], help="Per-source cap as source=N, repeatable"),
+    step: int = typer.Option(None, help="Window in ms, defaults to each source's setting"),
+    limit: int = None,
+    cut_off: int = typer.Option(None, help="Chunk in seconds, defaults to each source's setting"),
+    concurrency: int = None,
+    paginate: bool = False,
+    pit_keep_alive: str = None,
+    adaptive: bool = False,
+    stream: bool = False,
+    transform_workers: int = typer.Option(
+        None, help="Processes transforming each chunk, default in its own"
+    ),
+    transform_chunk: int = typer.Option(5000, help="Hits per chunk sent to a transform worker"),
+    parquet_dir: Path = typer.Option(
+        None, help="Also write a Parquet dataset partitioned by source/date/hour"
+    ),
+    segment_dir: Path = typer.Option(
+        None, help="Also append to a time-indexed segment store per source"
+    ),
+    compact: bool = typer.Option(
+        True,
+        help="Merge the small segments (and rollup segments) of each source after the backfill",
+    ),
+    dedup: bool = typer.Option(False, help="Drop hits whose _id this backfill already fetched"),
+    dedup_dir: Path = typer.Option(
+        None, help="Also drop _ids loaded before, kept in a Bloom filter per source"
+    ),
+    dedup_error_rate: float = typer.Option(
+        ERROR_RATE, help="False-positive rate of a new dedup Bloom filter"
+    ),
+    dedup_capacity: int = typer.Option(
+        CAPACITY, help="_ids a dedup Bloom filter holds before the next generation starts"
+    ),
+    rollup_dir: Path = typer.Option(
+        None, help="Also maintain per-minute Kong traffic rollups, read by Visualize"
+    ),
+    templates: bool = typer.Option(
+        False, help="Store Kong and logs-apm messages as template ids and params in the CSVs"
+    ),
+    checkpoint: Path = None,
+    retries: int = typer.Option(1, help="Times a failed chunk is retried at the end"),
 ):
-    # ---- REPLACE THIS WITH YOUR OWN CODE ----
-    logger.info("Processing dataset...")
-    for i in tqdm(range(10), total=10):
-        if i == 5:
-            logger.info("Something happened for iteration 5.")
-    logger.success("Processing dataset complete.")
-    # -----------------------------------------
+    """Backfill all ETL sources over a time range on a process pool."""
+    unknown = set(source) - set(SCRIPTS)
+    if unknown:
+        raise typer.BadParameter(f"Unknown sources {sorted(unknown)}, choose from {list(SCRIPTS)}")
+    caps = {name: int(n) for name, n in (item.split("=", 1) for item in cap)}
+
+    logger.info(f"Extracting {', '.join(source)} from {start_time} to {end_time}...")
+    summary = run_backfill(
+        source,
+        start_time,
+        end_time,
+        host=host,
+        api_key=api_key,
+        save_dir=str(output_dir),
+        workers=workers,
+        max_per_source=max_per_source,
+        caps=caps,
+        step=step,
+        limit=limit,
+        cut_off=cut_off,
+        checkpoint=str(checkpoint) if checkpoint else None,
+        retries=retries,
+        concurrency=concurrency,
+        paginate=paginate,
+        pit_keep_alive=pit_keep_alive,
+        adaptive=adaptive,
+        stream=stream,
+        transform_workers=transform_workers,
+        transform_chunk=transform_chunk,
+        parquet_dir=str(parquet_dir) if parquet_dir else None,
+        segment_dir=str(segment_dir) if segment_dir else None,
+        dedup=dedup,
+        dedup_dir=str(dedup_dir) if dedup_dir else None,
+        dedup_error_rate=dedup_error_rate,
+        dedup_capacity=dedup_capacity,
+        rollup_dir=str(rollup_dir) if rollup_dir else None,
+        templates=templates,
+    )
+    if segment_dir and compact:
+        for name in source:
+            merged = SegmentStore(str(segment_dir), name).compact()
+            logger.info(f"Compacted {merged} segments of {name}")
+    if rollup_dir and compact:
+        for store in [
+            store
+            for name in source
+            if name in ROLLUP_SOURCES
+            for store in rollup_stores(str(rollup_dir), name)
+        ]:
+            merged = store.compact()
+            logger.info(f"Compacted {merged} rollup segments of {store.source}")
+    logger.success(
+        f"Extraction complete: {summary['chunks']} chunks, "
+        f"{summary['skipped']} skipped, {summary['retried']} retried, {summary['failed']} failed, "
+        f"{summary['duplicates']} duplicate hits dropped."
+    )
 
 
 if __name__ == "__main__":
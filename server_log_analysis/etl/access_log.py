@@ -0,0 +1,214 @@
+import locale
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+from typing import Iterable, Iterator, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# The Kong access-log line used in notebooks/data_understanding.ipynb
+KONG_PATTERN = (
+    r"^(?P<remote_address>\d+\.\d+\.\d+\.\d+) - - \[(?P<datetime>[^\]]+)\] "
+    r"\"(?P<method>\w+) (?P<path>[^\s]+) (?P<header>[^\"]+)\" (?P<status>\d+) (?P<bytes_sent>\d+) "
+    r"\"(?P<referer>[^\"]*)\" \"(?P<user_agent>[^\"]*)\" "
+    r"kong_request_id: \"(?P<kong_request_id>[a-f0-9]+)\""
+)
+
+# Groups LogTransform.transform reads as numbers
+NUMERIC_GROUPS = ("status", "bytes_sent")
+
+CHUNK_SIZE = 16 * 2**20
+# Below this a file is parsed in the calling process
+PARALLEL_MIN_SIZE = 64 * 2**20
+
+# Separators str.splitlines breaks on besides \n, which readlines() does not
+_OTHER_SEPARATORS = re.compile("[\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+# End-of-line, string-boundary and look-around assertions see past the line in a block
+_LINE_DEPENDENT = re.compile(r"\$|\\[AZ]|\(\?<?[=!]")
+
+Row = Tuple[str, ...]
+
+
+def line_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """Split ``path`` into at most ``parts`` byte ranges that start and end on line boundaries."""
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            f.seek(max(size * i // parts, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _decode(data: bytes, encoding: str) -> str:
+    text = data.decode(encoding)
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+
+def iter_blocks(path: str, start: int, end: int, encoding: str, chunk_size: int) -> Iterator[str]:
+    """
+    Decoded text of ``[start, end)`` in blocks of about ``chunk_size`` bytes cut
+    after a newline, with ``\\r\\n`` and ``\\r`` read as ``\\n`` like text mode.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining, rest = end - start, b""
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            data = rest + data
+            # a line longer than chunk_size is carried whole into the next read
+            cut = data.rfind(b"\n") + 1 if remaining > 0 else len(data)
+            rest = data[cut:]
+            if cut:
+                yield _decode(data[:cut], encoding)
+        if rest:
+            yield _decode(rest, encoding)
+
+
+def _lines(text: str) -> List[str]:
+    """The lines of ``text`` with their ``\\n``, as ``readlines()`` returns them."""
+    if not _OTHER_SEPARATORS.search(text):
+        return text.splitlines(keepends=True)
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    return lines if lines[-1] else lines[:-1]
+
+
+def _whole_block(pattern: str) -> bool:
+    """
+    Whether ``pattern`` matches a line the same inside a block as on the line
+    alone, which needs a ``^`` anchor and no assertion that looks past the line.
+    """
+    return pattern.startswith("^") and not _LINE_DEPENDENT.search(pattern)
+
+
+def _within_lines(text: str, matches: List[re.Match]) -> bool:
+    """No match is empty or runs past the newline ending its line."""
+    find = text.find
+    return all(
+        start < end and find("\n", start, end - 1) == -1
+        for start, end in map(re.Match.span, matches)
+    )
+
+
+def parse_range(
+    path: str, pattern: str, start: int, end: int, encoding: str, chunk_size: int = CHUNK_SIZE
+) -> List[Row]:
+    """
+    The named groups of every line in ``[start, end)`` that ``pattern`` matches, as tuples.
+
+    Anchored patterns are run over each block with ``finditer`` in multiline
+    mode, which skips splitting it into lines; a block where a match would
+    cross a line boundary is matched again line by line.
+    """
+    compiled = re.compile(pattern)
+    block = re.compile(pattern, re.MULTILINE) if _whole_block(pattern) else None
+    names = list(compiled.groupindex)
+    if compiled.groups == len(names):
+        row = re.Match.groups
+    elif len(names) == 1:
+        row = lambda match: (match.group(names[0]),)
+    else:
+        row = lambda match: match.group(*names)
+    rows = []
+    for text in iter_blocks(path, start, end, encoding, chunk_size):
+        if block is not None:
+            matches = list(block.finditer(text))
+            if _within_lines(text, matches):
+                rows += map(row, matches)
+                continue
+        rows += [row(match) for match in map(compiled.match, _lines(text)) if match]
+    return rows
+
+
+def _to_numeric(values) -> np.ndarray:
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy()
+
+
+def _parse_range(args) -> List[Union[np.ndarray, str, List[str]]]:
+    """
+    parse_range in a worker, returned column by column: ``numeric`` groups as
+    arrays, the others as one newline-joined string when none of their values
+    holds a newline, both far cheaper to pickle than rows of strings.
+    """
+    *args, numeric = args
+    rows = parse_range(*args)
+    columns = []
+    for name, column in zip(re.compile(args[1]).groupindex, zip(*rows)):
+        if name in numeric:
+            columns.append(_to_numeric(column))
+            continue
+        try:
+            joined = "\n".join(column)
+        except TypeError:  # a group that did not participate
+            joined = None
+        columns.append(
+            joined
+            if joined is not None and joined.count("\n") == len(column) - 1
+            else list(column)
+        )
+    return columns
+
+
+def parse_file(
+    path: str,
+    pattern: str,
+    numeric: Iterable[str] = (),
+    workers: int = None,
+    chunk_size: int = CHUNK_SIZE,
+    encoding: str = None,
+) -> pd.DataFrame:
+    """
+    Parse an access log into a DataFrame with one column per named group of ``pattern``.
+
+    The same rows as matching ``pattern`` against every line of ``readlines()``:
+    the pattern is compiled once and each line is matched once, the file is read
+    in ``chunk_size`` blocks, and files over ``PARALLEL_MIN_SIZE`` are split on
+    line boundaries across ``workers`` processes. Matches become columns
+    directly, without a dict per row.
+
+    :param numeric: Groups converted with ``pd.to_numeric(errors="coerce")`` if present,
+        e.g. ``NUMERIC_GROUPS``
+    :param workers: Processes, defaults to the number of cores
+    :param encoding: Defaults to the locale encoding, as ``open()``
+    """
+    encoding = encoding or locale.getpreferredencoding(False)
+    workers = workers or os.cpu_count()
+    names = list(re.compile(pattern).groupindex)
+    numeric = set(numeric) & set(names)
+    if workers > 1 and os.path.getsize(path) >= PARALLEL_MIN_SIZE:
+        parts = {name: [] for name in names}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = [
+                (path, pattern, start, end, encoding, chunk_size, numeric)
+                for start, end in line_ranges(path, workers)
+            ]
+            for part in executor.map(_parse_range, jobs):
+                for name, values in zip(names, part):
+                    parts[name].append(values.split("\n") if isinstance(values, str) else values)
+        if not any(parts.values()):
+            return pd.DataFrame([])
+        return pd.DataFrame(
+            {
+                name: (
+                    np.concatenate(values)
+                    if name in numeric
+                    else list(chain.from_iterable(values))
+                )
+                for name, values in parts.items()
+            }
+        )
+    rows = parse_range(path, pattern, 0, os.path.getsize(path), encoding, chunk_size)
+    if not rows:
+        return pd.DataFrame([])
+    df = pd.DataFrame.from_records(rows, columns=names)
+    for name in numeric:
+        df[name] = pd.to_numeric(df[name], errors="coerce")
+    return df
@@ -0,0 +1,83 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from server_log_analysis.etl.paginate import split_search_url
+from server_log_analysis.etl.timestamps import normalize_iso
+
+
+class WatermarkStore:
+    """
+    Durable record of what each source has already loaded.
+
+    One JSON file per source and index pattern lives in ``directory``. It holds
+    the merged list of completed ``[start, end]`` chunks, the watermarks. A
+    chunk is only recorded after ``Load`` has written its output, so a crash
+    never marks unwritten data as done.
+
+    ``run_etl`` keeps its ``cut_off`` chunk boundaries and asks ``resume_start``
+    where each chunk starts: chunks recorded here are skipped, and one that a
+    recorded span only partly covers is fetched from that span's end, so a
+    scheduled run only fetches what is newer than its watermark. A chunk
+    interrupted mid-way is fetched again in full. Its output folder is written
+    over, not appended to, so this adds no duplicate rows. No sort key is
+    kept: outputs are replaced whole (see ``atomic_open``), so there is no
+    partial chunk to resume with ``search_after``.
+
+    Commits are read-modify-write without locking: use one writer per store
+    (the orchestrator commits from the parent process).
+
+    :param directory: Folder holding the watermark files
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, source: str, url: str) -> str:
+        _, index = split_search_url(url)
+        name = f"{source}.{index}".replace("*", "_").replace("/", "_").replace(",", "_")
+        return os.path.join(self.directory, name + ".json")
+
+    def get(self, source: str, url: str) -> Dict[str, Any]:
+        path = self._path(source, url)
+        if not os.path.exists(path):
+            return {"completed": []}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def commit(self, source: str, url: str, start_time: str, end_time: str):
+        """Mark ``[start_time, end_time]`` as loaded."""
+        record = self.get(source, url)
+        record["completed"] = merge_windows(
+            record["completed"] + [[normalize_iso(start_time), normalize_iso(end_time)]]
+        )
+        path = self._path(source, url)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"completed": record["completed"]}, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def resume_start(self, source: str, url: str, start_time: str, end_time: str) -> Optional[str]:
+        """
+        Where ``[start_time, end_time]`` is still to be fetched from: the end of
+        the loaded span ``start_time`` falls in, else ``start_time``. None if
+        that span covers the whole chunk.
+        """
+        start, end = normalize_iso(start_time), normalize_iso(end_time)
+        for done_start, done_end in self.get(source, url)["completed"]:
+            if done_start <= start < done_end:
+                return None if end <= done_end else done_end
+        return start_time
+
+
+def merge_windows(windows: List[List[str]]) -> List[List[str]]:
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
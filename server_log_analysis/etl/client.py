@@ -0,0 +1,80 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Rejected (429) and transient server errors worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class _Session(requests.Session):
+    def request(self, method, url, **kwargs):
+        # requests lets REQUESTS_CA_BUNDLE override Session.verify, keep the session's setting
+        kwargs.setdefault("verify", self.verify)
+        return super().request(method, url, **kwargs)
+
+
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+
+
+def make_session(
+    retries: int = 5,
+    backoff: float = 0.5,
+    max_backoff: float = 30.0,
+    pool_size: int = 64,
+    verify: bool = False,
+) -> requests.Session:
+    """
+    A ``requests.Session`` with keep-alive pooling, retries and gzip responses.
+
+    Connection errors, timeouts and ``RETRY_STATUSES`` are retried up to
+    ``retries`` times after ``backoff * 2 ** n`` seconds plus up to ``backoff``
+    seconds of random jitter, capped at ``max_backoff``; a ``Retry-After``
+    header from Elasticsearch takes precedence. Searches are sent as GET/POST
+    with a body and are read-only, so every method is retried.
+
+    :param pool_size: Connections kept open per host, at least the window concurrency
+    :param verify: Verify TLS certificates; the cluster uses a self-signed one
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        backoff_max=max_backoff,
+        backoff_jitter=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = _Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["Accept-Encoding"] = "gzip"
+    session.verify = verify
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    The session shared by every extractor in this process.
+
+    Worker processes of the orchestrator each build their own on first use,
+    since pooled sockets cannot be shared across a fork.
+    """
+    global _session, _session_pid
+    with _lock:
+        if _session is None or _session_pid != os.getpid():
+            _session, _session_pid = make_session(), os.getpid()
+        return _session
+
+
+def set_session(session: requests.Session):
+    """Replace the shared session, e.g. with a ``make_session`` of other retry settings."""
+    global _session, _session_pid
+    with _lock:
+        _session, _session_pid = session, os.getpid()
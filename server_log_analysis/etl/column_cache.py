@@ -0,0 +1,266 @@
+import json
+import os
+import uuid
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # string tables are then decoded into Python strings on open
+    pa = None
+
+from server_log_analysis.etl.decode import dumps_line, loads
+from server_log_analysis.etl.writer import atomic_open, file_lock
+
+# A parsed file's cache is the folder <file>.cache next to it
+CACHE_SUFFIX = ".cache"
+META = "meta.json"
+# Bump when the layout of the column files changes, older caches are rebuilt
+VERSION = 1
+
+# Narrowest dictionary code type for a number of distinct values; -1 is missing
+_CODE_TYPES = [(2**7 - 1, np.int8), (2**15 - 1, np.int16), (2**31 - 1, np.int32)]
+# Narrower storage for the columns LogTransform.transform produces, when their values fit
+_NARROW = {"status": np.uint16, "method": np.uint8}
+
+
+def cache_dir(path: str) -> str:
+    return str(path) + CACHE_SUFFIX
+
+
+def _stamp(path: str) -> Dict[str, int]:
+    """What identifies a version of the source file: its size and modification time."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _code_type(size: int):
+    for limit, dtype in _CODE_TYPES:
+        if size <= limit:
+            return dtype
+    return np.int64
+
+
+def _fits(array: np.ndarray, dtype) -> bool:
+    """Whether every value of ``array`` is a whole number ``dtype`` holds."""
+    if not len(array) or not np.isfinite(array).all() or (array != np.trunc(array)).any():
+        return False
+    return np.iinfo(dtype).min <= array.min() and array.max() <= np.iinfo(dtype).max
+
+
+def _encode(name: str, values: pd.Series) -> Dict[str, Any]:
+    """
+    One column as what ``write_cache`` stores: the numpy array to save, and
+    how to rebuild the column from it.
+    """
+    dtype = values.dtype
+    if (
+        isinstance(dtype, pd.DatetimeTZDtype)
+        or dtype.kind == "M"
+        or (dtype == object and pd.api.types.infer_dtype(values, skipna=True) == "datetime")
+    ):
+        # Mixed UTC offsets (see clf_to_datetime) are stored in UTC
+        tz = (
+            str(dtype.tz)
+            if isinstance(dtype, pd.DatetimeTZDtype)
+            else "UTC" if dtype == object else None
+        )
+        times = pd.to_datetime(values, utc=tz is not None).dt.as_unit("ns")
+        return {
+            "kind": "datetime",
+            "tz": tz,
+            "array": times.to_numpy(dtype="datetime64[ns]").view(np.int64),
+        }
+    if dtype == object and pd.api.types.infer_dtype(values, skipna=False) == "integer":
+        # e.g. method after LogTransform.transform maps GET and POST to 0 and 1
+        values, dtype = values.astype(np.int64), np.dtype(np.int64)
+    if isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+        array = values.to_numpy()
+        narrow = _NARROW.get(name)
+        return {
+            "kind": "numeric",
+            "array": array.astype(narrow) if narrow and _fits(array, narrow) else array,
+        }
+    # Strings and anything else: dictionary codes and a table of the distinct values
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    uniques = [value.item() if isinstance(value, np.generic) else value for value in uniques]
+    return {
+        "kind": "dictionary",
+        "values": uniques,
+        "strings": all(isinstance(value, str) for value in uniques),
+        "array": codes.astype(_code_type(len(uniques))),
+    }
+
+
+def _string_table(values: List[str]):
+    """Strings as Arrow lays them out: int64 byte offsets and the UTF-8 bytes."""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _save(directory: str, name: str, array: np.ndarray):
+    with atomic_open(os.path.join(directory, name), mode="wb") as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+
+
+def write_cache(frame: pd.DataFrame, path: str, stamp: Dict[str, int] = None) -> str:
+    """
+    Store ``frame`` as the columnar cache of the file ``path`` it was parsed
+    from (or written to), stamped with that file's current size and
+    modification time.
+
+    Each column is one ``.npy`` file: datetimes as int64 nanoseconds (UTC,
+    with their time zone noted), numbers as they are (``status`` as uint16
+    and ``method`` as uint8 when their values fit), and strings or mixed
+    values as the smallest int codes into a table of their distinct values.
+    Tables of strings are stored as offsets and UTF-8 bytes, memory-mapped
+    as well, other tables as JSON. The index is not stored.
+
+    Column files of a new build get new names and ``meta.json`` is replaced
+    atomically last, so a reader never mixes two builds, and processes that
+    mapped the old files keep reading them (on POSIX).
+
+    :param stamp: The file's size and modification time when ``frame`` was read from it
+    :return: The cache folder
+    """
+    directory = cache_dir(path)
+    os.makedirs(directory, exist_ok=True)
+    build = uuid.uuid4().hex[:8]
+    columns = []
+    with file_lock(os.path.join(directory, ".lock")):
+        stamp = stamp or _stamp(path)
+        for i, name in enumerate(frame.columns):
+            column = _encode(str(name), frame[name])
+            array = column.pop("array")
+            column.update(name=str(name), file=f"{build}-{i}.npy")
+            _save(directory, column["file"], array)
+            if column["kind"] == "dictionary" and column["strings"]:
+                column["table"] = [f"{build}-{i}.offsets.npy", f"{build}-{i}.strings.npy"]
+                for file, part in zip(column["table"], _string_table(column.pop("values"))):
+                    _save(directory, file, part)
+            elif column["kind"] == "dictionary":
+                column["table"] = f"{build}-{i}.values.json"
+                with atomic_open(os.path.join(directory, column["table"]), mode="wb") as f:
+                    f.write(dumps_line(column.pop("values")).encode("utf-8"))
+            columns.append(column)
+        with atomic_open(os.path.join(directory, META)) as f:
+            json.dump(
+                {"version": VERSION, "source": stamp, "rows": len(frame), "columns": columns},
+                f,
+                indent=2,
+            )
+        for name in os.listdir(directory):
+            if name.endswith((".npy", ".json")) and name != META and not name.startswith(build):
+                os.remove(os.path.join(directory, name))
+    return directory
+
+
+def _meta(path: str) -> Dict[str, Any]:
+    """The cache's metadata if it is current for ``path``, else None."""
+    meta_path = os.path.join(cache_dir(path), META)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != VERSION or meta.get("source") != _stamp(path):
+        return None
+    return meta
+
+
+def is_current(path: str) -> bool:
+    """Whether ``path`` has a cache built from its current version."""
+    return _meta(path) is not None
+
+
+def _load(directory: str, name: str) -> np.ndarray:
+    return np.load(os.path.join(directory, name), mmap_mode="r", allow_pickle=False)
+
+
+def _categories(directory: str, column: Dict[str, Any]) -> pd.Index:
+    """A dictionary column's table; with pyarrow, strings stay in the mapped files."""
+    if not column["strings"]:
+        with open(os.path.join(directory, column["table"]), "rb") as f:
+            return pd.Index(loads(f.read()), dtype=object)
+    offsets, data = (_load(directory, name) for name in column["table"])
+    if pa is not None:
+        table = pa.LargeStringArray.from_buffers(
+            len(offsets) - 1, pa.py_buffer(offsets), pa.py_buffer(data)
+        )
+        return pd.Index(
+            pd.arrays.ArrowStringArray(table, dtype=pd.StringDtype("pyarrow", na_value=np.nan)),
+            copy=False,
+        )
+    blob, bounds = data.tobytes(), offsets.tolist()
+    return pd.Index([blob[a:b].decode("utf-8") for a, b in zip(bounds, bounds[1:])], dtype=str)
+
+
+def _decode(directory: str, column: Dict[str, Any]) -> pd.Series:
+    array = _load(directory, column["file"])
+    if column["kind"] == "datetime":
+        values = pd.Series(array.view("datetime64[ns]"), copy=False)
+        # Time zones cost one copy of the int64s, naive columns none
+        return values.dt.tz_localize("UTC").dt.tz_convert(column["tz"]) if column["tz"] else values
+    if column["kind"] == "dictionary":
+        dtype = pd.CategoricalDtype(_categories(directory, column))
+        return pd.Series(pd.Categorical.from_codes(array, dtype=dtype, validate=False), copy=False)
+    return pd.Series(array, copy=False)
+
+
+def open_cache(path: str, columns: List[str] = None) -> pd.DataFrame:
+    """
+    The cached frame of ``path``, None if there is no cache of its current version.
+
+    Column files are memory-mapped read-only rather than read: opening costs
+    only the tables that are not strings (and, without pyarrow, decoding
+    the string tables), rows are paged in from the OS page cache as
+    they are used, and processes opening the same cache share those pages.
+    Dictionary columns come back as ``category``; writing to any column
+    copies it first.
+
+    :param columns: Columns to open, defaults to all
+    """
+    meta = _meta(path)
+    if meta is None:
+        return None
+    directory = cache_dir(path)
+    wanted = (
+        meta["columns"]
+        if columns is None
+        else [column for column in meta["columns"] if column["name"] in columns]
+    )
+    return pd.DataFrame(
+        {column["name"]: _decode(directory, column) for column in wanted}, copy=False
+    )
+
+
+def read_parsed_csv(path: str) -> pd.DataFrame:
+    """A parsed log written with ``df.to_csv``, ``datetime`` parsed as Visualize does."""
+    frame = pd.read_csv(path)
+    if len(frame.columns) and str(frame.columns[0]).startswith("Unnamed: 0"):
+        frame = frame.drop(columns=frame.columns[0])  # the index to_csv writes by default
+    if "datetime" in frame:
+        frame["datetime"] = pd.to_datetime(frame["datetime"], errors="coerce")
+    return frame
+
+
+def read_parsed(
+    path: str,
+    columns: List[str] = None,
+    read: Callable[[str], pd.DataFrame] = read_parsed_csv,
+) -> pd.DataFrame:
+    """
+    A parsed log file through its columnar cache, see ``open_cache``.
+
+    When the file has no cache, or changed since the cache was built, it is
+    read with ``read`` and the cache rebuilt first.
+    """
+    frame = open_cache(path, columns)
+    if frame is None:
+        stamp = _stamp(path)
+        write_cache(read(path), path, stamp)
+        frame = open_cache(path, columns)
+    return frame
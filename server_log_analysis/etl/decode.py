@@ -0,0 +1,137 @@
+import json
+import re
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from server_log_analysis.etl.source_filter import filter_source
+
+try:
+    import orjson
+except ImportError:  # optional, pip install orjson
+    orjson = None
+
+# Keys of a hit the extractors read, as kept by FILTER_PATH
+HIT_KEYS = ("_id", "_source", "sort")
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+Raw = Union[bytes, bytearray, memoryview, str]
+
+
+def loads(raw: Raw) -> Any:
+    """``json.loads`` on orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(bytes(raw) if isinstance(raw, memoryview) else raw)
+
+
+def dumps_line(record: Any) -> str:
+    """``record`` as one compact NDJSON line, on orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE).decode()
+        except TypeError:  # e.g. integers wider than 64 bits, non-string keys
+            pass
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+
+def project_hit(hit: Dict[str, Any], includes: List[str] = None) -> Dict[str, Any]:
+    """Keep the ``HIT_KEYS`` of a hit and only the ``includes`` paths of its ``_source``."""
+    hit = {key: hit[key] for key in HIT_KEYS if key in hit}
+    if includes is not None and "_source" in hit:
+        hit["_source"] = filter_source(hit["_source"], includes)
+    return hit
+
+
+def loads_search(raw: Raw, includes: List[str] = None, backend: str = "auto") -> Dict[str, Any]:
+    """
+    Decode a ``_search`` response, materializing only what the extractors read.
+
+    The result has the usual ``hits.total`` / ``hits.hits`` shape, each hit
+    reduced by ``project_hit``, so ``process_response`` works on it unchanged.
+
+    With the ``"stream"`` backend the hits array is decoded one hit at a time and
+    each hit is projected before the next is read, so the discarded fields never
+    exist all at once. ``"orjson"`` decodes the whole body in one call, which is
+    faster but briefly holds every field. ``"auto"`` picks orjson when installed.
+
+    :param raw: Response body, e.g. ``response.content``
+    :param includes: ``_source`` paths to keep, or ``None`` for the whole ``_source``
+    :param backend: ``"auto"``, ``"orjson"`` or ``"stream"``
+    """
+    if backend == "auto":
+        backend = "orjson" if orjson is not None else "stream"
+    if backend == "orjson":
+        if orjson is None:
+            raise ImportError("The orjson backend needs `pip install orjson`")
+        data = orjson.loads(raw)
+        hits = data.get("hits", {})
+        if "hits" in hits:
+            hits["hits"] = [project_hit(hit, includes) for hit in hits["hits"]]
+        return data
+    if backend != "stream":
+        raise ValueError(f"Unknown backend {backend!r}, choose from auto, orjson, stream")
+
+    text = raw if isinstance(raw, str) else bytes(raw).decode("utf-8")
+
+    def decode_hit(pos: int) -> Tuple[Dict[str, Any], int]:
+        hit, pos = _decoder.raw_decode(text, pos)
+        return project_hit(hit, includes), pos
+
+    def decode_hits(key: str, pos: int) -> Tuple[Any, int]:
+        if key == "hits":
+            return _decode_array(text, pos, decode_hit)
+        return _decoder.raw_decode(text, pos)
+
+    def decode_response(key: str, pos: int) -> Tuple[Any, int]:
+        if key == "hits":
+            return _decode_object(text, pos, decode_hits)
+        return _decoder.raw_decode(text, pos)
+
+    return _decode_object(text, _skip(text, 0), decode_response)[0]
+
+
+def _skip(text: str, pos: int) -> int:
+    return _whitespace.match(text, pos).end()
+
+
+def _expect(text: str, pos: int, char: str) -> int:
+    """Position after ``char`` at ``pos`` and the whitespace following it."""
+    if not text.startswith(char, pos):
+        raise json.JSONDecodeError(f"Expecting {char!r}", text, pos)
+    return _skip(text, pos + 1)
+
+
+def _decode_object(
+    text: str, pos: int, decode_member: Callable[[str, int], Tuple[Any, int]]
+) -> Tuple[Dict[str, Any], int]:
+    """Decode the object at ``pos``, each value with ``decode_member(key, value_pos)``."""
+    result = {}
+    pos = _expect(text, pos, "{")
+    if text.startswith("}", pos):
+        return result, pos + 1
+    while True:
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _expect(text, _skip(text, pos), ":")
+        result[key], pos = decode_member(key, pos)
+        pos = _skip(text, pos)
+        if text.startswith("}", pos):
+            return result, pos + 1
+        pos = _expect(text, pos, ",")
+
+
+def _decode_array(
+    text: str, pos: int, decode_item: Callable[[int], Tuple[Any, int]]
+) -> Tuple[List[Any], int]:
+    """Decode the array at ``pos``, each item with ``decode_item(item_pos)``."""
+    result = []
+    pos = _expect(text, pos, "[")
+    if text.startswith("]", pos):
+        return result, pos + 1
+    while True:
+        item, pos = decode_item(pos)
+        result.append(item)
+        pos = _skip(text, pos)
+        if text.startswith("]", pos):
+            return result, pos + 1
+        pos = _expect(text, pos, ",")
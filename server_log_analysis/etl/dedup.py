@@ -0,0 +1,315 @@
+import hashlib
+import json
+import math
+import os
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List
+
+import numpy as np
+
+from server_log_analysis.etl.timestamps import normalize_iso
+from server_log_analysis.etl.writer import atomic_open, file_lock
+
+# _ids one filter generation holds before the next one is started
+CAPACITY = 10_000_000
+ERROR_RATE = 0.001
+# _ids an IdFilter appends to its journal before merging it into the filter file
+JOURNAL_IDS = 1_000_000
+
+
+def _digests(keys: List[str]) -> np.ndarray:
+    """Two 64-bit hashes per key, as an ``(n, 2)`` uint64 array."""
+    raw = b"".join(hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest() for key in keys)
+    return np.frombuffer(raw, dtype="<u8").reshape(-1, 2)
+
+
+class BloomFilter:
+    """
+    Bit array answering "possibly seen" or "certainly not seen" for string keys.
+
+    Sized for ``capacity`` keys at ``error_rate`` false positives. The ``k``
+    bit positions of a key come from two 64-bit blake2b hashes (double hashing),
+    computed for a whole batch of keys at once.
+    """
+
+    def __init__(self, capacity: int = CAPACITY, error_rate: float = ERROR_RATE):
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.array = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, keys: List[str]) -> np.ndarray:
+        digests = _digests(keys)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            return (digests[:, :1] + steps * (digests[:, 1:] | np.uint64(1))) % np.uint64(
+                self.size
+            )
+
+    def contains(self, keys: List[str]) -> np.ndarray:
+        """Whether each key was possibly added, as a bool array."""
+        if not keys:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        return (
+            (self.array[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8))
+            & 1
+        ).all(axis=1)
+
+    def add(self, keys: List[str]):
+        if not keys:
+            return
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(
+            self.array,
+            positions >> np.uint64(3),
+            np.left_shift(1, positions & np.uint64(7)).astype(np.uint8),
+        )
+        self.count += len(keys)
+
+
+class IdFilter:
+    """
+    Persistent, space-bounded set of the ``_id``s a source has loaded, across runs.
+
+    Two ``BloomFilter`` generations are kept in ``<directory>/<source>.bloom``:
+    new ids go to the current one, and once it holds ``capacity`` ids it becomes
+    the previous one, replacing the oldest. The file therefore never grows past
+    two filters, and a lookup's false-positive rate stays within about twice
+    ``error_rate`` while ids older than two generations are forgotten. The file
+    also lists the chunk windows committed to it. An existing file keeps the
+    ``capacity`` and ``error_rate`` it was created with.
+
+    The filter file is read once. A commit appends the chunk's window and ids to
+    a journal next to it, ``<source>.bloom.<merges>.log``, instead of rewriting
+    the filters; once the journal holds ``journal_ids`` ids it is merged into a
+    new filter file, which names the next journal. Commits and ``refresh`` take
+    a lock and first read what other processes appended, so chunks of one source
+    may commit from several processes (on POSIX).
+
+    :param directory: Folder holding the filter files
+    :param journal_ids: Ids appended to the journal before it is merged
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        source: str,
+        capacity: int = CAPACITY,
+        error_rate: float = ERROR_RATE,
+        journal_ids: int = JOURNAL_IDS,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{source}.bloom")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.journal_ids = journal_ids
+        with file_lock(self.path + ".lock"):
+            self._load()
+            if not os.path.exists(self.path):
+                self._save()
+
+    @property
+    def journal(self) -> str:
+        return f"{self.path}.{self.merges}.log"
+
+    def _header(self) -> Dict[str, Any]:
+        with open(self.path, "rb") as f:
+            return json.loads(f.readline())
+
+    def _load(self):
+        """Read the filter file, then its whole journal."""
+        self.windows: List[List[str]] = []
+        self.generations = [BloomFilter(self.capacity, self.error_rate)]
+        self.merges = 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                header = json.loads(f.readline())
+                self.capacity, self.error_rate = header["capacity"], header["error_rate"]
+                self.windows, self.merges = header["windows"], header.get("merges", 0)
+                self.generations = []
+                for count in header["counts"]:
+                    generation = BloomFilter(self.capacity, self.error_rate)
+                    f.readinto(memoryview(generation.array))
+                    generation.count = count
+                    self.generations.append(generation)
+        self._offset = self._journaled = 0
+        self._read_journal()
+
+    def _read_journal(self):
+        """Apply the journal entries appended since it was last read."""
+        if not os.path.exists(self.journal):
+            return
+        with open(self.journal, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # cut short by a crash, the next commit writes over it
+                    break
+                entry = json.loads(line)
+                self._add(entry["ids"], entry["window"])
+                self._offset += len(line)
+                self._journaled += len(entry["ids"])
+
+    def _refresh(self):
+        if os.path.exists(self.path) and self._header().get("merges", 0) != self.merges:
+            # another process merged the journal into a new filter file
+            self._load()
+        else:
+            self._read_journal()
+
+    def refresh(self):
+        """Pick up the commits of other processes since the filter was read."""
+        with file_lock(self.path + ".lock"):
+            self._refresh()
+
+    def _add(self, ids: List[str], window: List[str]):
+        while ids:
+            current = self.generations[-1]
+            if current.count >= self.capacity:
+                current = BloomFilter(self.capacity, self.error_rate)
+                self.generations = [self.generations[-1], current]
+            room = self.capacity - current.count
+            current.add(ids[:room])
+            ids = ids[room:]
+        if window not in self.windows:
+            self.windows.append(window)
+
+    def _save(self):
+        header = {
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "counts": [generation.count for generation in self.generations],
+            "windows": self.windows,
+            "merges": self.merges,
+        }
+        with atomic_open(self.path, mode="wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for generation in self.generations:
+                f.write(generation.array.tobytes())
+
+    def contains(self, ids: List[str]) -> np.ndarray:
+        seen = np.zeros(len(ids), dtype=bool)
+        for generation in self.generations:
+            seen |= generation.contains(ids)
+        return seen
+
+    def commit(self, ids: List[str], start_time: str, end_time: str):
+        """Add the ``_id``s of the chunk ``[start_time, end_time]`` once it is loaded."""
+        window = [normalize_iso(start_time), normalize_iso(end_time)]
+        line = json.dumps({"window": window, "ids": ids}).encode("utf-8") + b"\n"
+        with file_lock(self.path + ".lock"):
+            self._refresh()
+            self._add(ids, window)
+            with open(self.journal, "ab") as f:
+                f.truncate(self._offset)
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._offset += len(line)
+            self._journaled += len(ids)
+            if self._journaled >= self.journal_ids:
+                journal = self.journal
+                self.merges += 1
+                self._save()
+                os.remove(journal)
+                self._offset = self._journaled = 0
+
+    def has_window(self, start_time: str, end_time: str) -> bool:
+        return [normalize_iso(start_time), normalize_iso(end_time)] in self.windows
+
+
+class Deduplicator:
+    """
+    Drops hits whose Elasticsearch ``_id`` was already fetched.
+
+    Windows query ``gte``/``lte``, so a document on the boundary of two windows
+    (or chunks) is returned by both, and re-runs over overlapping ranges fetch
+    whole windows again. Ids of the current run are kept in an exact set; with
+    ``directory`` an ``IdFilter`` remembers the ids of earlier runs.
+
+    Ids are only committed once their chunk is loaded: ``rollback`` forgets the
+    ids of a chunk that failed, so its retry loads them again. A chunk whose
+    exact window was committed before is not checked against earlier runs,
+    since its output folder is written over anyway.
+
+    :param directory: Folder of ``IdFilter`` files, None for one run only
+    """
+
+    def __init__(
+        self,
+        source: str,
+        directory: str = None,
+        capacity: int = CAPACITY,
+        error_rate: float = ERROR_RATE,
+    ):
+        self.source = source
+        self.id_filter = IdFilter(directory, source, capacity, error_rate) if directory else None
+        self.seen = set()
+        self.counts = Counter()
+        self._added: List[str] = []
+        self._pending: List[str] = []
+        self._chunk = Counter()
+        self._earlier = False
+
+    def start(self, start_time: str, end_time: str):
+        """Begin the chunk ``[start_time, end_time]``."""
+        self.rollback()
+        if self.id_filter:
+            self.id_filter.refresh()
+        self._earlier = self.id_filter is not None and not self.id_filter.has_window(
+            start_time, end_time
+        )
+
+    def filter_hits(self, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        fresh, ids = [], []
+        for hit in hits:
+            _id = hit.get("_id")
+            if _id is None:
+                fresh.append(hit)
+            elif _id in self.seen:
+                self._chunk["run"] += 1
+            else:
+                self.seen.add(_id)
+                fresh.append(hit)
+                ids.append(_id)
+        self._added.extend(ids)
+        if self._earlier and ids:
+            earlier = self.id_filter.contains(ids)
+            if earlier.any():
+                self._chunk["earlier"] += int(earlier.sum())
+                drop = {_id for _id, seen in zip(ids, earlier) if seen}
+                fresh = [hit for hit in fresh if hit.get("_id") not in drop]
+                ids = [_id for _id, seen in zip(ids, earlier) if not seen]
+        self._pending.extend(ids)
+        self._chunk["hits"] += len(hits)
+        return fresh
+
+    def iter_hits(self, batches: Iterable[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+        for hits in batches:
+            yield self.filter_hits(hits)
+
+    def commit(self, start_time: str, end_time: str):
+        """The chunk is loaded: count it and remember its ids in later runs."""
+        if self.id_filter:
+            self.id_filter.commit(self._pending, start_time, end_time)
+        self.counts.update(self._chunk)
+        self._added, self._pending, self._chunk = [], [], Counter()
+
+    def rollback(self):
+        """The chunk failed: forget its ids and counts."""
+        self.seen.difference_update(self._added)
+        self._added, self._pending, self._chunk = [], [], Counter()
+
+    def report(self) -> str:
+        return dedup_report(self.source, self.counts)
+
+
+def dedup_report(source: str, counts: Counter) -> str:
+    """One line on the hits a ``Deduplicator`` dropped, from its ``counts``."""
+    hits, run, earlier = counts["hits"], counts["run"], counts["earlier"]
+    rate = (run + earlier) / hits if hits else 0.0
+    return (
+        f"{source}: dropped {run + earlier:,} of {hits:,} hits by _id ({rate:.2%}), "
+        f"{run:,} fetched twice in this run, {earlier:,} loaded by earlier runs or chunks"
+    )
@@ -0,0 +1,372 @@
+import abc
+import json
+import random
+import ssl
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+from server_log_analysis.etl.source_filter import apply_filter_path, filter_source
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Elasticsearch stops counting at track_total_hits, 10000 by default
+TOTAL_HITS_LIMIT = 10000
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _LocalServer(abc.ABC):
+    """
+    Threaded HTTP server on a free local port, answering with ``respond``.
+
+    With ``certfile`` (a PEM holding the key and certificate) it serves HTTPS,
+    so TLS handshakes cost what they cost against the real cluster.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, certfile: str = None):
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._scheme = "http"
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile)
+            # handshake in the handler thread, not in the accept loop
+            self._server.socket = context.wrap_socket(
+                self._server.socket, server_side=True, do_handshake_on_connect=False
+            )
+            self._scheme = "https"
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"{self._scheme}://{host}:{port}"
+
+    @abc.abstractmethod
+    def respond(
+        self, method: str, path: str, params: Dict[str, str], body: bytes
+    ) -> Tuple[int, bytes]:
+        """The status and JSON body answering one request."""
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes on kept-alive connections
+            disable_nagle_algorithm = True
+
+            def _answer(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                with server._lock:
+                    server.requests += 1
+                parts = urlsplit(self.path)
+                params = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+                status, payload = server.respond(self.command, parts.path, params, body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _answer
+            do_POST = _answer
+            do_DELETE = _answer
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeSearchServer(_LocalServer):
+    """
+    Minimal local stand-in for an Elasticsearch ``_search`` endpoint.
+
+    Every request is answered with the same JSON body after ``latency`` seconds,
+    which is enough to measure how the extractors behave when round-trips,
+    not bandwidth, dominate.
+
+    :param body: Raw JSON response body
+    :param latency: Seconds to wait before answering each request
+    """
+
+    def __init__(self, body: bytes, latency: float = 0.02, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(host, port)
+        self.body = body
+        self.latency = latency
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/_search"
+
+    def respond(self, method, path, params, body):
+        time.sleep(self.latency)
+        return 200, self.body
+
+
+def to_epoch_ms(value: Union[str, int]) -> int:
+    """Epoch milliseconds of an ISO-8601 time such as ``2024-12-22T00:00:00.000Z``."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return parse_iso_ms(value)
+    except ValueError:
+        # other layouts Elasticsearch accepts, e.g. an explicit offset or a bare date
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - EPOCH) // timedelta(milliseconds=1)
+
+
+def find_time_range(query: Any) -> Dict[str, Any]:
+    """The ``@timestamp`` range clause anywhere in a search ``query``, or ``{}``."""
+    if isinstance(query, dict):
+        if "range" in query and "@timestamp" in query["range"]:
+            return query["range"]["@timestamp"]
+        values = query.values()
+    elif isinstance(query, list):
+        values = query
+    else:
+        return {}
+    for value in values:
+        found = find_time_range(value)
+        if found:
+            return found
+    return {}
+
+
+class SampleIndex:
+    """
+    An index replaying one sample ``_search`` dump along the time axis.
+
+    The dump's hits cover ``[t0, t0 + period)``. Copy ``k`` of them is shifted by
+    ``k * period`` and given ``_id`` suffix ``-k``, so every time range has data
+    at the dump's own density. Hit ``i`` of copy ``k`` sits at position
+    ``k * n + i`` of the replayed index, which is also its ascending sort order,
+    so a range query and a ``search_after`` cursor each reduce to a position.
+
+    A ``period`` shorter or longer than the dump rescales its timestamps, e.g.
+    the 500 Kong hits spread over 85 minutes are replayed every second with
+    ``period=1000``.
+
+    :param hits: ``hits.hits`` of a dump, each with an epoch ``sort`` value
+    :param period: Replay period in milliseconds, defaults to the span of the dump
+    """
+
+    def __init__(self, hits: List[Dict[str, Any]], period: int = None):
+        if not hits:
+            raise ValueError("A sample index needs at least one hit")
+        self.hits = sorted(hits, key=lambda hit: hit["sort"][0])
+        times = [hit["sort"][0] for hit in self.hits]
+        self.t0 = times[0]
+        span = times[-1] - self.t0 + 1
+        self.period = period or span
+        self.rescaled = self.period != span
+        self.times = [self.t0 + (t - self.t0) * self.period // span for t in times]
+
+    @classmethod
+    def from_dump(cls, path: Union[str, Path], period: int = None) -> "SampleIndex":
+        with open(path, "r") as f:
+            return cls(json.load(f)["hits"]["hits"], period)
+
+    def position(self, ms: int) -> int:
+        """Number of replayed hits at or before ``ms``."""
+        copy = (ms - self.t0) // self.period
+        return copy * len(self.times) + bisect_right(self.times, ms - copy * self.period)
+
+    def hit(
+        self, position: int, includes: List[str] = None, tiebreak: bool = False
+    ) -> Dict[str, Any]:
+        copy, i = divmod(position, len(self.hits))
+        hit = dict(self.hits[i])
+        source = hit.get("_source", {})
+        if copy or self.rescaled:
+            ms = self.times[i] + copy * self.period
+            hit["sort"] = [ms]
+            source = dict(source, **{"@timestamp": format_iso_ms(ms)})
+        if copy:
+            hit["_id"] = f"{hit['_id']}-{copy}"
+        if includes is not None:
+            source = filter_source(source, includes)
+        hit["_source"] = source
+        if tiebreak:
+            hit["sort"] = [hit["sort"][0], position]
+        return hit
+
+    def search(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Answer a search body: the ``@timestamp`` range (``gte``/``gt``/``lte``/``lt``),
+        ``from``, ``size``, ``search_after``, ``_source`` includes and
+        ``track_total_hits``. Hits are always in ascending ``@timestamp`` order.
+        """
+        time_range = find_time_range(body.get("query", {}))
+        first = self.position(to_epoch_ms(time_range["gte"]) - 1) if "gte" in time_range else None
+        if "gt" in time_range:
+            first = self.position(to_epoch_ms(time_range["gt"]))
+        last = self.position(to_epoch_ms(time_range["lte"])) if "lte" in time_range else None
+        if "lt" in time_range:
+            last = self.position(to_epoch_ms(time_range["lt"]) - 1)
+        if first is None or last is None:
+            raise ValueError("The sample index only answers bounded @timestamp ranges")
+
+        start = first + body.get("from", 0)
+        tiebreak = "pit" in body
+        search_after = body.get("search_after")
+        if search_after:
+            start = max(start, search_after[1] + 1 if tiebreak else self.position(search_after[0]))
+        end = min(last, start + body.get("size", 10))
+
+        source = body.get("_source")
+        includes = source.get("includes") if isinstance(source, dict) else None
+        response = {
+            "took": 1,
+            "timed_out": False,
+            "hits": {
+                "max_score": None,
+                "hits": [self.hit(position, includes, tiebreak) for position in range(start, end)],
+            },
+        }
+
+        track = body.get("track_total_hits", TOTAL_HITS_LIMIT)
+        if track is not False:
+            total = max(last - first, 0)
+            limit = TOTAL_HITS_LIMIT if track is True else track
+            if track is True or total <= limit:
+                response["hits"]["total"] = {"value": total, "relation": "eq"}
+            else:
+                response["hits"]["total"] = {"value": limit, "relation": "gte"}
+        if tiebreak:
+            response["pit_id"] = body["pit"]["id"]
+        return response
+
+
+class SampleSearchServer(_LocalServer):
+    """
+    Local Elasticsearch stand-in serving ``_search`` from sample dumps.
+
+    Each index name (``kong-access-*`` etc.) maps to a ``SampleIndex`` and is
+    served at ``/<index>/_search``, with ``filter_path`` and point-in-time
+    (``/<index>/_pit``, ``/_search``, ``DELETE /_pit``) support, so the
+    extractors run unchanged against it. Every request waits ``latency`` plus up
+    to ``jitter`` seconds, and fails with a 429 rejection at ``error_rate``.
+
+    :param indices: Index name -> ``SampleIndex``
+    :param latency: Seconds to wait before answering each request
+    :param jitter: Extra random wait in seconds, uniform in ``[0, jitter]``
+    :param error_rate: Fraction of searches answered with an error
+    :param seed: Seed for the jitter and the errors
+    """
+
+    def __init__(
+        self,
+        indices: Dict[str, SampleIndex],
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        certfile: str = None,
+    ):
+        super().__init__(host, port, certfile)
+        self.indices = indices
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.errors = 0
+        self.documents = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_samples(
+        cls, sources: List[str] = None, period: int = None, **kwargs
+    ) -> "SampleSearchServer":
+        """
+        Serve the sample dump of each source under its index, see ``sources.SAMPLES``.
+
+        :param period: Replay period of every dump in milliseconds, see ``SampleIndex``
+        """
+        from server_log_analysis.etl.sources import DEFAULTS, SAMPLES, sample_path
+
+        indices = {}
+        for source in sources or list(SAMPLES):
+            index = DEFAULTS[source]["index"]
+            if index not in indices:
+                indices[index] = SampleIndex.from_dump(sample_path(source), period)
+        return cls(indices, **kwargs)
+
+    def url(self, index: str) -> str:
+        return f"{self.base_url}/{index}/_search"
+
+    def respond(self, method, path, params, body):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        time.sleep(delay)
+        parts = path.strip("/").split("/")
+
+        if parts[-1] == "_pit":
+            if method == "DELETE":
+                return 200, b'{"succeeded":true,"num_freed":1}'
+            if parts[0] not in self.indices:
+                return self._error(404, "index_not_found_exception", f"no such index [{parts[0]}]")
+            return 200, json.dumps({"id": parts[0]}).encode()
+        if parts[-1] != "_search":
+            return self._error(400, "illegal_argument_exception", f"unsupported path [{path}]")
+
+        if failed:
+            with self._lock:
+                self.errors += 1
+            return self._error(
+                429, "es_rejected_execution_exception", "rejected execution of search"
+            )
+
+        try:
+            request = json.loads(body or b"{}")
+            index = request["pit"]["id"] if "pit" in request else parts[0]
+            if index not in self.indices:
+                return self._error(404, "index_not_found_exception", f"no such index [{index}]")
+            response = self.indices[index].search(request)
+        except (ValueError, KeyError, TypeError) as e:
+            return self._error(400, "parsing_exception", f"{type(e).__name__} - {e}")
+
+        documents = len(response["hits"]["hits"])
+        if "filter_path" in params:
+            response = apply_filter_path(response, params["filter_path"])
+        payload = json.dumps(response).encode()
+        with self._lock:
+            self.documents += documents
+            self.bytes_sent += len(payload)
+        return 200, payload
+
+    def _error(self, status: int, kind: str, reason: str) -> Tuple[int, bytes]:
+        error = {"root_cause": [{"type": kind, "reason": reason}], "type": kind, "reason": reason}
+        return status, json.dumps({"error": error, "status": status}).encode()
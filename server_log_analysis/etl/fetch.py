@@ -0,0 +1,83 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, Tuple
+
+from tqdm import tqdm
+
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+
+Window = Tuple[str, str]
+
+
+def iter_windows(start_time: str, end_time: str, step: int) -> Iterator[Window]:
+    """
+    Yield the ``(gte, lte)`` query windows that ``get_log`` walks through.
+
+    :param start_time: Start of the range, e.g. ``2024-12-14T00:00:00.000Z``
+    :param end_time: End of the range
+    :param step: Window width in milliseconds
+    """
+    start_ms = parse_iso_ms(start_time)
+    for offset in range(0, parse_iso_ms(end_time) - start_ms, step):
+        yield format_iso_ms(start_ms + offset), format_iso_ms(start_ms + offset + step)
+
+
+def count_windows(start_time: str, end_time: str, step: int) -> int:
+    return len(range(0, parse_iso_ms(end_time) - parse_iso_ms(start_time), step))
+
+
+async def afetch_windows(
+    fetch: Callable[[str, str], Any], windows: Iterable[Window], concurrency: int = 8
+) -> AsyncIterator[Any]:
+    """
+    Run ``fetch(start, end)`` for every window with ``concurrency`` requests in flight.
+
+    Results are yielded in window order, so callers see logs in timestamp order
+    exactly as with the sequential ``get_log``. At most ``2 * concurrency``
+    windows are scheduled ahead of the one being consumed, which keeps every
+    worker busy while a slow window blocks the head of the queue.
+    """
+    loop = asyncio.get_running_loop()
+    windows = iter(windows)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = deque(
+            loop.run_in_executor(executor, fetch, *window)
+            for window in islice(windows, 2 * concurrency)
+        )
+        while pending:
+            result = await pending.popleft()
+            for window in islice(windows, 1):
+                pending.append(loop.run_in_executor(executor, fetch, *window))
+            yield result
+
+
+def stream_windows(
+    fetch: Callable[[str, str], Any],
+    windows: Iterable[Window],
+    concurrency: int = 8,
+    total: int = None,
+    desc: str = "Extracting",
+) -> Iterator[Any]:
+    """
+    Blocking iterator over :func:`afetch_windows`.
+
+    The event loop only advances when the caller asks for the next result, so a
+    slow consumer (e.g. a streaming ``Load``) holds at most ``2 * concurrency``
+    windows in memory.
+    """
+    loop = asyncio.new_event_loop()
+    results = afetch_windows(fetch, windows, concurrency)
+    try:
+        with tqdm(total=total, desc=desc) as progress:
+            while True:
+                try:
+                    result = loop.run_until_complete(results.__anext__())
+                except StopAsyncIteration:
+                    return
+                progress.update()
+                yield result
+    finally:
+        loop.run_until_complete(results.aclose())
+        loop.close()
@@ -0,0 +1,46 @@
+import multiprocessing
+import resource
+import tempfile
+import time
+
+from server_log_analysis.etl.sources import extract_class, load_script
+
+
+def run_pipeline(source: str, url: str, seconds: int, step: int, stream: bool, queue):
+    """Run one extract/transform/load pass and report this process's peak RSS in MB."""
+    module = load_script(source)
+    info = {
+        "url": url,
+        "api_key": "",
+        "start_time": "2025-01-07T00:00:00.000Z",
+        "end_time": time.strftime("2025-01-07T%H:%M:%S.000Z", time.gmtime(seconds)),
+        "step": step,
+        "limit": 10000,
+    }
+    extractor = extract_class(module)(**info)
+    with tempfile.TemporaryDirectory() as save_dir:
+        if stream:
+            batches = extractor.iter_log(concurrency=8)
+            module.Load(module.Transform().iter_log(batches), info, save_dir, stream=True)
+        else:
+            logs = extractor.get_log_async(concurrency=8)
+            logs = module.Transform(logs=logs).exact_log()
+            module.Load(logs, info, save_dir)
+    queue.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+
+def peak_rss(source: str, url: str, seconds: int, step: int, stream: bool) -> float:
+    """
+    Peak RSS in MB of one pass of ``source`` over a ``seconds`` window of
+    ``url``, in streaming or batch mode, run in a fresh process.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=run_pipeline, args=(source, url, seconds, step, stream, queue)
+    )
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError(f"Pipeline process exited with code {process.exitcode}")
+    return queue.get()
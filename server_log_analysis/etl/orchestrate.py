@@ -0,0 +1,215 @@
+import os
+import tempfile
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Dict, List, Tuple
+
+from loguru import logger
+
+from server_log_analysis.etl import pipeline
+from server_log_analysis.etl.checkpoint import WatermarkStore
+from server_log_analysis.etl.dedup import (
+    CAPACITY,
+    ERROR_RATE,
+    Deduplicator,
+    dedup_report,
+)
+from server_log_analysis.etl.fetch import Window
+from server_log_analysis.etl.rollups import ROLLUP_SOURCES
+from server_log_analysis.etl.sources import DEFAULTS, load_script
+from server_log_analysis.etl.templates import TEMPLATE_SOURCES
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+
+# Deduplicators of this worker process by source and dedup_dir, kept across its chunks
+_DEDUPLICATORS: Dict[Tuple[str, str], Deduplicator] = {}
+
+
+def plan_chunks(start_time: str, end_time: str, cut_off: int) -> List[Window]:
+    """Split ``[start_time, end_time]`` into the same ``cut_off`` chunks as ``run_etl``."""
+    current = parse_iso_ms(start_time)
+    end_ms = parse_iso_ms(end_time)
+    chunks = []
+    while current < end_ms:
+        chunk_end = min(current + cut_off * 1000, end_ms)
+        chunks.append((format_iso_ms(current), format_iso_ms(chunk_end)))
+        current += cut_off * 1000
+    return chunks
+
+
+def run_chunk(
+    source: str, info: Dict[str, Any], save_dir: str, options: Dict[str, Any]
+) -> Tuple[int, Counter]:
+    """
+    Worker entry point: run one chunk of ``source`` through ``pipeline.run_window``.
+
+    With ``dedup`` or ``dedup_dir`` in ``options`` the chunk goes through the
+    worker's ``Deduplicator`` of the source, which reads the ``dedup_dir`` filter
+    once (created with ``dedup_capacity`` and ``dedup_error_rate`` if there is
+    none) and keeps the ids of the worker's chunks; the counts of this chunk are
+    returned. Workers see each other's ids through the filter once their chunks
+    are committed. ``rollup_dir`` only reaches the scripts of ``ROLLUP_SOURCES``,
+    and ``templates`` only to those of ``TEMPLATE_SOURCES``, whose chunks mine on
+    their own and merge their templates into the source's table in ``save_dir``.
+    """
+    module = load_script(source)
+    options = dict(options)
+    dedup, dedup_dir = options.pop("dedup", False), options.pop("dedup_dir", None)
+    capacity = options.pop("dedup_capacity", CAPACITY)
+    error_rate = options.pop("dedup_error_rate", ERROR_RATE)
+    deduplicator = None
+    if dedup or dedup_dir:
+        deduplicator = _DEDUPLICATORS.get((source, dedup_dir))
+        if deduplicator is None:
+            deduplicator = Deduplicator(source, dedup_dir, capacity, error_rate)
+            _DEDUPLICATORS[source, dedup_dir] = deduplicator
+        counts = Counter(deduplicator.counts)
+    rollup_dir = options.pop("rollup_dir", None)
+    if rollup_dir and source in ROLLUP_SOURCES:
+        options["rollup_dir"] = rollup_dir
+    if options.pop("templates", False) and source in TEMPLATE_SOURCES:
+        options["templates"] = True
+    failed_windows = pipeline.run_window(module, info, save_dir, dedup=deduplicator, **options)
+    return len(failed_windows), deduplicator.counts - counts if deduplicator else None
+
+
+def run_backfill(
+    sources: List[str],
+    start_time: str,
+    end_time: str,
+    host: str,
+    api_key: str,
+    save_dir: str,
+    workers: int = None,
+    max_per_source: int = 2,
+    caps: Dict[str, int] = None,
+    step: int = None,
+    limit: int = None,
+    cut_off: int = None,
+    checkpoint: str = None,
+    retries: int = 1,
+    **options,
+) -> Dict[str, int]:
+    """
+    Run every ``cut_off`` chunk of every source on one process pool.
+
+    Chunks are handed out round-robin across sources so a long Kong backfill does
+    not starve the APM indexes, and no source has more than its cap in flight
+    (``caps[source]``, else ``max_per_source``). Each chunk writes the same output
+    folder that ``run_etl`` would write under ``save_dir``. Watermarks are
+    committed here, in the parent, once a chunk has loaded without failed windows.
+    A chunk that raised or still had failed windows goes to the back of its
+    source's queue, up to ``retries`` times, so it is retried after the rest.
+    With ``dedup`` but no ``dedup_dir``, the chunks share their ids through a
+    temporary filter removed after the backfill, so duplicates across chunks
+    are dropped as in ``run_etl``. A chunk only sees the ids of chunks committed
+    before it starts, so with dedup the even chunks of a source are queued
+    before the odd ones.
+
+    :param sources: Source names, see ``server_log_analysis.etl.sources.SCRIPTS``
+    :param host: Elasticsearch base URL, e.g. ``https://116.101.122.180:5200``
+    :param step: Window width in milliseconds, defaults to the source's own setting
+    :param limit: Page size, defaults to the source's own setting
+    :param cut_off: Chunk length in seconds, defaults to the source's own setting
+    :param checkpoint: Watermark folder; chunks already loaded are skipped, partly
+        loaded ones start after the loaded part
+    :param retries: Times a failed chunk is queued again
+    :param options: Extraction options forwarded to ``run_window`` (concurrency, stream, ...),
+        ``dedup``, ``dedup_dir``, ``dedup_error_rate``, ``dedup_capacity`` and ``templates``
+        as in ``run_etl``, and ``rollup_dir``, see ``run_chunk``
+    :return: Counts of chunks run, skipped, retried and failed, and of hits dropped by _id
+    """
+    workers = workers or os.cpu_count()
+    caps = {source: (caps or {}).get(source, max_per_source) for source in sources}
+    store = WatermarkStore(checkpoint) if checkpoint else None
+    summary = {"chunks": 0, "skipped": 0, "retried": 0, "failed": 0, "duplicates": 0}
+    attempts = {}
+    dedup_counts = {source: Counter() for source in sources}
+    temporary = None
+    if options.get("dedup") and not options.get("dedup_dir"):
+        temporary = tempfile.TemporaryDirectory(prefix="dedup-")
+        options = dict(options, dedup_dir=temporary.name)
+
+    queues = {}
+    for source in sources:
+        settings = DEFAULTS[source]
+        url = f"{host.rstrip('/')}/{settings['index']}/_search"
+        queues[source] = deque()
+        chunks = plan_chunks(start_time, end_time, cut_off or settings["cut_off"])
+        if temporary or options.get("dedup_dir"):
+            # Every other chunk first, so neighbours, which share boundary hits,
+            # mostly run after each other and see each other's ids
+            chunks = chunks[::2] + chunks[1::2]
+        for chunk_start, chunk_end in chunks:
+            if store:
+                chunk_start = store.resume_start(source, url, chunk_start, chunk_end)
+                if chunk_start is None:
+                    summary["skipped"] += 1
+                    continue
+            queues[source].append(
+                {
+                    "url": url,
+                    "api_key": api_key,
+                    "start_time": chunk_start,
+                    "end_time": chunk_end,
+                    "step": step or settings["step"],
+                    "limit": limit or settings["limit"],
+                }
+            )
+    logger.info(
+        f"{sum(len(queue) for queue in queues.values())} chunks across {len(sources)} sources "
+        f"on {workers} processes ({summary['skipped']} already loaded)"
+    )
+
+    running = {}
+    in_flight = {source: 0 for source in sources}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        def submit():
+            progressed = True
+            while progressed and len(running) < workers:
+                progressed = False
+                for source in sources:
+                    if len(running) >= workers:
+                        break
+                    if queues[source] and in_flight[source] < caps[source]:
+                        info = queues[source].popleft()
+                        future = executor.submit(run_chunk, source, info, save_dir, options)
+                        running[future] = (source, info)
+                        in_flight[source] += 1
+                        progressed = True
+
+        submit()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, info = running.pop(future)
+                in_flight[source] -= 1
+                summary["chunks"] += 1
+                window = f"{source} {info['start_time']} - {info['end_time']}"
+                try:
+                    failed, counts = future.result()
+                    error = f"{failed} windows failed" if failed else None
+                    if counts and not failed:
+                        dedup_counts[source].update(counts)
+                except Exception as e:
+                    error = f"{type(e).__name__} - {e}"
+                if error:
+                    key = (source, info["start_time"])
+                    attempts[key] = attempts.get(key, 0) + 1
+                    if attempts[key] <= retries:
+                        logger.warning(f"{window}: {error}, retrying after the other chunks")
+                        queues[source].append(info)
+                        summary["retried"] += 1
+                    else:
+                        logger.error(f"{window}: {error}, not checkpointing")
+                        summary["failed"] += 1
+                elif store:
+                    store.commit(source, info["url"], info["start_time"], info["end_time"])
+            submit()
+    if temporary:
+        temporary.cleanup()
+    if options.get("dedup") or options.get("dedup_dir"):
+        for source in sources:
+            logger.info(dedup_report(source, dedup_counts[source]))
+            summary["duplicates"] += dedup_counts[source]["run"] + dedup_counts[source]["earlier"]
+    return summary
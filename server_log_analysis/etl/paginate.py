@@ -0,0 +1,120 @@
+from copy import deepcopy
+from typing import Any, Dict, Iterator, List, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from loguru import logger
+
+from server_log_analysis.etl.client import get_session
+from server_log_analysis.etl.decode import loads_search
+from server_log_analysis.etl.source_filter import FILTER_PATH
+
+
+def split_search_url(url: str) -> Tuple[str, str]:
+    """Split ``https://host:5200/kong-access-*/_search`` into its base URL and index."""
+    parts = urlsplit(url)
+    index = parts.path.strip("/").rsplit("/_search", 1)[0]
+    return f"{parts.scheme}://{parts.netloc}", index
+
+
+def open_pit(url: str, headers: Dict[str, str], keep_alive: str, timeout: int = 15) -> str:
+    base, index = split_search_url(url)
+    response = get_session().post(
+        f"{base}/{index}/_pit", params={"keep_alive": keep_alive}, headers=headers, timeout=timeout
+    )
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def close_pit(url: str, headers: Dict[str, str], pit_id: str, timeout: int = 15):
+    base, _ = split_search_url(url)
+    try:
+        get_session().delete(f"{base}/_pit", headers=headers, json={"id": pit_id}, timeout=timeout)
+    except requests.RequestException as e:
+        logger.warning(f"Could not close point-in-time: {type(e).__name__} - {e}")
+
+
+def iter_pages(
+    url: str,
+    headers: Dict[str, str],
+    body: Dict[str, Any],
+    page_size: int,
+    pit_keep_alive: str = None,
+    timeout: int = 15,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Drain every hit matching ``body`` with ``search_after`` on the ``@timestamp`` sort.
+
+    ``body`` is the extractor's usual ``from``/``size`` query; ``from`` is dropped
+    and each page asks for ``page_size`` hits after the last sort value seen.
+
+    With ``pit_keep_alive`` (e.g. ``"1m"``) the pages are read from a point-in-time
+    and ``_shard_doc`` breaks timestamp ties, so the cursor is exact and stable
+    while new documents are indexed. Without it, the cursor re-reads the last
+    millisecond of each page and drops the ``_id`` values it already yielded, so
+    documents sharing a timestamp across a page boundary are not lost.
+
+    :param url: The extractor's ``<index>/_search`` URL
+    :param headers: Request headers, including the API key
+    :param body: Search body with ``query`` and an ascending ``@timestamp`` sort
+    :param page_size: Hits per page, at most the index ``max_result_window``
+    :param pit_keep_alive: Keep-alive for a point-in-time, or ``None`` to search the index
+    """
+    body = deepcopy(body)
+    body.pop("from", None)
+    body["size"] = page_size
+    body["track_total_hits"] = False
+    source = body.get("_source")
+    includes = source.get("includes") if isinstance(source, dict) else None
+
+    search_url = url
+    pit_id = None
+    if pit_keep_alive:
+        pit_id = open_pit(url, headers, pit_keep_alive, timeout)
+        search_url = split_search_url(url)[0] + "/_search"
+        body["sort"] = body["sort"] + [{"_shard_doc": "asc"}]
+
+    boundary_ids, boundary_sort = set(), None
+    try:
+        while True:
+            if pit_id:
+                body["pit"] = {"id": pit_id, "keep_alive": pit_keep_alive}
+            response = get_session().get(
+                search_url,
+                headers=headers,
+                params={"filter_path": FILTER_PATH},
+                json=body,
+                timeout=timeout,
+            )
+            response.raise_for_status()
+            data = loads_search(response.content, includes)
+            pit_id = data.get("pit_id", pit_id)
+            hits = data.get("hits", {}).get("hits", [])
+            if not hits:
+                return
+
+            if pit_id:
+                yield hits
+                body["search_after"] = hits[-1]["sort"]
+            else:
+                fresh = [hit for hit in hits if hit["_id"] not in boundary_ids]
+                last_sort = hits[-1]["sort"][0]
+                if fresh:
+                    yield fresh
+                    if last_sort != boundary_sort:
+                        boundary_ids, boundary_sort = set(), last_sort
+                    boundary_ids.update(hit["_id"] for hit in fresh if hit["sort"][0] == last_sort)
+                    body["search_after"] = [last_sort - 1]
+                elif len(hits) == page_size:
+                    logger.warning(
+                        f"More than {page_size} documents share @timestamp {last_sort}; "
+                        "use a point-in-time to read all of them"
+                    )
+                    boundary_ids, boundary_sort = set(), None
+                    body["search_after"] = [last_sort]
+
+            if len(hits) < page_size:
+                return
+    finally:
+        if pit_keep_alive and pit_id:
+            close_pit(url, headers, pit_id, timeout)
@@ -0,0 +1,320 @@
+import json
+import operator
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from server_log_analysis.etl.schema import DTYPES, Schema
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional, pip install pyarrow
+    pa = ds = pq = None
+
+ROW_GROUP_SIZE = 100_000
+COMPRESSION = "zstd"
+# Partition keys below the dataset root, e.g. source=traces-apm/date=2025-01-02/hour=07
+PARTITIONS = ("source", "date", "hour")
+
+Partition = Tuple[str, str]
+# A column predicate as (column, operator, value), e.g. ("status", ">=", 400)
+Predicate = Tuple[str, str, Any]
+
+OPERATORS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# Arrow type of each Schema dtype, built on use since pyarrow is optional
+_ARROW_TYPES = {
+    "str": lambda: pa.string(),
+    "int": lambda: pa.int64(),
+    "float": lambda: pa.float64(),
+}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The Parquet sink needs `pip install pyarrow`")
+
+
+def _tmp_path(path: str) -> str:
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.tmp")
+
+
+def partition_of(ms: int) -> Partition:
+    """``(date, hour)`` partition values of an epoch-millisecond time, in UTC."""
+    iso = format_iso_ms(ms)
+    return iso[:10], iso[11:13]
+
+
+def _parse_or_none(parse_time: Callable[[str], int]) -> Callable[[Any], int]:
+    def time_ms(value):
+        try:
+            return parse_time(value)
+        except (TypeError, ValueError):
+            return None
+
+    return time_ms
+
+
+def _to_str(value: Any) -> str:
+    """A string cell as the CSV holds it, nested values as JSON."""
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+
+def _to_number(dtype: str) -> Callable[[Any], Any]:
+    convert = DTYPES[dtype]
+
+    def to_number(value):
+        try:
+            return None if value is None else convert(value)
+        except (TypeError, ValueError):  # e.g. an "N/A" or {} default
+            return None
+
+    return to_number
+
+
+class ParquetSink:
+    """
+    Transformed records written as a Parquet dataset partitioned by source,
+    date and hour, for readers that only need some columns of some hours.
+
+    Each record goes to the UTC hour of its ``time_column``, or of ``default_ms``
+    (the window start) for sources without one. Partitions are buffered and
+    written ``row_group_size`` rows at a time, sorted by time, so the min/max
+    statistics of the time column let readers skip whole row groups. Strings
+    are dictionary-encoded and pages zstd-compressed. Columns are typed from the
+    schema's ``dtype``s; the time column is written as ``timestamp[ms, UTC]``.
+
+    Every partition gets one file named ``name``; naming it after the window
+    makes a rerun of the window replace its files instead of adding to them.
+    Files are written under a hidden ``.<name>.tmp`` name, which dataset readers
+    skip, and renamed on ``close``, so a crashed run leaves no partial file.
+
+    :param root: Dataset root directory
+    :param source: Value of the ``source`` partition key
+    :param schema: Schema of the records, whose ``dtypes`` type the columns
+    :param name: File name inside each partition, e.g. ``part-<start>-<end>.parquet``
+    :param time_column: Column holding the record time, if any
+    :param default_ms: Partition time of records without a (valid) time
+    :param row_group_size: Rows buffered per partition before a row group is written
+    :param parse_time: Parses the time column to epoch milliseconds, ISO-8601 by default
+    """
+
+    def __init__(
+        self,
+        root: str,
+        source: str,
+        schema: Schema,
+        name: str,
+        time_column: str = None,
+        default_ms: int = None,
+        row_group_size: int = ROW_GROUP_SIZE,
+        parse_time: Callable[[str], int] = parse_iso_ms,
+    ):
+        _require_pyarrow()
+        self.root = root
+        self.source = source
+        self.name = name
+        self.time_column = time_column
+        self.default_ms = default_ms
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._time_ms = _parse_or_none(parse_time)
+        self._columns = list(schema.columns)
+        self._convert = {
+            column: _to_str if dtype == "str" else _to_number(dtype)
+            for column, dtype in schema.dtypes.items()
+        }
+        fields = [
+            pa.field(
+                column,
+                pa.timestamp("ms", tz="UTC") if column == time_column else _ARROW_TYPES[dtype](),
+            )
+            for column, dtype in schema.dtypes.items()
+        ]
+        self.arrow_schema = pa.schema(fields)
+        self._strings = [
+            column
+            for column, dtype in schema.dtypes.items()
+            if dtype == "str" and column != time_column
+        ]
+        self._buffers: Dict[Partition, List[Tuple[int, Dict[str, Any]]]] = {}
+        self._writers: Dict[Partition, "pq.ParquetWriter"] = {}
+
+    def __enter__(self) -> "ParquetSink":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def path(self, partition: Partition) -> str:
+        date, hour = partition
+        return os.path.join(
+            self.root, f"source={self.source}", f"date={date}", f"hour={hour}", self.name
+        )
+
+    def append(self, records: Iterable[Dict[str, Any]]):
+        for record in records:
+            ms = self._time_ms(record.get(self.time_column)) if self.time_column else None
+            if ms is None:
+                ms = self.default_ms
+            partition = partition_of(ms)
+            buffer = self._buffers.setdefault(partition, [])
+            buffer.append((ms, record))
+            if len(buffer) >= self.row_group_size:
+                self._flush(partition)
+
+    def tap(
+        self, batches: Iterable[List[Any]], to_record: Callable[[Any], Dict[str, Any]] = None
+    ) -> Iterator[List[Any]]:
+        """
+        Pass ``batches`` through, appending each one, and close the sink after the
+        last. If the pipeline fails or stops early the sink is aborted instead.
+
+        :param to_record: Maps one transformed log to its record, if logs are not records
+        """
+        try:
+            for batch in batches:
+                self.append(map(to_record, batch) if to_record else batch)
+                yield batch
+        except BaseException:
+            self.abort()
+            raise
+        self.close()
+
+    def _flush(self, partition: Partition):
+        rows = sorted(self._buffers.pop(partition), key=lambda row: row[0])
+        arrays = []
+        for column in self._columns:
+            if column == self.time_column:
+                values = [self._time_ms(record.get(column)) for _, record in rows]
+            else:
+                convert = self._convert[column]
+                values = [convert(record.get(column)) for _, record in rows]
+            arrays.append(pa.array(values, type=self.arrow_schema.field(column).type))
+        writer = self._writers.get(partition)
+        if writer is None:
+            path = self.path(partition)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            writer = self._writers[partition] = pq.ParquetWriter(
+                _tmp_path(path),
+                self.arrow_schema,
+                compression=COMPRESSION,
+                use_dictionary=self._strings,
+                write_statistics=True,
+            )
+        writer.write_table(
+            pa.Table.from_arrays(arrays, schema=self.arrow_schema),
+            row_group_size=self.row_group_size,
+        )
+        self.rows += len(rows)
+
+    def close(self):
+        """Write what is buffered and finish every partition file."""
+        for partition in list(self._buffers):
+            self._flush(partition)
+        for partition, writer in self._writers.items():
+            writer.close()
+            path = self.path(partition)
+            os.replace(_tmp_path(path), path)
+        self._writers.clear()
+
+    def abort(self):
+        """Drop what is buffered and remove the unfinished partition files."""
+        self._buffers.clear()
+        for partition, writer in self._writers.items():
+            writer.close()
+            os.remove(_tmp_path(self.path(partition)))
+        self._writers.clear()
+
+
+def window_sink(
+    root: str,
+    source: str,
+    schema: Schema,
+    info: Dict[str, Any],
+    time_column: str = None,
+    parse_time: Callable[[str], int] = parse_iso_ms,
+) -> ParquetSink:
+    """
+    The sink of one ``run_window`` chunk: its files are named after the chunk,
+    and records without a time go to the hour the chunk starts in.
+    """
+    start, end = parse_iso_ms(info["start_time"]), parse_iso_ms(info["end_time"])
+    return ParquetSink(
+        root,
+        source,
+        schema,
+        f"part-{start}-{end}.parquet",
+        time_column,
+        start,
+        parse_time=parse_time,
+    )
+
+
+def _hour_filter(start_time: str, end_time: str):
+    """Partition filter keeping the hours that overlap ``[start_time, end_time)``."""
+    date, hour = ds.field("date"), ds.field("hour")
+    expression = None
+    if start_time:
+        first_date, first_hour = partition_of(parse_iso_ms(start_time))
+        expression = (date > first_date) | ((date == first_date) & (hour >= first_hour))
+    if end_time:
+        last_date, last_hour = partition_of(parse_iso_ms(end_time) - 1)
+        before = (date < last_date) | ((date == last_date) & (hour <= last_hour))
+        expression = before if expression is None else expression & before
+    return expression
+
+
+def read_parquet(
+    root: str,
+    source: str,
+    start_time: str = None,
+    end_time: str = None,
+    columns: List[str] = None,
+    time_column: str = None,
+    predicates: List[Predicate] = None,
+):
+    """
+    Read one source of a ``ParquetSink`` dataset into a DataFrame.
+
+    Only partitions of the hours overlapping ``[start_time, end_time)`` are
+    opened, and with ``time_column`` row groups whose time statistics fall
+    outside the range are skipped and the rows themselves filtered.
+
+    :param columns: Columns to read, defaults to all
+    :param time_column: The sink's ``time_column`` for this source, if it has one
+    :param predicates: Column predicates, all of which rows must meet, pushed to the scan
+    """
+    _require_pyarrow()
+    directory = os.path.join(root, f"source={source}")
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"No Parquet partitions of {source!r} under {root}")
+    partitioning = ds.partitioning(
+        pa.schema([(key, pa.string()) for key in PARTITIONS[1:]]), flavor="hive"
+    )
+    dataset = ds.dataset(directory, format="parquet", partitioning=partitioning)
+    filters = [_hour_filter(start_time, end_time)]
+    if time_column:
+        time, unit = ds.field(time_column), pa.timestamp("ms", tz="UTC")
+        if start_time:
+            filters.append(time >= pa.scalar(parse_iso_ms(start_time), unit))
+        if end_time:
+            filters.append(time < pa.scalar(parse_iso_ms(end_time), unit))
+    for column, op, value in predicates or []:
+        filters.append(OPERATORS[op](ds.field(column), value))
+    expression = None
+    for condition in filter(lambda condition: condition is not None, filters):
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
@@ -0,0 +1,205 @@
+from types import ModuleType
+from typing import Any, Dict, List
+
+from loguru import logger
+
+from server_log_analysis.etl.checkpoint import WatermarkStore
+from server_log_analysis.etl.dedup import CAPACITY, ERROR_RATE, Deduplicator
+from server_log_analysis.etl.fetch import Window
+from server_log_analysis.etl.rollups import ROLLUP_SOURCES, window_rollup
+from server_log_analysis.etl.sources import extract_class
+from server_log_analysis.etl.templates import (
+    TEMPLATE_SOURCES,
+    TemplateMiner,
+    template_table,
+)
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+from server_log_analysis.etl.transform_pool import TransformPool
+
+
+def run_window(
+    script: ModuleType,
+    info: Dict[str, Any],
+    save_dir: str = "./logs/",
+    *,
+    concurrency: int = None,
+    paginate: bool = False,
+    pit_keep_alive: str = None,
+    adaptive: bool = False,
+    min_step: int = 1,
+    max_step: int = None,
+    stream: bool = False,
+    transform_workers: int = None,
+    transform_chunk: int = 5000,
+    templates: bool = False,
+    parquet_dir: str = None,
+    segment_dir: str = None,
+    dedup: Deduplicator = None,
+    rollup_dir: str = None,
+) -> List[Window]:
+    """
+    Extract, transform and load one ``cut_off`` chunk of an ETL script.
+
+    ``script`` provides ``SOURCE``, its ``Extract*`` class, ``Transform``,
+    ``Load`` and ``window_outputs``, which builds the chunk's Parquet sinks and
+    segment writer. Options are keyword-only, see ``run_etl``.
+
+    :param script: The ETL script module, see ``sources.load_script``
+    :param info: The chunk: url, api_key, start_time, end_time, step and limit
+    :return: The windows that failed
+    """
+    source = script.SOURCE
+    if templates and source not in TEMPLATE_SOURCES:
+        raise ValueError(f"{source} has no messages to mine, see TEMPLATE_SOURCES")
+    if rollup_dir and source not in ROLLUP_SOURCES:
+        raise ValueError(f"{source} keeps no rollups, see ROLLUP_SOURCES")
+
+    extractor = extract_class(script)(**info, source_fields=script.Transform.FIELDS)
+    outputs = script.window_outputs(info, parquet_dir, segment_dir)
+    if templates:
+        outputs["miner"] = TemplateMiner.load(template_table(save_dir, source))
+    if rollup_dir:
+        outputs["rollup"] = window_rollup(rollup_dir, source, info)
+    if dedup:
+        dedup.start(info["start_time"], info["end_time"])
+    pool = TransformPool(source, transform_workers, transform_chunk) if transform_workers else None
+    try:
+        if stream:
+            batches = extractor.iter_log(
+                concurrency, paginate, pit_keep_alive, adaptive, min_step, max_step
+            )
+            batches = dedup.iter_hits(batches) if dedup else batches
+            transform = pool or script.Transform()
+            script.Load(
+                transform.iter_log(batches), info, save_dir=save_dir, stream=True, **outputs
+            )
+        else:
+            if paginate:
+                logs = extractor.get_log_paginated(pit_keep_alive=pit_keep_alive)
+            elif adaptive:
+                logs = extractor.get_log_adaptive(min_step, max_step)
+            elif concurrency:
+                logs = extractor.get_log_async(concurrency)
+            else:
+                logs = extractor.get_log()
+            logs = dedup.filter_hits(logs) if dedup else logs
+            logs = pool.exact_log(logs) if pool else script.Transform(logs=logs).exact_log()
+            script.Load(logs, info, save_dir=save_dir, **outputs)
+    finally:
+        # Also on failure, so a retried chunk does not leave the workers behind
+        if pool:
+            pool.close()
+    if templates:
+        outputs["miner"].save()
+    if dedup:
+        if extractor.failed_windows:
+            dedup.rollback()
+        else:
+            dedup.commit(info["start_time"], info["end_time"])
+    return extractor.failed_windows
+
+
+def run_etl(
+    script: ModuleType,
+    *,
+    url: str,
+    api_key: str = None,
+    start_time: str,
+    end_time: str,
+    step: int,
+    limit: int,
+    cut_off: int,
+    templates: bool = False,
+    dedup: bool = False,
+    dedup_dir: str = None,
+    dedup_error_rate: float = ERROR_RATE,
+    dedup_capacity: int = CAPACITY,
+    checkpoint: str = None,
+    save_dir: str = "./logs/",
+    **options,
+):
+    """
+    Run ``[start_time, end_time]`` of an ETL script chunk by chunk, ``cut_off`` seconds each.
+
+    A chunk with failed windows is retried once after the others. With
+    ``checkpoint``, chunks already loaded are skipped, chunks partly loaded
+    start after the loaded part, and loaded ones are recorded, see
+    ``WatermarkStore``.
+
+    :param step: Window width in milliseconds
+    :param limit: Page size
+    :param cut_off: Chunk length in seconds
+    :param templates: Store messages as template ids and params in the CSV instead
+        (``TEMPLATE_SOURCES``), templates kept in the source's table in ``save_dir``
+    :param dedup: Drop hits whose _id was already fetched in this run
+    :param dedup_dir: Also drop _ids loaded by earlier runs, kept in a Bloom filter here
+    :param dedup_error_rate: False-positive rate of a new ``dedup_dir`` filter
+    :param dedup_capacity: _ids a new ``dedup_dir`` filter generation holds, see ``IdFilter``
+    :param checkpoint: Folder of watermark files
+    :param options: Keyword options of ``run_window``: concurrency (windows in flight, None
+        runs get_log sequentially), paginate and pit_keep_alive (drain each chunk with
+        search_after, ignores step), adaptive, min_step and max_step (size windows from
+        hits.total, in milliseconds), stream (flat memory), transform_workers and
+        transform_chunk (Transform on a process pool), parquet_dir, segment_dir and
+        rollup_dir (extra outputs)
+    """
+    source = script.SOURCE
+    store = WatermarkStore(checkpoint) if checkpoint else None
+    deduplicator = None
+    if dedup or dedup_dir:
+        deduplicator = Deduplicator(source, dedup_dir, dedup_capacity, dedup_error_rate)
+    current_start = parse_iso_ms(start_time)
+    end_ms = parse_iso_ms(end_time)
+    retry_queue = []
+
+    def run(info: Dict[str, Any]) -> List[Window]:
+        return run_window(
+            script, info, save_dir, templates=templates, dedup=deduplicator, **options
+        )
+
+    while current_start < end_ms:
+        current_end = min(current_start + cut_off * 1000, end_ms)
+        new_start_time = format_iso_ms(current_start)
+        new_end_time = format_iso_ms(current_end)
+
+        if store:
+            resume_time = store.resume_start(source, url, new_start_time, new_end_time)
+            if resume_time is None:
+                logger.info(f"{new_start_time} - {new_end_time} already loaded, skipping")
+                current_start += cut_off * 1000
+                continue
+            new_start_time = resume_time
+
+        logger.info(f"Getting logs from {new_start_time} to {new_end_time}")
+
+        info = {
+            "url": url,
+            "api_key": api_key,
+            "start_time": new_start_time,
+            "end_time": new_end_time,
+            "step": step,
+            "limit": limit,
+        }
+        failed_windows = run(info)
+        if failed_windows:
+            logger.warning(
+                f"{len(failed_windows)} windows failed, retrying {new_start_time} - "
+                f"{new_end_time} at the end of the run"
+            )
+            retry_queue.append(info)
+        elif store:
+            store.commit(source, url, new_start_time, new_end_time)
+        current_start += cut_off * 1000
+
+    for info in retry_queue:
+        logger.info(f"Retrying logs from {info['start_time']} to {info['end_time']}")
+        failed_windows = run(info)
+        if failed_windows:
+            logger.error(
+                f"{len(failed_windows)} windows failed again, not checkpointing "
+                f"{info['start_time']} - {info['end_time']}"
+            )
+        elif store:
+            store.commit(source, url, info["start_time"], info["end_time"])
+    if deduplicator:
+        logger.info(deduplicator.report())
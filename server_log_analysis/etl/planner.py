@@ -0,0 +1,96 @@
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from loguru import logger
+
+from server_log_analysis.etl.fetch import count_windows
+from server_log_analysis.etl.timestamps import format_iso_ms, parse_iso_ms
+
+SearchWindow = Callable[[str, str], Tuple[List[Dict[str, Any]], int, int]]
+
+
+class AdaptiveWindowPlanner:
+    """
+    Size each query window from the ``hits.total`` seen on the previous one.
+
+    A window whose total exceeds ``limit`` is halved and asked again, down to
+    ``min_step``. A window with at most ``sparse_ratio * limit`` hits doubles the
+    width of the next one, up to ``max_step``. Quiet periods therefore cost a
+    handful of wide requests and spikes are split until nothing is dropped.
+
+    :param step: Initial window width in milliseconds, as in ``get_log``
+    :param limit: Page size of the search, i.e. the most hits one window can return
+    :param min_step: Narrowest window in milliseconds
+    :param max_step: Widest window in milliseconds, defaults to ``64 * step``
+    :param sparse_ratio: Fraction of ``limit`` under which a window counts as sparse
+    """
+
+    def __init__(
+        self,
+        step: int,
+        limit: int,
+        min_step: int = 1,
+        max_step: int = None,
+        sparse_ratio: float = 0.25,
+    ):
+        self.step = step
+        self.limit = limit
+        self.min_step = max(1, min(min_step, step))
+        self.max_step = max(max_step or 64 * step, step)
+        self.sparse_ratio = sparse_ratio
+        self.requests = 0
+        self.splits = 0
+        self.merges = 0
+        self.fixed_requests = 0
+        self.failed_windows = []
+
+    def run(
+        self, search_window: SearchWindow, start_time: str, end_time: str
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield the hits of each accepted window in timestamp order.
+
+        :param search_window: ``search_window(gte, lte)`` returning ``(logs, total, miss_count)``
+        """
+        self.fixed_requests += count_windows(start_time, end_time, self.step)
+        current = parse_iso_ms(start_time)
+        end_ms = parse_iso_ms(end_time)
+        width = self.step
+        while current < end_ms:
+            window_end = min(current + width, end_ms)
+            self.requests += 1
+            try:
+                logs, length, miss_count = search_window(
+                    format_iso_ms(current), format_iso_ms(window_end)
+                )
+            except Exception as e:
+                logger.warning(f"Window {format_iso_ms(current)} failed: {type(e).__name__} - {e}")
+                self.failed_windows.append((format_iso_ms(current), format_iso_ms(window_end)))
+                current = window_end
+                continue
+
+            if miss_count < 0 and width > self.min_step:
+                width = max(width // 2, self.min_step)
+                self.splits += 1
+                continue
+            if miss_count < 0:
+                logger.warning(
+                    f"Missed {abs(miss_count)} lines in a {width} ms window "
+                    f"at {format_iso_ms(current)}"
+                )
+
+            yield logs
+            current = window_end
+            if length <= self.limit * self.sparse_ratio and width < self.max_step:
+                width = min(width * 2, self.max_step)
+                self.merges += 1
+
+    @property
+    def saved_requests(self) -> int:
+        return self.fixed_requests - self.requests
+
+    def summary(self) -> str:
+        return (
+            f"Adaptive plan: {self.requests} requests instead of {self.fixed_requests} "
+            f"with a fixed {self.step} ms step ({self.saved_requests} saved, "
+            f"{self.splits} splits, {self.merges} merges)"
+        )
@@ -0,0 +1,513 @@
+import csv
+import os
+import re
+import sqlite3
+from itertools import islice
+from typing import Dict, Iterator, List, TextIO
+
+import numpy as np
+import pandas as pd
+
+from server_log_analysis.etl.access_log import KONG_PATTERN
+from server_log_analysis.etl.decode import loads
+from server_log_analysis.etl.parquet_sink import OPERATORS, Predicate, pa, read_parquet
+from server_log_analysis.etl.schema import Schema
+from server_log_analysis.etl.segments import MANIFEST, SegmentStore
+from server_log_analysis.etl.sources import SCRIPTS, load_script
+from server_log_analysis.etl.timestamps import (
+    parse_clf,
+    parse_clf_array,
+    parse_iso_array,
+    parse_iso_ms,
+)
+from server_log_analysis.etl.writer import flatten_row
+
+# Rows read, inserted and written at a time
+CHUNK_ROWS = 100_000
+SQL_TYPES = {"str": "TEXT", "int": "INTEGER", "float": "REAL"}
+
+# Window folder prefix as Load.log_name writes it, and the CSV inside, per source
+FOLDERS = {
+    "kong": ("kong-logs-acesss.", "kong-logs.csv"),
+    "metricbeat": ("metrics-beat-", "metrics-beat-{metricset}.csv"),
+    "traces-apm": ("traces-apm-logs-", "traces-apm-logs.csv"),
+    "logs-apm": ("logs-apm-logs-", "logs-apm.csv"),
+    "metrics-apm": ("metrics-apm-logs-", "metrics-apm-logs.csv"),
+    "metrics-apm-usage-error": (
+        "metrics-apm-usage-error-logs-",
+        "metrics-apm-usage-error-logs.csv",
+    ),
+}
+
+# Message column and txt output per source whose Load can mine templates: a
+# mined CSV holds template_id and params in place of the message column, so
+# rows come from the txt, which keeps the messages
+MINED = {
+    "kong": ("message", "kong-logs.txt"),
+    "logs-apm": ("info", "logs-apm.txt"),
+}
+
+# Records may carry a time a little outside the window they were fetched in,
+# e.g. the access-log time of a line indexed later; folders this close to a
+# queried range are read too
+WINDOW_SLACK_MS = 5 * 60_000
+
+# <start>-<end> at the end of a window folder name,
+# e.g. 2024-12-22_00_00_00_000Z-2024-12-22_00_00_10_000Z
+_TIME = r"(\d{4}-\d{2}-\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{3})Z"
+_WINDOW = re.compile(f"{_TIME}-{_TIME}")
+_PREDICATE = re.compile(r"^\s*((?:\w+\.)?\w+)\s*(>=|<=|!=|=|<|>)\s*(.*?)\s*$")
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_COUNT_STAR = re.compile(r"count\s*\(\s*\*\s*\)", re.IGNORECASE)
+
+
+def parse_predicate(text: str) -> Predicate:
+    """
+    ``status>=400`` or ``kong.path='/api/login'`` as ``(column, operator, value)``,
+    the column qualified by its table if given; unquoted numbers are numbers.
+    """
+    match = _PREDICATE.match(text)
+    if not match:
+        raise ValueError(
+            f"Expected [<table>.]<column><op><value> with op in {list(OPERATORS)}, got {text!r}"
+        )
+    column, op, value = match.groups()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        return column, op, value[1:-1]
+    for number in (int, float):
+        try:
+            return column, op, number(value)
+        except ValueError:
+            pass
+    return column, op, value
+
+
+def _csv_header(path: str) -> List[str]:
+    with open(path, newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def _window_ms(groups: List[str]) -> int:
+    date, hour, minute, second, ms = groups
+    return parse_iso_ms(f"{date}T{hour}:{minute}:{second}.{ms}Z")
+
+
+def _iso(ms: np.ndarray) -> np.ndarray:
+    return np.char.add(np.datetime_as_string(ms.astype("datetime64[ms]"), unit="ms"), "Z")
+
+
+class Table:
+    """
+    One SQL table over the outputs of a source, or of one Metricbeat metricset.
+
+    Rows are read from the first storage that holds the source: the Parquet
+    dataset, the segment store, else the window folders' CSVs. Each is read
+    with the time range, the columns and the predicates pushed down as far as
+    it allows: Parquet prunes hour partitions and row groups and filters in the
+    scan, segments seek to the range, folders are picked by the window in
+    their name and read column by column. What remains is filtered by row.
+
+    The time column holds ISO-8601 UTC text whatever the storage, so
+    ``substr(datetime, 1, 16)`` is the minute. Sources without one only
+    narrow the range to whole windows (or hours, in Parquet).
+
+    :param name: SQL name, e.g. ``traces_apm`` or ``metricbeat_cpu``
+    :param schema: Columns and dtypes of the rows
+    :param access_log: Rows are Kong messages, parsed into ``KONG_PATTERN`` groups
+    """
+
+    def __init__(
+        self,
+        name: str,
+        source: str,
+        schema: Schema,
+        time_column: str = None,
+        csv_name: str = None,
+        parquet_source: str = None,
+        access_log: bool = False,
+    ):
+        self.name = name
+        self.source = source
+        self.schema = schema
+        self.columns = list(schema.columns)
+        self.time_column = time_column
+        self.folder_prefix = FOLDERS[source][0]
+        self.csv_name = csv_name or FOLDERS[source][1]
+        self.parquet_source = parquet_source or source
+        self.access_log = access_log
+
+    def _times_ms(self, values: pd.Series) -> np.ndarray:
+        """Epoch milliseconds of a time column, NaN where missing or invalid."""
+        ms = np.full(len(values), np.nan)
+        present = values.notna().to_numpy() & (values != "N/A").to_numpy()
+        texts = values[present].astype(str).tolist()
+        if self.access_log:
+            parse, parse_array = (lambda text: parse_clf(text)[0]), (
+                lambda texts: parse_clf_array(texts)[0]
+            )
+        else:
+            parse, parse_array = parse_iso_ms, parse_iso_array
+        try:
+            ms[present] = parse_array(texts)
+        except ValueError:
+            ms[present] = [_parse_or_nan(parse, text) for text in texts]
+        return ms
+
+    def _finish(
+        self,
+        frame: pd.DataFrame,
+        columns: List[str],
+        start: int,
+        end: int,
+        predicates: List[Predicate],
+    ) -> pd.DataFrame:
+        """Filter rows by time and predicates, write times as ISO text, keep ``columns``."""
+        frame = frame.reindex(columns=sorted(set(frame.columns) | set(columns)))
+        mask = np.ones(len(frame), dtype=bool)
+        if self.time_column in frame and len(frame):
+            ms = self._times_ms(frame[self.time_column])
+            valid = ~np.isnan(ms)
+            if start is not None:
+                mask &= valid & (ms >= start)
+            if end is not None:
+                mask &= valid & (ms < end)
+            times = frame[self.time_column].astype(object)
+            times[valid] = _iso(ms[valid].astype(np.int64))
+            frame[self.time_column] = times
+        for column in columns:
+            if self.schema.dtypes.get(column, "str") != "str":
+                frame[column] = pd.to_numeric(
+                    frame[column], errors="coerce"
+                )  # as the Parquet sink types them
+        for column, op, value in predicates:
+            values = (
+                frame[column]
+                if isinstance(value, str)
+                else pd.to_numeric(frame[column], errors="coerce")
+            )
+            mask &= OPERATORS[op](values, value).fillna(False).to_numpy(dtype=bool)
+        return frame.loc[mask, columns]
+
+    def _parse_messages(self, messages: pd.Series) -> pd.DataFrame:
+        """Kong messages as their access-log groups, other lines kept as ``message``."""
+        frame = messages.str.extract(KONG_PATTERN)
+        frame["message"] = messages.str.rstrip("\n").where(frame["datetime"].isna())
+        return frame
+
+    def from_parquet(
+        self,
+        root: str,
+        columns: List[str],
+        start_time: str,
+        end_time: str,
+        predicates: List[Predicate],
+    ) -> Iterator[pd.DataFrame]:
+        frame = read_parquet(
+            root, self.parquet_source, start_time, end_time, columns, self.time_column, predicates
+        )
+        if self.time_column in frame:
+            frame[self.time_column] = (
+                frame[self.time_column].dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z"
+            )
+        yield frame
+
+    def from_segments(
+        self,
+        root: str,
+        columns: List[str],
+        start_time: str,
+        end_time: str,
+        predicates: List[Predicate],
+    ) -> Iterator[pd.DataFrame]:
+        start, end = _range_ms(start_time, end_time)
+        route = tuple(self.columns) if self.source == "metricbeat" else None
+        lines = []
+        for _, line in SegmentStore(root, self.source).scan(start_time, end_time):
+            lines.append(line)
+            if len(lines) == CHUNK_ROWS:
+                yield self._finish(
+                    self._segment_frame(lines, route), columns, start, end, predicates
+                )
+                lines = []
+        if lines:
+            yield self._finish(self._segment_frame(lines, route), columns, start, end, predicates)
+
+    def _segment_frame(self, lines: List[bytes], route: tuple) -> pd.DataFrame:
+        if self.access_log:
+            return self._parse_messages(
+                pd.Series([line.decode("utf-8") for line in lines], dtype=object)
+            )
+        records = (loads(line) for line in lines)
+        if route:
+            records = (record for record in records if tuple(record) == route)
+        frame = pd.DataFrame.from_records(
+            [flatten_row(record) for record in records], columns=self.columns
+        )
+        # Text as the window CSVs hold it, e.g. True rather than SQLite's 1
+        for column in self.columns:
+            if self.schema.dtypes[column] == "str":
+                frame[column] = frame[column].map(
+                    lambda value: value if value is None or value != value else str(value)
+                )
+        return frame
+
+    def window_folders(self, logs_dir: str, start: int = None, end: int = None) -> List[str]:
+        """
+        Window folders of the source whose window, widened by ``WINDOW_SLACK_MS``,
+        overlaps ``[start, end)``.
+        """
+        found = []
+        for name in sorted(os.listdir(logs_dir)):
+            window = name.removeprefix(self.folder_prefix)
+            match = name.startswith(self.folder_prefix) and _WINDOW.fullmatch(window)
+            if match:
+                groups = match.groups()
+                first, last = (
+                    _window_ms(groups[:5]) - WINDOW_SLACK_MS,
+                    _window_ms(groups[5:]) + WINDOW_SLACK_MS,
+                )
+                if (end is None or first < end) and (start is None or start <= last):
+                    found.append(os.path.join(logs_dir, name))
+        return found
+
+    def from_folders(
+        self,
+        logs_dir: str,
+        columns: List[str],
+        start_time: str,
+        end_time: str,
+        predicates: List[Predicate],
+    ) -> Iterator[pd.DataFrame]:
+        start, end = _range_ms(start_time, end_time)
+        needed = set(columns) | {column for column, _, _ in predicates}
+        if self.time_column and (start is not None or end is not None):
+            needed.add(self.time_column)
+        read = {"message"} if self.access_log else needed
+        for folder in self.window_folders(logs_dir, start, end):
+            path = os.path.join(folder, self.csv_name)
+            if not os.path.exists(path):
+                continue
+            if self.source in MINED and MINED[self.source][0] not in _csv_header(path):
+                yield from self._txt_frames(
+                    os.path.join(folder, MINED[self.source][1]), columns, start, end, predicates
+                )
+                continue
+            chunks = pd.read_csv(
+                path,
+                usecols=lambda column: column in read,
+                dtype=str,
+                keep_default_na=False,
+                na_values=[""],
+                chunksize=CHUNK_ROWS,
+            )
+            for chunk in chunks:
+                if self.access_log:
+                    chunk = self._parse_messages(chunk["message"])
+                yield self._finish(chunk, columns, start, end, predicates)
+
+    def _txt_frames(
+        self, path: str, columns: List[str], start: int, end: int, predicates: List[Predicate]
+    ) -> Iterator[pd.DataFrame]:
+        """Rows of a window's txt output, whose lines are as the segment store holds them."""
+        with open(path, "rb") as f:
+            while True:
+                lines = list(islice(f, CHUNK_ROWS))
+                if not lines:
+                    return
+                frame = self._segment_frame(lines, None)
+                # Empty text is missing, as read_csv reads the CSV
+                yield self._finish(frame.mask(frame.eq("")), columns, start, end, predicates)
+
+    def frames(
+        self,
+        columns: List[str],
+        start_time: str = None,
+        end_time: str = None,
+        predicates: List[Predicate] = None,
+        logs_dir: str = None,
+        parquet_dir: str = None,
+        segment_dir: str = None,
+    ) -> Iterator[pd.DataFrame]:
+        """Rows of ``[start_time, end_time)`` meeting ``predicates``, as ``columns``, by chunk."""
+        predicates = predicates or []
+        if parquet_dir and os.path.isdir(
+            os.path.join(parquet_dir, f"source={self.parquet_source}")
+        ):
+            return self.from_parquet(parquet_dir, columns, start_time, end_time, predicates)
+        if segment_dir and os.path.exists(os.path.join(segment_dir, self.source, MANIFEST)):
+            return self.from_segments(segment_dir, columns, start_time, end_time, predicates)
+        if logs_dir and os.path.isdir(logs_dir):
+            return self.from_folders(logs_dir, columns, start_time, end_time, predicates)
+        return iter(())
+
+
+def _parse_or_nan(parse, text: str) -> float:
+    try:
+        return parse(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _range_ms(start_time: str, end_time: str):
+    return (
+        parse_iso_ms(start_time) if start_time else None,
+        parse_iso_ms(end_time) if end_time else None,
+    )
+
+
+def tables() -> Dict[str, Table]:
+    """Every queryable table by SQL name, from the six ETL scripts."""
+    found = {}
+    for source in SCRIPTS:
+        transform = load_script(source).Transform
+        name = source.replace("-", "_")
+        if source == "kong":
+            found[name] = Table(
+                name, source, transform.PARQUET_SCHEMA, transform.TIME_COLUMN, access_log=True
+            )
+        elif source == "metricbeat":
+            for metricset, schema in transform.SCHEMAS.items():
+                found[f"{name}_{metricset}"] = Table(
+                    f"{name}_{metricset}",
+                    source,
+                    schema,
+                    transform.TIME_COLUMN,
+                    FOLDERS[source][1].format(metricset=metricset),
+                    f"{source}-{metricset}",
+                )
+        else:
+            found[name] = Table(name, source, transform.SCHEMA, transform.TIME_COLUMN)
+    return found
+
+
+def referenced(sql: str, table: Table) -> List[str]:
+    """Columns of ``table`` the query names, all of them if it selects ``*``."""
+    if "*" in _COUNT_STAR.sub("", sql):
+        return table.columns
+    identifiers = {identifier.lower() for identifier in _IDENTIFIER.findall(sql)}
+    return [column for column in table.columns if column.lower() in identifiers] or table.columns[
+        :1
+    ]
+
+
+def scope_predicates(
+    predicates: List[Predicate], queried: Dict[str, Table]
+) -> Dict[str, List[Predicate]]:
+    """
+    The predicates of each queried table, by SQL name. ``table.column`` goes to
+    its table; a bare column to the one queried table holding it, and is
+    ambiguous if several do.
+    """
+    scoped = {name: [] for name in queried}
+    for column, op, value in predicates:
+        name, _, column = column.rpartition(".")
+        if name:
+            if name not in queried:
+                raise ValueError(f"Table {name!r} in {name}.{column} is not in the query")
+            holders = [name] if column in queried[name].schema.dtypes else []
+        else:
+            holders = [name for name, table in queried.items() if column in table.schema.dtypes]
+        if not holders:
+            raise ValueError(f"No queried table has a column {column!r}")
+        if len(holders) > 1:
+            raise ValueError(f"Column {column!r} is in {holders}, qualify it as <table>.{column}")
+        scoped[holders[0]].append((column, op, value))
+    return scoped
+
+
+def run_query(
+    sql: str,
+    start_time: str = None,
+    end_time: str = None,
+    predicates: List[Predicate] = None,
+    logs_dir: str = None,
+    parquet_dir: str = None,
+    segment_dir: str = None,
+) -> sqlite3.Cursor:
+    """
+    Run ``sql`` on an in-memory SQLite database holding only what it needs.
+
+    Only the tables the query names are loaded, with the columns it names, the
+    rows of ``[start_time, end_time)`` and those meeting their ``predicates``,
+    see ``scope_predicates``, each pushed down to the storage by
+    ``Table.frames``. The query's own WHERE clause is not pushed down: SQLite
+    applies it to the loaded rows. Rows come from the returned cursor as they
+    are fetched.
+
+    :raises ValueError: A predicate names no queried table or column, or is ambiguous
+    """
+    identifiers = {identifier.lower() for identifier in _IDENTIFIER.findall(sql)}
+    queried = {name: table for name, table in tables().items() if name in identifiers}
+    scoped = scope_predicates(predicates or [], queried)
+    connection = sqlite3.connect(":memory:")
+    for name, table in queried.items():
+        columns = referenced(sql, table)
+        usable = scoped[name]
+        definitions = ", ".join(
+            f'"{column}" {SQL_TYPES[table.schema.dtypes[column]]}' for column in columns
+        )
+        connection.execute(f'CREATE TABLE "{name}" ({definitions})')
+        insert = f'INSERT INTO "{name}" VALUES ({", ".join("?" * len(columns))})'
+        for frame in table.frames(
+            columns, start_time, end_time, usable, logs_dir, parquet_dir, segment_dir
+        ):
+            frame = frame.astype(object).where(frame.notna(), None)
+            connection.executemany(insert, frame.itertuples(index=False, name=None))
+    return connection.execute(sql)
+
+
+def write_csv(cursor: sqlite3.Cursor, f: TextIO) -> int:
+    """Stream the query's rows to ``f`` as CSV, with a header; returns the row count."""
+    csv_writer = csv.writer(f)
+    csv_writer.writerow([column[0] for column in cursor.description])
+    count = 0
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows:
+            return count
+        csv_writer.writerows(rows)
+        count += len(rows)
+
+
+def write_arrow(cursor: sqlite3.Cursor, f) -> int:
+    """
+    Stream the query's rows to the binary file ``f`` as an Arrow IPC stream.
+    Column types come from the first chunk of rows; columns with no value in
+    it are strings.
+    """
+    if pa is None:
+        raise ImportError("Arrow output needs `pip install pyarrow`")
+    names = [column[0] for column in cursor.description]
+    writer, count = None, 0
+    while True:
+        rows = cursor.fetchmany(CHUNK_ROWS)
+        if not rows and writer is not None:
+            writer.close()
+            return count
+        values = list(zip(*rows)) if rows else [()] * len(names)
+        if writer is None:
+            arrays = [pa.array(column) for column in values]
+            schema = pa.schema(
+                [
+                    pa.field(name, pa.string() if array.type == pa.null() else array.type)
+                    for name, array in zip(names, arrays)
+                ]
+            )
+            writer = pa.ipc.new_stream(f, schema)
+        arrays = [_to_arrow(column, field.type) for column, field in zip(values, schema)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        count += len(rows)
+
+
+def _to_arrow(values: tuple, type_):
+    """One column of rows as ``type_``; values SQLite typed otherwise become text, or null."""
+    try:
+        return pa.array(values, type=type_)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if pa.types.is_string(type_):
+            return pa.array(
+                [None if value is None else str(value) for value in values], type=type_
+            )
+        return pa.array(
+            [value if isinstance(value, (int, float)) else None for value in values], type=type_
+        )
@@ -0,0 +1,207 @@
+import os
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from server_log_analysis.etl.access_log import KONG_PATTERN
+from server_log_analysis.etl.decode import loads
+from server_log_analysis.etl.segments import MANIFEST, SegmentStore, SegmentWriter
+from server_log_analysis.etl.timestamps import parse_clf, parse_clf_array
+
+# Sources whose run_window maintains rollups
+ROLLUP_SOURCES = ("kong",)
+# Rollup rows are grouped by these, per minute
+DIMENSIONS = ("status_class", "method", "path", "host")
+MEASURES = ("requests", "errors", "bytes_sent")
+# Smaller rollups kept next to the full ones, by the dimensions they keep
+LEVELS = (("status_class", "method"),)
+MINUTE_MS = 60_000
+# Partial aggregates a RollupWriter keeps before merging them
+MERGE_PARTS = 64
+
+
+def parse_access_lines(lines: Iterable[str]) -> pd.DataFrame:
+    """
+    Kong access-log lines as ``ms`` (epoch milliseconds) and their
+    ``KONG_PATTERN`` groups; other lines, and times that do not parse, are dropped.
+    """
+    frame = pd.Series(list(lines), dtype=object).str.extract(KONG_PATTERN)
+    frame = frame[frame["datetime"].notna()]
+    texts = frame["datetime"].tolist()
+    try:
+        ms = parse_clf_array(texts)[0].astype(float)
+    except ValueError:
+        ms = np.array([_clf_or_nan(text) for text in texts], dtype=float)
+    frame = frame.assign(ms=ms)
+    return frame[frame["ms"].notna()].astype({"ms": np.int64})
+
+
+def _clf_or_nan(text: str) -> float:
+    try:
+        return parse_clf(text)[0]
+    except ValueError:
+        return np.nan
+
+
+def rollup_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per-minute request count, error count (status >= 400) and bytes_sent sum of
+    parsed access-log rows, by ``DIMENSIONS``.
+
+    The host is the client's ``remote_address``, as in the Common Log Format,
+    and paths are grouped without their query string.
+
+    :param frame: Rows with ``ms`` and the ``KONG_PATTERN`` groups, see ``parse_access_lines``
+    """
+    status = pd.to_numeric(frame["status"], errors="coerce")
+    bytes_sent = pd.to_numeric(frame["bytes_sent"], errors="coerce").fillna(0)
+    grouped = pd.DataFrame(
+        {
+            "minute": frame["ms"].to_numpy(dtype=np.int64) // MINUTE_MS * MINUTE_MS,
+            "status_class": (status // 100).map(
+                lambda value: "other" if value != value else f"{int(value)}xx"
+            ),
+            "method": frame["method"],
+            "path": frame["path"].str.replace(r"\?.*", "", regex=True),
+            "host": frame["remote_address"],
+            "requests": 1,
+            "errors": (status >= 400).astype(np.int64),
+            "bytes_sent": bytes_sent.astype(np.int64),
+        }
+    )
+    return merge_rollups([grouped])
+
+
+def merge_rollups(
+    parts: List[pd.DataFrame], dimensions: Sequence[str] = DIMENSIONS
+) -> pd.DataFrame:
+    """Sum rollup rows of the same minute and ``dimensions``, in minute order."""
+    if not parts:
+        return pd.DataFrame(columns=["minute", *dimensions, *MEASURES])
+    frame = pd.concat(parts, ignore_index=True)
+    return frame.groupby(["minute", *dimensions], sort=True, as_index=False)[list(MEASURES)].sum()
+
+
+def rollup_store_name(source: str, dimensions: Sequence[str]) -> str:
+    """
+    The store of one rollup level: ``kong`` for ``DIMENSIONS``, else e.g.
+    ``kong-by-status_class-method``.
+    """
+    return source if tuple(dimensions) == DIMENSIONS else "-".join([source, "by", *dimensions])
+
+
+class RollupWriter(SegmentWriter):
+    """
+    Per-minute rollups of one window's access-log lines, stored on close as the
+    window's segment of a ``SegmentStore``: one NDJSON row per minute and
+    ``DIMENSIONS``, indexed by the minute.
+
+    Each of ``LEVELS`` is stored too, in its own store, summed over the
+    dimensions it leaves out, so that readers needing few dimensions read
+    few rows whatever the number of hosts and paths.
+
+    Rerunning a window replaces its rollups, as it replaces its segment, so
+    the stores stay exact however often windows are loaded. A minute split
+    across two windows has rows in both, summed by ``read_rollups``.
+
+    :param root: Folder holding the rollup stores
+    """
+
+    def __init__(self, root: str, source: str, start_time: str, end_time: str):
+        super().__init__(SegmentStore(root, source), start_time, end_time)
+        self.root = root
+        self.source = source
+        self._parts: List[pd.DataFrame] = []
+
+    def append(self, logs: Iterable[Any]):
+        self._parts.append(rollup_frame(parse_access_lines(map(str, logs))))
+        if len(self._parts) >= MERGE_PARTS:
+            self._parts = [merge_rollups(self._parts)]
+
+    def _add(self, store: SegmentStore, rollups: pd.DataFrame) -> Dict[str, Any]:
+        lines = (
+            rollups.drop(columns="minute")
+            .to_json(orient="records", lines=True)
+            .encode("utf-8")
+            .splitlines(keepends=True)
+        )
+        return store.add(zip(rollups["minute"].tolist(), lines), self.start_time, self.end_time)
+
+    def close(self) -> Dict[str, Any]:
+        """Store the window's rollups, at every level, and return their manifest entry."""
+        try:
+            rollups = merge_rollups(self._parts)
+            for dimensions in LEVELS:
+                store = SegmentStore(self.root, rollup_store_name(self.source, dimensions))
+                self._add(store, merge_rollups([rollups], dimensions))
+            return self._add(self.store, rollups)
+        finally:
+            self.abort()
+
+    def abort(self):
+        super().abort()
+        self._parts = []
+
+
+def window_rollup(root: str, source: str, info: Dict[str, Any]) -> RollupWriter:
+    """The rollup writer of one ``run_window`` chunk, see ``RollupWriter``."""
+    return RollupWriter(root, source, info["start_time"], info["end_time"])
+
+
+def rollup_stores(root: str, source: str) -> List[SegmentStore]:
+    """The existing rollup stores of ``source``, one per level."""
+    names = [rollup_store_name(source, dimensions) for dimensions in (DIMENSIONS, *LEVELS)]
+    return [
+        SegmentStore(root, name)
+        for name in names
+        if os.path.exists(os.path.join(root, name, MANIFEST))
+    ]
+
+
+def coarsen(
+    rollups: pd.DataFrame, freq: str, dimensions: Sequence[str] = DIMENSIONS
+) -> pd.DataFrame:
+    """Sum rollups into ``freq`` buckets of their ``time``, e.g. ``"h"``, by ``dimensions``."""
+    rollups = rollups.assign(time=rollups["time"].dt.floor(freq))
+    return rollups.groupby(["time", *dimensions], sort=True, as_index=False)[list(MEASURES)].sum()
+
+
+def read_rollups(
+    root: str,
+    source: str = "kong",
+    start_time: str = None,
+    end_time: str = None,
+    freq: str = "min",
+    dimensions: Sequence[str] = DIMENSIONS,
+) -> pd.DataFrame:
+    """
+    Rollups of the minutes in ``[start_time, end_time)``, summed per ``freq`` and ``dimensions``.
+
+    Rows are read from the smallest level grouping by all of ``dimensions``,
+    and only those of the range, so the cost follows the length of the range
+    and the number of distinct values of the level's dimensions, not the
+    number of requests.
+
+    :return: ``time`` (UTC, the start of each bucket), ``dimensions`` and ``MEASURES``
+    """
+    columns = ["time", *dimensions, *MEASURES]
+    levels = sorted(
+        (level for level in (*LEVELS, DIMENSIONS) if set(dimensions) <= set(level)), key=len
+    )
+    for level in levels:
+        if os.path.exists(os.path.join(root, rollup_store_name(source, level), MANIFEST)):
+            break
+    else:
+        return pd.DataFrame(columns=columns).astype({"time": "datetime64[ms, UTC]"})
+    minutes, records = [], []
+    for ms, line in SegmentStore(root, rollup_store_name(source, level)).scan(
+        start_time, end_time
+    ):
+        minutes.append(ms)
+        records.append(loads(line))
+    rollups = pd.DataFrame.from_records(records, columns=[*level, *MEASURES])
+    rollups.insert(
+        0, "time", pd.to_datetime(np.array(minutes, dtype=np.int64), unit="ms", utc=True)
+    )
+    return coarsen(rollups, freq, dimensions)[columns]
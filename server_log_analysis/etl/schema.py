@@ -0,0 +1,126 @@
+import ast
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple, Union
+
+# Column types of typed tables and the conversion of each
+DTYPES = {"str": str, "int": int, "float": float}
+
+
+class Field(NamedTuple):
+    """
+    One output column read from a ``_source`` document.
+
+    :param path: Dotted path such as ``"system.memory.total"``, or a tuple of keys
+        when a key itself contains dots, e.g. ``("http.server.duration", "counts")``
+    :param default: Value when the path is missing, as in ``.get(key, default)``
+    :param expr: Python expression of ``value`` (and ``source``) converting the
+        value, e.g. ``"value / 1024**3"``
+    :param dtype: Column type in typed tables, a key of ``DTYPES``
+    """
+
+    path: Union[str, Tuple[str, ...]]
+    default: Any = None
+    expr: str = None
+    dtype: str = None
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        return tuple(self.path.split(".")) if isinstance(self.path, str) else tuple(self.path)
+
+
+class Schema:
+    """
+    Output columns of a Transform, compiled once into a single function.
+
+    ``extract`` (or calling the schema) on a ``_source`` dict returns the row in
+    column order. The generated function looks each shared prefix up once
+    (``transaction`` for all ``transaction.*`` columns) and falls back to the
+    default when a level is missing, like chained ``.get(key, {})`` calls but
+    without allocating an empty dict per level. ``read`` gives a page column by
+    column, each field as read before its ``expr``, for Transforms that convert
+    whole columns at once.
+
+    :param columns: Output column -> ``Field``, in output order
+    :param env: Names the ``expr`` of a field may call
+    """
+
+    def __init__(self, columns: Dict[str, Field], **env: Callable):
+        self.columns = columns
+        # Output column -> dtype, "str" where the field declares none
+        self.dtypes = {column: field.dtype or "str" for column, field in columns.items()}
+        self.source = self._generate()
+        self.extract = self._compile(env)
+        self._read = self._compile(env, self._generate(convert=False), "read")
+
+    @property
+    def fields(self) -> List[str]:
+        """The ``_source.includes`` paths this schema reads."""
+        return sorted({".".join(field.keys) for field in self.columns.values()})
+
+    def __call__(self, source: Dict[str, Any]) -> Dict[str, Any]:
+        return self.extract(source)
+
+    def cast(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        ``row`` with each column converted to its ``dtype``. Values that do not
+        convert, such as an ``"N/A"`` default in a float column, become ``None``.
+        """
+        typed = {}
+        for column, dtype in self.dtypes.items():
+            value = row.get(column)
+            try:
+                typed[column] = None if value is None else DTYPES[dtype](value)
+            except (TypeError, ValueError):
+                typed[column] = None
+        return typed
+
+    def read(self, sources: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+        """Output column -> its values over ``sources`` as read, before the field's ``expr``."""
+        values = zip(*map(self._read, sources)) if sources else ([] for _ in self.columns)
+        return dict(zip(self.columns, map(list, values)))
+
+    def _generate(self, convert: bool = True) -> str:
+        lines = [f"def {'extract' if convert else 'read'}(source, _EMPTY=_EMPTY):"]
+        names = {(): "source"}
+        self._constants = {}
+        row = []
+        for i, (column, field) in enumerate(self.columns.items()):
+            keys = field.keys
+            for depth in range(1, len(keys)):
+                prefix = keys[:depth]
+                if prefix not in names:
+                    name = names[prefix] = f"_{len(names)}"
+                    lines.append(f"    {name} = {names[prefix[:-1]]}.get({prefix[-1]!r}, _EMPTY)")
+            value = f"{names[keys[:-1]]}.get({keys[-1]!r}, {self._literal(field.default)})"
+            if field.expr and convert:
+                lines.append(f"    value = {value}")
+                value = field.expr
+            lines.append(f"    c{i} = {value}")
+            row.append(f"{column!r}: c{i}")
+        if convert:
+            lines.append(f"    return {{{', '.join(row)}}}")
+        else:
+            lines.append(f"    return ({''.join(f'c{i}, ' for i in range(len(row)))})")
+        return "\n".join(lines)
+
+    def _literal(self, value: Any) -> str:
+        """Source for ``value``; literals are rebuilt per call so ``{}``/``[]`` are not shared."""
+        text = repr(value)
+        try:
+            rebuilt = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            rebuilt = None
+        if type(rebuilt) is type(value) and rebuilt == value:
+            return text
+        name = f"_default{len(self._constants)}"
+        self._constants[name] = value
+        return name
+
+    def _compile(
+        self, env: Dict[str, Callable], source: str = None, name: str = "extract"
+    ) -> Callable[[Dict[str, Any]], Any]:
+        namespace = {"_EMPTY": {}, **self._constants, **env}
+        exec(
+            compile(source or self.source, f"<schema {', '.join(self.columns)}>", "exec"),
+            namespace,
+        )
+        return namespace[name]
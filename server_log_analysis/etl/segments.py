@@ -0,0 +1,363 @@
+import heapq
+import json
+import os
+import struct
+import tempfile
+import uuid
+import warnings
+from array import array
+from bisect import bisect_left
+from operator import itemgetter
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Tuple
+
+from server_log_analysis.etl.checkpoint import merge_windows
+from server_log_analysis.etl.decode import dumps_line
+from server_log_analysis.etl.timestamps import normalize_iso, parse_iso_ms
+from server_log_analysis.etl.writer import BUFFER_SIZE, atomic_open, file_lock
+
+MANIFEST = "manifest.json"
+# Records between two entries of a segment's sparse time index
+INDEX_INTERVAL = 1024
+# Compaction merges neighbouring segments smaller than this into ones about this size
+TARGET_BYTES = 256 * 2**20
+# Rows a SegmentWriter sorts in memory before spilling them to a temporary run
+SPILL_ROWS = 200_000
+
+# Epoch milliseconds and one output line, newline included
+Row = Tuple[int, bytes]
+# Header of a row in a segment file: its time and the byte length of its line,
+# so lines may hold any bytes, newlines included
+_HEADER = struct.Struct("<qI")
+
+_by_time = itemgetter(0)
+
+
+def _pack(row: Row) -> bytes:
+    ms, line = row
+    return _HEADER.pack(ms, len(line)) + line
+
+
+def _iter_rows(f: BinaryIO, stop: int = None) -> Iterator[Row]:
+    """Rows of a segment file from its current position up to byte ``stop``."""
+    position = f.tell()
+    while stop is None or position < stop:
+        header = f.read(_HEADER.size)
+        if not header:
+            return
+        ms, size = _HEADER.unpack(header)
+        yield ms, f.read(size)
+        position += _HEADER.size + size
+
+
+def _write_segment(
+    path: str, rows: Iterable[Row], interval: int = INDEX_INTERVAL
+) -> Dict[str, Any]:
+    """
+    Write time-sorted ``rows`` to ``path``, each line behind its ``_HEADER``,
+    and every ``interval``-th row's time and byte offset to ``path.idx``.
+    """
+    index = array("q")
+    first = last = None
+    records = offset = 0
+    with atomic_open(path, mode="wb") as f:
+        for ms, line in rows:
+            if records % interval == 0:
+                index.extend((ms, offset))
+            entry = _pack((ms, line))
+            f.write(entry)
+            offset += len(entry)
+            if first is None:
+                first = ms
+            last = ms
+            records += 1
+    with atomic_open(path + ".idx", mode="wb") as f:
+        index.tofile(f)
+    return {"first": first, "last": last, "records": records, "bytes": offset}
+
+
+class SegmentStore:
+    """
+    Append-only store of one source's transformed logs, queried by time range.
+
+    Each loaded window becomes one segment under ``root/<source>``: its output
+    lines sorted by record time, each prefixed with that time in epoch
+    milliseconds and its length, next to a sparse index holding the time and
+    byte offset of every ``INDEX_INTERVAL``-th line. ``manifest.json`` lists
+    the segments with the windows they cover and their first and last record
+    time, so a range query opens only the segments that overlap it and seeks
+    straight to the block where the range starts.
+
+    Rerunning a window replaces its segment. ``compact`` merges runs of small
+    segments into large ones; a window compacted that way is kept as it is.
+    Segment files are written atomically before the manifest names them, and
+    the manifest is updated under a file lock, so chunks of a source may be
+    loaded by several processes at once (on POSIX).
+
+    :param root: Folder holding one store per source
+    :param source: Source name, the store's folder below ``root``
+    """
+
+    def __init__(self, root: str, source: str):
+        self.source = source
+        self.directory = os.path.join(root, source)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name + ".seg")
+
+    def _locked(self):
+        return file_lock(os.path.join(self.directory, ".lock"))
+
+    def manifest(self) -> List[Dict[str, Any]]:
+        """The segments, ordered by the start of their first window."""
+        path = os.path.join(self.directory, MANIFEST)
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["segments"]
+
+    def _save(self, segments: List[Dict[str, Any]]):
+        segments = sorted(segments, key=lambda segment: segment["windows"][0])
+        with atomic_open(os.path.join(self.directory, MANIFEST)) as f:
+            json.dump({"source": self.source, "segments": segments}, f, indent=2)
+
+    def _remove(self, segments: Iterable[Dict[str, Any]]):
+        for segment in segments:
+            for path in (self.path(segment["name"]), self.path(segment["name"]) + ".idx"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _write(self, rows: Iterable[Row], windows: List[List[str]]) -> Dict[str, Any]:
+        """Write a segment file that no manifest names yet."""
+        start, end = parse_iso_ms(windows[0][0]), parse_iso_ms(windows[-1][1])
+        name = f"{start}-{end}.{uuid.uuid4().hex[:8]}"
+        return {"name": name, "windows": windows, **_write_segment(self.path(name), rows)}
+
+    def add(self, rows: Iterable[Row], start_time: str, end_time: str) -> Dict[str, Any]:
+        """
+        Append time-sorted ``rows`` as the segment of window ``[start_time, end_time]``.
+
+        :return: The new manifest entry, None if the window was already compacted
+        """
+        window = [normalize_iso(start_time), normalize_iso(end_time)]
+        segment = self._write(rows, [window])
+        with self._locked():
+            segments = self.manifest()
+            replaced = [old for old in segments if old["windows"] == [window]]
+            kept = [old for old in segments if old["windows"] != [window]]
+            if any(
+                done_start <= window[0] and window[1] <= done_end
+                for old in kept
+                for done_start, done_end in old["windows"]
+            ):
+                warnings.warn(
+                    f"{self.source} window {window} is already compacted, keeping the stored logs"
+                )
+                replaced, segment = [segment], None
+            else:
+                self._save(kept + [segment])
+        self._remove(replaced)
+        return segment
+
+    def _index(self, name: str) -> array:
+        index = array("q")
+        with open(self.path(name) + ".idx", "rb") as f:
+            index.frombytes(f.read())
+        return index
+
+    def _scan(self, segment: Dict[str, Any], start: int = None, end: int = None) -> Iterator[Row]:
+        """Rows of one segment with ``start <= time < end``, from the block ``start`` falls in."""
+        index = self._index(segment["name"])
+        times, offsets = index[0::2], index[1::2]
+        begin, stop = 0, None
+        if start is not None:
+            block = bisect_left(times, start)
+            begin = offsets[block - 1] if block else 0
+        if end is not None:
+            block = bisect_left(times, end)
+            stop = offsets[block] if block < len(offsets) else None
+        with open(self.path(segment["name"]), "rb", buffering=BUFFER_SIZE) as f:
+            f.seek(begin)
+            for ms, line in _iter_rows(f, stop):
+                if start is not None and ms < start:
+                    continue
+                if end is not None and ms >= end:
+                    return
+                yield ms, line
+
+    def scan(self, start_time: str = None, end_time: str = None) -> Iterator[Row]:
+        """``(ms, line)`` of every record timed in ``[start_time, end_time)``, in time order."""
+        start = parse_iso_ms(start_time) if start_time else None
+        end = parse_iso_ms(end_time) if end_time else None
+        segments = [
+            segment
+            for segment in self.manifest()
+            if segment["records"]
+            and (start is None or segment["last"] >= start)
+            and (end is None or segment["first"] < end)
+        ]
+        return heapq.merge(
+            *(self._scan(segment, start, end) for segment in segments), key=_by_time
+        )
+
+    def read(self, start_time: str = None, end_time: str = None) -> Iterator[str]:
+        """The output lines of ``[start_time, end_time)``, as the window's txt file holds them."""
+        for _, line in self.scan(start_time, end_time):
+            yield line.decode("utf-8")
+
+    def compact(self, target_bytes: int = TARGET_BYTES) -> int:
+        """
+        Merge runs of neighbouring segments smaller than ``target_bytes`` into
+        segments of about that size. Windows loaded meanwhile are left alone; a
+        run that changed while it was merged is skipped.
+
+        :return: Number of segments merged into larger ones
+        """
+        runs, run, size = [], [], 0
+        for segment in self.manifest():
+            if segment["bytes"] >= target_bytes:
+                runs.append(run)
+                run, size = [], 0
+                continue
+            run.append(segment)
+            size += segment["bytes"]
+            if size >= target_bytes:
+                runs.append(run)
+                run, size = [], 0
+        runs.append(run)
+
+        merged = 0
+        for run in filter(lambda run: len(run) > 1, runs):
+            windows = merge_windows(
+                [list(window) for segment in run for window in segment["windows"]]
+            )
+            segment = self._write(heapq.merge(*map(self._scan, run), key=_by_time), windows)
+            names = {old["name"] for old in run}
+            with self._locked():
+                segments = self.manifest()
+                current = names <= {old["name"] for old in segments}
+                if current:
+                    self._save([old for old in segments if old["name"] not in names] + [segment])
+            self._remove(run if current else [segment])
+            merged += len(run) if current else 0
+        return merged
+
+
+def record_time(
+    time_column: str = None,
+    parse_time: Callable[[str], int] = parse_iso_ms,
+    to_record: Callable[[Any], Dict[str, Any]] = None,
+) -> Callable[[Any], int]:
+    """
+    Epoch milliseconds of one transformed log's ``time_column``, None without one.
+
+    :param to_record: Maps one transformed log to its record, if logs are not records
+    """
+
+    def time_ms(log):
+        if time_column is None:
+            return None
+        record = to_record(log) if to_record else log
+        try:
+            return parse_time(record.get(time_column))
+        except (TypeError, ValueError):
+            return None
+
+    return time_ms
+
+
+class SegmentWriter:
+    """
+    The logs of one window, appended to a ``SegmentStore`` as one segment on close.
+
+    Logs without a (valid) time are stored at the window start. Rows are sorted
+    in memory and every ``spill_rows`` spilled to a temporary run next to the
+    store, the runs merged on close, so streamed windows keep flat memory.
+
+    :param to_line: Maps one transformed log to its output line, as Load writes it
+    :param time_ms: Maps one transformed log to its time, see ``record_time``
+    """
+
+    def __init__(
+        self,
+        store: SegmentStore,
+        start_time: str,
+        end_time: str,
+        to_line: Callable[[Any], str] = dumps_line,
+        time_ms: Callable[[Any], int] = None,
+        spill_rows: int = SPILL_ROWS,
+    ):
+        self.store = store
+        self.start_time = start_time
+        self.end_time = end_time
+        self.to_line = to_line
+        self.time_ms = time_ms or record_time()
+        self.spill_rows = spill_rows
+        self.default_ms = parse_iso_ms(start_time)
+        self._rows: List[Row] = []
+        self._runs: List[BinaryIO] = []
+
+    def append(self, logs: Iterable[Any]):
+        for log in logs:
+            ms = self.time_ms(log)
+            self._rows.append(
+                (self.default_ms if ms is None else ms, self.to_line(log).encode("utf-8"))
+            )
+        if len(self._rows) >= self.spill_rows:
+            self._spill()
+
+    def _spill(self):
+        self._rows.sort(key=_by_time)
+        run = tempfile.TemporaryFile(dir=self.store.directory)
+        run.writelines(map(_pack, self._rows))
+        run.seek(0)
+        self._runs.append(run)
+        self._rows = []
+
+    def tap(self, batches: Iterable[List[Any]]) -> Iterator[List[Any]]:
+        """
+        Pass ``batches`` through, appending each one, and close the writer after
+        the last. If the pipeline fails or stops early nothing is stored.
+        """
+        try:
+            for batch in batches:
+                self.append(batch)
+                yield batch
+        except BaseException:
+            self.abort()
+            raise
+        self.close()
+
+    def close(self) -> Dict[str, Any]:
+        """Store the window as a segment and return its manifest entry."""
+        self._rows.sort(key=_by_time)
+        try:
+            rows = heapq.merge(*map(_iter_rows, self._runs), self._rows, key=_by_time)
+            return self.store.add(rows, self.start_time, self.end_time)
+        finally:
+            self.abort()
+
+    def abort(self):
+        """Drop the buffered rows and temporary runs."""
+        for run in self._runs:
+            run.close()
+        self._runs, self._rows = [], []
+
+
+def window_segment(
+    root: str,
+    source: str,
+    info: Dict[str, Any],
+    time_column: str = None,
+    parse_time: Callable[[str], int] = parse_iso_ms,
+    to_line: Callable[[Any], str] = dumps_line,
+    to_record: Callable[[Any], Dict[str, Any]] = None,
+) -> SegmentWriter:
+    """The segment writer of one ``run_window`` chunk, see ``SegmentWriter``."""
+    return SegmentWriter(
+        SegmentStore(root, source),
+        info["start_time"],
+        info["end_time"],
+        to_line,
+        record_time(time_column, parse_time, to_record),
+    )
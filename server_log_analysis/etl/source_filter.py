@@ -0,0 +1,86 @@
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple
+
+# Response keys the extractors read: totals for the miss check, _id for dedup and
+# pagination, the filtered _source, the sort cursor and the point-in-time id.
+FILTER_PATH = "hits.total,hits.hits._id,hits.hits._source,hits.hits.sort,pit_id"
+
+
+def source_includes(fields: Iterable[str]) -> List[str]:
+    """``_source.includes`` for a Transform's ``FIELDS``, plus ``@timestamp`` for checkpoints."""
+    return sorted({"@timestamp", *fields})
+
+
+def filter_source(source: Dict[str, Any], includes: Iterable[str]) -> Dict[str, Any]:
+    """
+    Keep only the ``includes`` paths of a ``_source`` document, like Elasticsearch does.
+
+    Paths are dotted and match both nested objects (``{"host": {"name": ..}}``)
+    and keys that contain dots themselves (``{"jvm.memory.used": ..}``).
+    """
+    return _project(source, compile_includes(tuple(includes)))
+
+
+@lru_cache(maxsize=64)
+def compile_includes(includes: Tuple[str, ...]) -> Dict[str, Any]:
+    """Trie of the dotted ``includes`` paths; ``True`` marks a path kept whole."""
+    trie = {}
+    for include in includes:
+        *parents, last = include.split(".")
+        node = trie
+        for part in parents:
+            node = node.setdefault(part, {})
+            if node is True:
+                break
+        else:
+            node[last] = True
+    return trie
+
+
+def _project(source: Dict[str, Any], trie: Dict[str, Any]) -> Dict[str, Any]:
+    result = {}
+    for key, value in source.items():
+        node = trie.get(key) if "." not in key else _walk(trie, key)
+        if node is True:
+            result[key] = value
+        elif node is not None and isinstance(value, dict):
+            nested = _project(value, node)
+            if nested:
+                result[key] = nested
+    return result
+
+
+def _walk(trie: Dict[str, Any], key: str) -> Any:
+    node = trie
+    for part in key.split("."):
+        node = node.get(part)
+        if node is None or node is True:
+            return node
+    return node
+
+
+_MISSING = object()
+
+
+def apply_filter_path(data: Any, filter_path: str = FILTER_PATH) -> Dict[str, Any]:
+    """Reduce a search response to the comma-separated dotted ``filter_path`` keys."""
+    result = _filter_path(data, [path.split(".") for path in filter_path.split(",")])
+    return {} if result is _MISSING else result
+
+
+def _filter_path(value: Any, paths: List[List[str]]) -> Any:
+    if any(not path for path in paths):
+        return value
+    if isinstance(value, list):
+        items = [_filter_path(item, paths) for item in value]
+        return [item for item in items if item is not _MISSING]
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            nested = [path[1:] for path in paths if path[0] == key]
+            if nested:
+                item = _filter_path(item, nested)
+                if item is not _MISSING:
+                    result[key] = item
+        return result or _MISSING
+    return _MISSING
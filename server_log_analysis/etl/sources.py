@@ -0,0 +1,68 @@
+import importlib.util
+import sys
+from pathlib import Path
+from types import ModuleType
+
+from server_log_analysis.config import RAW_DATA_DIR
+
+ETL_DIR = RAW_DATA_DIR / "ETL"
+
+# Source name -> ETL script in data/raw/ETL
+SCRIPTS = {
+    "kong": "ETL_konglog.py",
+    "metricbeat": "ETL_MetricBeat.py",
+    "traces-apm": "ETL_Traces-Apm.py",
+    "logs-apm": "ETL_Logs-Apm.py",
+    "metrics-apm": "ETL_Metrics-Apm.py",
+    "metrics-apm-usage-error": "ETL_Metrics-Apm-Usage-Error.py",
+}
+
+# Index pattern and run_etl settings used by each script's __main__ block
+DEFAULTS = {
+    "kong": {"index": "kong-access-*", "step": 1000, "limit": 6000, "cut_off": 5000},
+    "metricbeat": {"index": "metricbeat-*", "step": 1000, "limit": 6000, "cut_off": 5000},
+    "traces-apm": {"index": "traces-apm-*", "step": 1000, "limit": 6000, "cut_off": 2000},
+    "logs-apm": {"index": "logs-apm-*", "step": 1000, "limit": 5000, "cut_off": 4000},
+    "metrics-apm": {"index": "metric-apm-*", "step": 1000, "limit": 10000, "cut_off": 2000},
+    "metrics-apm-usage-error": {
+        "index": "metrics-apm-*",
+        "step": 1000,
+        "limit": 5000,
+        "cut_off": 2000,
+    },
+}
+
+# Sample _search dump in data/raw/ETL/logs served for each source by the local
+# stand-in; there is no logs-apm dump, its Transform reads trace documents
+SAMPLES = {
+    "kong": "kong-access-.json",
+    "metricbeat": "metricbeat-.json",
+    "traces-apm": "traces-apm.json",
+    "logs-apm": "traces-apm.json",
+    "metrics-apm": "metrics-apm.json",
+    "metrics-apm-usage-error": "metrics-apm.json",
+}
+
+
+def sample_path(source: str) -> Path:
+    return ETL_DIR / "logs" / SAMPLES[source]
+
+
+def load_script(source: str) -> ModuleType:
+    """Import the ETL script of ``source``; the file names are not valid module names."""
+    name = "etl_" + source.replace("-", "_")
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, ETL_DIR / SCRIPTS[source])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
+
+
+def extract_class(module: ModuleType) -> type:
+    """Return the ``Extract*`` class defined by an ETL script."""
+    return next(
+        value
+        for key, value in vars(module).items()
+        if key.startswith("Extract") and isinstance(value, type)
+    )
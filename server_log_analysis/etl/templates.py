@@ -0,0 +1,281 @@
+import csv
+import hashlib
+import os
+import re
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+from server_log_analysis.etl.writer import atomic_open, file_lock
+
+# Sources whose Load mines message templates
+TEMPLATE_SOURCES = ("kong", "logs-apm")
+WILDCARD = "<*>"
+# Columns that replace a mined message column in the window CSV
+EVENT_COLUMNS = ["template_id", "params"]
+# Template table of a source in the save_dir: every template ever given an id
+TEMPLATE_TABLE = "{source}-templates.csv"
+TABLE_COLUMNS = ["template_id", "parent", "template"]
+
+_HAS_DIGIT = re.compile(r"\d")
+
+
+def split_message(message: str) -> List[str]:
+    """
+    Tokens of ``message``, split on single spaces so ``" ".join`` gives it back
+    exactly: runs of spaces leave empty tokens, other whitespace stays in them.
+    """
+    return message.split(" ")
+
+
+def template_id(tokens: List[str]) -> str:
+    """Content id of a template, the same for the same tokens in every process and run."""
+    return hashlib.blake2b(" ".join(tokens).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def rebuild(template: str, params: str) -> str:
+    """The message a row of ``template_id`` and ``params`` was mined from."""
+    values = iter(split_message(params))
+    return " ".join(
+        next(values) if token == WILDCARD else token for token in split_message(template)
+    )
+
+
+class Template:
+    """One message template: its tokens, with ``WILDCARD`` where messages differ."""
+
+    __slots__ = ("id", "tokens", "count", "leaf", "path")
+
+    def __init__(self, tokens: List[str], leaf: List["Template"], path: List[Any]):
+        self.id = template_id(tokens)
+        self.tokens = tokens
+        self.count = 0
+        self.leaf = leaf
+        self.path = path
+
+    @property
+    def text(self) -> str:
+        return " ".join(self.tokens)
+
+    def similarity(self, tokens: List[str]) -> Tuple[float, int]:
+        """Share of positions holding the message's token, then the wildcard count."""
+        same = wildcards = 0
+        for template_token, token in zip(self.tokens, tokens):
+            if template_token == WILDCARD:
+                wildcards += 1
+            elif template_token == token:
+                same += 1
+        return (same / len(tokens) if tokens else 1.0), wildcards
+
+
+class TemplateMiner:
+    """
+    Drain-style online template miner for free-text log messages.
+
+    A message is split on spaces and routed down a fixed-depth prefix tree:
+    first its token count, then its first ``depth - 2`` tokens, where tokens
+    holding a digit, and new tokens past ``max_children`` siblings, share a
+    ``WILDCARD`` branch. The leaf holds the templates of that shape; the most
+    similar one at or above ``similarity`` takes the message, otherwise the
+    message starts a template.
+
+    A template never changes once given: when a message needs more wildcards
+    the template is replaced in its leaf by a generalized one, its child, so the
+    params of every row mined against an id always fill that id's wildcards.
+    Ids hash the template's text, so miners in other processes or runs give the
+    same template the same id with no coordination.
+
+    Memory is bounded by ``max_templates``: past it the least recently matched
+    template is dropped, and the branch down to its leaf with it once the leaf
+    is empty, so the tree holds at most ``depth - 1`` nodes per live template.
+    ``table`` keeps every template given, evicted and replaced ones included;
+    ``load`` starts from a saved table and ``save`` merges the new ones into it.
+
+    :param depth: Tree depth, the token-count level and the leaf included
+    :param similarity: Least share of equal tokens for a message to join a template
+    :param max_children: Branches per tree node before new tokens go to ``WILDCARD``
+    :param max_templates: Templates kept before the least recently matched is evicted
+    """
+
+    def __init__(
+        self,
+        depth: int = 4,
+        similarity: float = 0.4,
+        max_children: int = 100,
+        max_templates: int = 10_000,
+    ):
+        if depth < 3:
+            raise ValueError("depth must be at least 3")
+        self.depth = depth
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.evicted = 0
+        self._root: Dict[int, dict] = {}
+        self._templates: "OrderedDict[str, Template]" = OrderedDict()
+        # id -> (parent id or "", template text), in the order given
+        self.table: Dict[str, Tuple[str, str]] = {}
+        self.path = None
+        self._saved = set()
+
+    @classmethod
+    def load(cls, path: str, **options) -> "TemplateMiner":
+        """
+        A miner saving to ``path``, starting from its table if there is one. The
+        last ``max_templates`` templates no other one replaced go back in the tree.
+        """
+        miner = cls(**options)
+        miner.path = path
+        miner.table = _read_table(path)
+        miner._saved = set(miner.table)
+        parents = {parent for parent, _ in miner.table.values()}
+        current = [text for id, (_, text) in miner.table.items() if id not in parents]
+        keep = miner.max_templates
+        for text in current[-keep:]:
+            tokens = split_message(text)
+            path_keys, leaf = miner._leaf(tokens)
+            miner._insert(Template(tokens, leaf, path_keys))
+        return miner
+
+    def save(self):
+        """
+        Merge the templates given since ``load`` into the table at the miner's
+        path, under a lock held only for the merge.
+        """
+        new = [id for id in self.table if id not in self._saved]
+        if self.path is None or not new:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with file_lock(self.path + ".lock"):
+            table = _read_table(self.path)
+            for id in new:
+                table.setdefault(id, self.table[id])
+            with atomic_open(self.path, newline="") as csvfile:
+                csv_writer = csv.writer(csvfile)
+                csv_writer.writerow(TABLE_COLUMNS)
+                csv_writer.writerows((id, parent, text) for id, (parent, text) in table.items())
+        self._saved.update(new)
+
+    @property
+    def templates(self) -> List[Template]:
+        """Live templates, least recently matched first."""
+        return list(self._templates.values())
+
+    def _leaf(self, tokens: List[str]) -> Tuple[List[Any], List[Template]]:
+        """The keys from the root to the leaf of ``tokens``, and the leaf."""
+        path = [len(tokens)]
+        node = self._root.setdefault(len(tokens), {})
+        for token in tokens[: self.depth - 2]:
+            key = WILDCARD if _HAS_DIGIT.search(token) else token
+            if key not in node and len(node) >= self.max_children:
+                key = WILDCARD
+            path.append(key)
+            node = node.setdefault(key, {})
+        # the leaf's template list is kept under None, which no token maps to
+        return path, node.setdefault(None, [])
+
+    def _insert(self, template: Template) -> Template:
+        """Put ``template`` in its leaf, or return the live one with its id."""
+        if template.id in self._templates:
+            return self._templates[template.id]
+        template.leaf.append(template)
+        self._templates[template.id] = template
+        if len(self._templates) > self.max_templates:
+            self._evict(self._templates.popitem(last=False)[1])
+        return template
+
+    def _evict(self, template: Template):
+        """Drop ``template``, and the nodes down to its leaf that hold nothing else."""
+        template.leaf.remove(template)
+        self.evicted += 1
+        if template.leaf:
+            return
+        nodes = [self._root]
+        for key in template.path:
+            nodes.append(nodes[-1][key])
+        del nodes[-1][None]
+        for node, key, child in zip(nodes[-2::-1], template.path[::-1], nodes[::-1]):
+            if child:
+                break
+            del node[key]
+
+    def add(self, message: str) -> Tuple[str, List[str]]:
+        """
+        Mine ``message`` and return its template id with the parameters, the
+        message tokens at the template's wildcard positions.
+        """
+        tokens = split_message(message)
+        path, leaf = self._leaf(tokens)
+        best, best_score = None, (-1.0, -1)
+        for template in leaf:
+            score = template.similarity(tokens)
+            if score > best_score:
+                best, best_score = template, score
+        if best is not None and best_score[0] >= self.similarity:
+            merged = [
+                template_token if template_token == token else WILDCARD
+                for template_token, token in zip(best.tokens, tokens)
+            ]
+            if merged == best.tokens:
+                self._templates.move_to_end(best.id)
+            else:
+                parent = best
+                del self._templates[parent.id]
+                leaf.remove(parent)
+                best = self._insert(Template(merged, leaf, path))
+                self.table.setdefault(best.id, (parent.id, best.text))
+        else:
+            best = self._insert(Template(tokens, leaf, path))
+            self.table.setdefault(best.id, ("", best.text))
+        best.count += 1
+        return best.id, [
+            token
+            for template_token, token in zip(best.tokens, tokens)
+            if template_token == WILDCARD
+        ]
+
+    def write_templates(self, path: str, counts: Counter):
+        """A window's template counts as CSV: template_id, count, template."""
+        with atomic_open(path, newline="") as csvfile:
+            csv_writer = csv.writer(csvfile)
+            csv_writer.writerow(["template_id", "count", "template"])
+            csv_writer.writerows((id, count, self.table[id][1]) for id, count in counts.items())
+
+
+def _read_table(path: str) -> Dict[str, Tuple[str, str]]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="") as csvfile:
+        return {
+            row["template_id"]: (row["parent"], row["template"]) for row in csv.DictReader(csvfile)
+        }
+
+
+def template_table(save_dir: str, source: str) -> str:
+    """Path of the ``TEMPLATE_TABLE`` of ``source`` in ``save_dir``."""
+    return os.path.join(save_dir, TEMPLATE_TABLE.format(source=source))
+
+
+def event_columns(fieldnames: List[str], column: str) -> List[str]:
+    """``fieldnames`` with the message ``column`` replaced by ``EVENT_COLUMNS``."""
+    return [
+        name for field in fieldnames for name in (EVENT_COLUMNS if field == column else [field])
+    ]
+
+
+def mined_rows(
+    to_row: Callable[[Any], Dict[str, Any]], miner: TemplateMiner, column: str, counts: Counter
+) -> Callable[[Any], Dict[str, Any]]:
+    """
+    ``to_row`` with the message ``column`` mined and replaced by its template id
+    and params, see ``event_columns``; ``counts`` counts the ids. Tokens hold no
+    space, so ``params`` is stored space-joined and ``rebuild`` gives the message.
+    """
+
+    def row(record: Any) -> Dict[str, Any]:
+        row = to_row(record)
+        id, params = miner.add(row.pop(column) or "")
+        row["template_id"], row["params"] = id, " ".join(params)
+        counts[id] += 1
+        return row
+
+    return row
@@ -0,0 +1,170 @@
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Iterable, Tuple
+
+import numpy as np
+
+# The ISO-8601 Zulu layout the extractors send, e.g. 2024-12-14T00:00:00.000Z
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+# event.ingested has no fraction, e.g. 2025-01-02T00:00:13Z
+ISO_SECONDS_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+# nginx/Kong access logs, e.g. 10/Oct/2024:13:55:36 +0700
+CLF_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+EPOCH = datetime(1970, 1, 1)
+UNITS = {"s": 1, "ms": 1000, "us": 10**6}
+MONTHS = {
+    name: f"{number:02d}"
+    for number, name in enumerate(
+        ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], 1
+    )
+}
+
+_ISO = re.compile(r"(\d{4}-\d{2}-\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?Z")
+_CLF = re.compile(r"(\d{2})/([A-Z][a-z]{2})/(\d{4}):(\d{2}:\d{2}:\d{2}) ([+-])(\d{2})(\d{2})")
+
+
+@lru_cache(maxsize=4096)
+def _day_us(date: str) -> int:
+    """Epoch microseconds of midnight UTC on a ``YYYY-MM-DD`` date, ValueError if invalid."""
+    return (datetime.strptime(date, "%Y-%m-%d") - EPOCH) // timedelta(microseconds=1)
+
+
+@lru_cache(maxsize=4096)
+def _day_string(day: int) -> str:
+    return (EPOCH + timedelta(days=day)).strftime("%Y-%m-%d")
+
+
+def _strptime_us(value: str) -> int:
+    """The slow path: whatever ``strptime`` accepts, e.g. unpadded ``2025-1-7T00:00:00.000Z``."""
+    try:
+        dt = datetime.strptime(value, ISO_FORMAT)
+    except ValueError:
+        dt = datetime.strptime(value, ISO_SECONDS_FORMAT)
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+def parse_iso_us(value: str) -> int:
+    """
+    Epoch microseconds of a UTC ``2024-12-14T00:00:00.000Z`` time, with or without a fraction.
+
+    The zero-padded layout is sliced by a regex with the date looked up in a
+    cache; anything else goes through ``strptime``, which raises ValueError on
+    invalid times as before (TypeError for non-strings).
+    """
+    match = _ISO.fullmatch(value)
+    if match is None:
+        return _strptime_us(value)
+    date, hour, minute, second, fraction = match.groups()
+    hour, minute, second = int(hour), int(minute), int(second)
+    if hour > 23 or minute > 59 or second > 59:
+        return _strptime_us(value)
+    micros = int(fraction.ljust(6, "0")) if fraction else 0
+    return _day_us(date) + ((hour * 60 + minute) * 60 + second) * 10**6 + micros
+
+
+def parse_iso_ms(value: str) -> int:
+    """Epoch milliseconds of a UTC ISO-8601 time, see :func:`parse_iso_us`."""
+    return parse_iso_us(value) // 1000
+
+
+def format_iso_ms(ms: int) -> str:
+    """``2024-12-14T00:00:00.000Z`` for epoch milliseconds, as the extractors send times."""
+    day, ms = divmod(ms, 86_400_000)
+    seconds, ms = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{_day_string(day)}T{hours:02d}:{minutes:02d}:{seconds:02d}.{ms:03d}Z"
+
+
+def normalize_iso(value: str) -> str:
+    """Zero-pad a time such as ``2025-1-7T00:00:00.000Z`` so strings compare in time order."""
+    return format_iso_ms(parse_iso_ms(value))
+
+
+def parse_clf(value: str) -> Tuple[int, int]:
+    """
+    Epoch milliseconds and UTC offset in minutes of an access-log time such as
+    ``10/Oct/2024:13:55:36 +0700``; irregular values go through ``strptime``.
+    """
+    match = _CLF.fullmatch(value)
+    if match and match.group(2) in MONTHS:
+        day, month, year, clock, sign, hours, minutes = match.groups()
+        offset = (int(hours) * 60 + int(minutes)) * (-1 if sign == "-" else 1)
+        try:
+            local = parse_iso_us(f"{year}-{MONTHS[month]}-{day}T{clock}Z") // 1000
+            return local - offset * 60_000, offset
+        except ValueError:
+            pass
+    dt = datetime.strptime(value, CLF_FORMAT)
+    offset = dt.utcoffset() // timedelta(minutes=1)
+    return (dt.replace(tzinfo=None) - EPOCH) // timedelta(milliseconds=1) - offset * 60_000, offset
+
+
+def _to_numpy(texts, unit: str) -> np.ndarray:
+    return np.array(texts, dtype=f"datetime64[{unit}]").astype(np.int64)
+
+
+def parse_iso_array(values: Iterable[str], unit: str = "ms") -> np.ndarray:
+    """
+    :func:`parse_iso_us` over a column, as int64 epoch ``unit`` (``s``, ``ms`` or ``us``).
+
+    When every value is zero-padded the column is parsed by NumPy in one call,
+    otherwise value by value, with the same errors as the scalar parser.
+    """
+    values = list(values)
+    if all(map(_ISO.fullmatch, values)):
+        try:
+            return _to_numpy([value[:-1] for value in values], unit)
+        except ValueError:
+            pass
+    scale = 10**6 // UNITS[unit]
+    return np.array([parse_iso_us(value) // scale for value in values], dtype=np.int64)
+
+
+def parse_clf_array(values: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :func:`parse_clf` over a column: int64 epoch milliseconds and int64 UTC offsets in minutes.
+
+    Values in the exact nginx layout are rewritten to ISO and parsed by NumPy
+    in one call, the others one by one.
+    """
+    values = list(values)
+    matches = [_CLF.fullmatch(value) for value in values]
+    if all(match and match.group(2) in MONTHS for match in matches):
+        groups = [match.groups() for match in matches]
+        offsets = np.array(
+            [(int(h) * 60 + int(m)) * (-1 if sign == "-" else 1) for *_, sign, h, m in groups],
+            dtype=np.int64,
+        )
+        try:
+            local = _to_numpy(
+                [f"{y}-{MONTHS[b]}-{d}T{clock}" for d, b, y, clock, *_ in groups], "ms"
+            )
+            return local - offsets * 60_000, offsets
+        except ValueError:
+            pass
+    parsed = [parse_clf(value) for value in values]
+    return (
+        np.array([ms for ms, _ in parsed], dtype=np.int64),
+        np.array([offset for _, offset in parsed], dtype=np.int64),
+    )
+
+
+def clf_to_datetime(column):
+    """
+    A pandas column of access-log times as datetimes in their own UTC offset,
+    the vectorized equivalent of ``.apply(lambda x: datetime.strptime(x, CLF_FORMAT))``.
+    Columns mixing offsets keep ``datetime`` objects, as ``apply`` does.
+    """
+    import pandas as pd
+
+    ms, offsets = parse_clf_array(column)
+    if len(offsets) == 0 or (offsets != offsets[0]).any():
+        return column.apply(lambda value: datetime.strptime(value, CLF_FORMAT))
+    tz = timezone(timedelta(minutes=int(offsets[0])))
+    # microseconds, the resolution pandas gives the datetimes apply returns
+    return pd.Series(
+        pd.to_datetime(ms * 1000, unit="us", utc=True).tz_convert(tz), index=column.index
+    )
@@ -0,0 +1,95 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List
+
+from tqdm import tqdm
+
+from server_log_analysis.etl.decode import loads, orjson
+from server_log_analysis.etl.sources import load_script
+
+_transform = None
+
+
+def pack(logs: List[Dict[str, Any]]) -> bytes:
+    """
+    The ``_source`` of each hit as one JSON array, what a worker is sent instead
+    of the pickled hits: one bytes object is cheaper to pickle and pipe than a
+    tree of small dicts, and ``_id``/``sort`` are not read by any Transform.
+    """
+    sources = [log.get("_source", {}) for log in logs]
+    if orjson is not None:
+        try:
+            return orjson.dumps(sources)
+        except TypeError:  # e.g. integers wider than 64 bits
+            pass
+    return json.dumps(sources).encode()
+
+
+def _init_worker(source: str):
+    global _transform
+    _transform = load_script(source).Transform()
+
+
+def _transform_chunk(payload: bytes) -> List[str]:
+    logs = [{"_source": source} for source in loads(payload)]
+    return next(_transform.iter_log([logs]))
+
+
+class TransformPool:
+    """
+    A source's ``Transform`` run on a pool of worker processes.
+
+    Pages are cut into ``chunk_size`` chunks, each sent to a worker as
+    :func:`pack`-ed bytes and transformed there by ``Transform.iter_log``;
+    results come back in order, so the output is the same as the in-process
+    ``Transform``. At most ``2 * workers`` chunks are in flight, which bounds
+    memory when a streaming ``Load`` consumes slowly.
+
+    :param source: Source name, see ``server_log_analysis.etl.sources.SCRIPTS``
+    :param workers: Processes, defaults to the number of cores
+    :param chunk_size: Hits per chunk sent to a worker
+    """
+
+    def __init__(self, source: str, workers: int = None, chunk_size: int = 5000):
+        self.source = source
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(source,)
+        )
+
+    def __enter__(self) -> "TransformPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+    def _chunks(self, batches: Iterable[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+        for logs in batches:
+            for start in range(0, len(logs), self.chunk_size):
+                end = start + self.chunk_size
+                yield logs[start:end]
+
+    def iter_log(self, batches: Iterable[List[Dict[str, Any]]]) -> Iterator[List[str]]:
+        """Like ``Transform.iter_log``, one list of output records per chunk."""
+        pending = deque()
+        for chunk in self._chunks(batches):
+            pending.append(self._executor.submit(_transform_chunk, pack(chunk)))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def exact_log(self, logs: List[Dict[str, Any]]) -> List[str]:
+        """Like ``Transform(logs).exact_log()``."""
+        lines = []
+        with tqdm(total=len(logs), desc="Transforming") as progress:
+            for chunk in self.iter_log([logs]):
+                lines += chunk
+                progress.update(len(chunk))
+        return lines
@@ -0,0 +1,183 @@
+import csv
+import io
+import json
+import os
+import tempfile
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, TextIO
+
+from tqdm import tqdm
+
+from server_log_analysis.etl.decode import dumps_line
+from server_log_analysis.etl.parquet_sink import ParquetSink
+from server_log_analysis.etl.schema import Schema
+
+try:
+    import fcntl
+except ImportError:  # Windows, callers keep to one writer
+    fcntl = None
+
+
+# Write buffer of each output file, so a batch reaches the OS in a few large writes
+BUFFER_SIZE = 1 << 20
+# mkstemp files are private, the renamed output gets the mode open() would give it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+@contextmanager
+def atomic_open(
+    path: str, newline: str = None, buffering: int = BUFFER_SIZE, mode: str = "w"
+) -> Iterator[TextIO]:
+    """
+    Open ``path`` for writing through a hidden temporary file next to it, renamed
+    over ``path`` once the block exits cleanly and removed if it raises, so a
+    crashed run leaves either the previous file or the complete new one.
+
+    :param mode: ``"w"`` for UTF-8 text, ``"wb"`` for bytes
+    """
+    directory, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory or None)
+    encoding = None if "b" in mode else "utf-8"
+    try:
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        with open(fd, mode, encoding=encoding, newline=newline, buffering=buffering) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive ``flock`` on ``path`` for the block, a no-op without ``fcntl``."""
+    with open(path, "a") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+class _BatchCSV:
+    """A ``csv.DictWriter`` whose rows of a batch are written to its file as one string."""
+
+    def __init__(self, f: TextIO, fieldnames: List[str]):
+        self.file = f
+        self.buffer = io.StringIO()
+        self.writer = csv.DictWriter(self.buffer, fieldnames=fieldnames)
+        self.writer.writeheader()
+        self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer.getvalue())
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+
+def flatten_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    """One transformed record as a CSV row, nested values as JSON."""
+    return {
+        key: (json.dumps(value) if isinstance(value, (dict, list)) else value)
+        for key, value in record.items()
+    }
+
+
+def write_stream(
+    batches: Iterable[List[Any]],
+    txt_path: str,
+    csv_path: str,
+    fieldnames: List[str],
+    to_line: Callable[[Any], str] = dumps_line,
+    to_row: Callable[[Any], Dict[str, Any]] = flatten_row,
+) -> int:
+    """
+    Write transformed batches to the txt and CSV outputs in one pass as they arrive.
+
+    Only one batch is held at a time. Records go from the Transform to both
+    outputs as they are, without a JSON string in between: the txt output is
+    NDJSON, one compact line per record, and the CSV header is the schema's.
+    Each batch is written to each file as one string through a ``BUFFER_SIZE``
+    buffer, and both files are written with ``atomic_open``.
+
+    :param batches: Iterable of lists of transformed records
+    :param txt_path: Path of the text output
+    :param csv_path: Path of the CSV output
+    :param fieldnames: CSV header
+    :param to_line: Maps one record to its line of the txt output
+    :param to_row: Maps one record to a CSV row
+    :return: Number of records written
+    """
+    count = 0
+    with atomic_open(txt_path) as txt, atomic_open(csv_path, newline="") as csvfile:
+        csv_out = _BatchCSV(csvfile, fieldnames)
+        for batch in tqdm(batches, desc="Loading"):
+            txt.write("".join(map(to_line, batch)))
+            csv_out.writer.writerows(map(to_row, batch))
+            csv_out.flush()
+            count += len(batch)
+    return count
+
+
+def write_tables(
+    batches: Iterable[List[Dict[str, Any]]],
+    txt_path: str,
+    tables: Dict[str, Schema],
+    table_path: Callable[[str], str],
+    unmatched: Callable[[Dict[str, Any]], str],
+    sinks: Dict[str, ParquetSink] = None,
+) -> Counter:
+    """
+    Write transformed batches to the txt output and one dense CSV per table.
+
+    A record goes to the table whose schema has exactly its columns, cast to
+    the schema's dtypes, and to the txt output. Records that match no table are
+    left out of both and counted instead, by the name ``unmatched`` gives them.
+    Every table gets its header even when it receives no rows. Files are
+    written as in ``write_stream``.
+
+    :param tables: Table name -> ``Schema`` of its rows
+    :param table_path: Maps a table name to the path of its CSV
+    :param unmatched: Maps a record that matches no table to the name it is counted under
+    :param sinks: Table name -> ``ParquetSink`` also receiving its typed rows, closed at the end
+        or aborted on failure
+    :return: Counts of the records left out, by name
+    """
+    routes = {tuple(schema.columns): (name, schema) for name, schema in tables.items()}
+    skipped = Counter()
+    with ExitStack() as stack:
+        txt = stack.enter_context(atomic_open(txt_path))
+        outputs = {
+            name: _BatchCSV(
+                stack.enter_context(atomic_open(table_path(name), newline="")),
+                list(schema.columns),
+            )
+            for name, schema in tables.items()
+        }
+        sinks = sinks or {}
+        try:
+            for batch in tqdm(batches, desc="Loading"):
+                lines = []
+                for record in batch:
+                    route = routes.get(tuple(record))
+                    if route is None:
+                        skipped[unmatched(record)] += 1
+                        continue
+                    name, schema = route
+                    lines.append(dumps_line(record))
+                    row = schema.cast(record)
+                    outputs[name].writer.writerow(row)
+                    if sinks:
+                        sinks[name].append((row,))
+                txt.write("".join(lines))
+                for output in outputs.values():
+                    output.flush()
+        except BaseException:
+            for sink in sinks.values():
+                sink.abort()
+            raise
+        for sink in sinks.values():
+            sink.close()
+    return skipped
@@ -0,0 +1,81 @@
+import sys
+from pathlib import Path
+from typing import List
+
+import typer
+from loguru import logger
+
+from server_log_analysis.config import RAW_DATA_DIR
+from server_log_analysis.etl.query import (
+    parse_predicate,
+    run_query,
+    write_arrow,
+    write_csv,
+)
+from server_log_analysis.etl.writer import atomic_open
+
+app = typer.Typer()
+
+FORMATS = ("csv", "arrow")
+
+
+@app.command()
+def main(
+    sql: str = typer.Argument(
+        ..., help="e.g. SELECT remote_address, count(*) FROM kong GROUP BY 1"
+    ),
+    start_time: str = typer.Option(
+        None, help="Only rows from this time, e.g. 2024-12-22T00:00:00.000Z"
+    ),
+    end_time: str = typer.Option(None, help="Only rows before this time"),
+    where: List[str] = typer.Option(
+        [],
+        help="Predicate pushed to the storage as [table.]column<op>value, repeatable; "
+        "the SQL's own WHERE is applied after loading",
+    ),
+    logs_dir: Path = RAW_DATA_DIR / "ETL" / "logs",
+    parquet_dir: Path = typer.Option(
+        None, help="Read sources found in this Parquet dataset from it"
+    ),
+    segment_dir: Path = typer.Option(
+        None, help="Read sources found in this segment store from it"
+    ),
+    output: Path = typer.Option(None, help="File to write, defaults to stdout"),
+    format: str = typer.Option("csv", help=f"One of {list(FORMATS)}"),
+):
+    """
+    Run SQL (SQLite dialect) over the extracted outputs of all sources.
+
+    Tables: kong, traces_apm, logs_apm, metrics_apm, metrics_apm_usage_error
+    and metricbeat_<metricset>.
+    """
+    if format not in FORMATS:
+        raise typer.BadParameter(f"Unknown format {format!r}, choose from {list(FORMATS)}")
+    try:
+        predicates = [parse_predicate(text) for text in where]
+        cursor = run_query(
+            sql,
+            start_time,
+            end_time,
+            predicates,
+            logs_dir=str(logs_dir),
+            parquet_dir=str(parquet_dir) if parquet_dir else None,
+            segment_dir=str(segment_dir) if segment_dir else None,
+        )
+    except ValueError as e:
+        raise typer.BadParameter(str(e))
+    write = write_arrow if format == "arrow" else write_csv
+    if not output:
+        write(cursor, sys.stdout.buffer if format == "arrow" else sys.stdout)
+        return
+    with atomic_open(
+        str(output),
+        mode="wb" if format == "arrow" else "w",
+        newline=None if format == "arrow" else "",
+    ) as f:
+        count = write(cursor, f)
+    logger.success(f"Wrote {count} rows to {output}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,38 @@
+from server_log_analysis.etl.segments import SegmentStore, SegmentWriter
+
+START, END = "2024-12-22T00:00:00.000Z", "2024-12-22T00:00:10.000Z"
+# Kong messages are stored as they come, embedded newlines and tabs included
+MESSAGES = [
+    "E1222 00:00:01 first\n  traceback line\n",
+    "plain line\n",
+    "with\ttab and no newline",
+    "",
+]
+
+
+def test_segment_rows_keep_embedded_newlines(tmp_path):
+    store = SegmentStore(str(tmp_path), "kong")
+    # One row per run, so the spilled runs are read back before the segment is written
+    writer = SegmentWriter(
+        store, START, END, to_line=str, time_ms=lambda log: None, spill_rows=1
+    )
+    writer.append(MESSAGES[:2])
+    writer.append(MESSAGES[2:])
+    writer.close()
+
+    assert list(store.read()) == MESSAGES
+    assert list(store.read("2024-12-22T00:00:00.000Z", "2024-12-22T00:00:01.000Z")) == MESSAGES
+    assert list(store.read("2024-12-22T00:00:01.000Z")) == []
+
+
+def test_compaction_keeps_multiline_rows(tmp_path):
+    store = SegmentStore(str(tmp_path), "kong")
+    for second, message in enumerate(MESSAGES):
+        start = f"2024-12-22T00:00:0{second}.000Z"
+        end = f"2024-12-22T00:00:0{second + 1}.000Z"
+        writer = SegmentWriter(store, start, end, to_line=str, time_ms=lambda log: None)
+        writer.append([message])
+        writer.close()
+
+    assert store.compact() == len(MESSAGES)
+    assert list(store.read()) == MESSAGES
@@ -0,0 +1,27 @@
+import json
+
+from server_log_analysis.etl.fake_search import FakeSearchServer
+from server_log_analysis.etl.memory import peak_rss
+from server_log_analysis.etl.sources import sample_path
+
+SOURCE = "traces-apm"
+HITS = 50
+STEP = 100
+# Window lengths in seconds: 1,000 and 16,000 documents
+SECONDS = (2, 32)
+# Peak RSS growth allowed to streaming mode between the smallest and the largest window
+TOLERANCE_MB = 16.0
+
+
+def test_streaming_peak_rss_stays_flat():
+    sample = json.loads(sample_path(SOURCE).read_text())
+    sample["hits"]["hits"] = sample["hits"]["hits"][:HITS]
+    sample["hits"]["total"] = {"value": HITS, "relation": "eq"}
+
+    with FakeSearchServer(json.dumps(sample).encode(), latency=0) as server:
+        stream = [peak_rss(SOURCE, server.url, seconds, STEP, True) for seconds in SECONDS]
+        batch = [peak_rss(SOURCE, server.url, seconds, STEP, False) for seconds in SECONDS]
+
+    assert stream[-1] - stream[0] <= TOLERANCE_MB, f"streaming peak RSS grew: {stream} MB"
+    # The windows are large enough to matter: holding them whole does not stay flat
+    assert batch[-1] - batch[0] > TOLERANCE_MB, f"batch peak RSS did not grow: {batch} MB"